@@ -52,7 +52,9 @@ public class PollingWorker(
         await using var scope = serviceProvider.CreateAsyncScope();
         await using var workerContext = scope.ServiceProvider.GetRequiredService<WorkerContext>();
 
-        var job = await workerContext.Jobs.Where(j => j.State == JobState.Queued)
+        // The other job types (PlaylistEpgGen, PlaylistGuideMatch) are processed by the Python job runner
+        var job = await workerContext.Jobs.Where(j => j.State == JobState.Queued &&
+                (j.Type == JobType.ProviderSync || j.Type == JobType.EpgDataSync))
             .OrderBy(j => j.CreatedAt)
             .FirstOrDefaultAsync(cancellationToken: stoppingToken);
 
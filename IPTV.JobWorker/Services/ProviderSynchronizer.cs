@@ -48,21 +48,28 @@ public class ProviderSynchronizer(
         // Sync streams
         var streamsToAdd = new List<ProviderStream>();
         var streamsToUpdate = new List<ProviderStream>();
+        // (Title, Group) is unique per provider, missing groups are stored as empty strings
+        var seenStreams = new HashSet<(string, string)>();
         foreach (var channel in document.Channels)
         {
             // Skip streams without a title or media URL
             if (string.IsNullOrWhiteSpace(channel.Title) || string.IsNullOrWhiteSpace(channel.MediaUrl))
                 continue;
+
+            // Only the first stream of a title and group is kept (as by the Python ProviderSynchronizer)
+            var group = channel.GroupTitle ?? string.Empty;
+            if (!seenStreams.Add((channel.Title, group)))
+                continue;
             
             // Check if the stream already exists
-            if (existingStreams.TryGetValue((channel.Title, channel.GroupTitle), out var stream))
+            if (existingStreams.TryGetValue((channel.Title, group), out var stream))
             {
                 // Update existing stream
                 stream.Title = channel.Title;
                 stream.TvgId = channel.TvgId;
                 stream.MediaUrl = channel.MediaUrl;
                 stream.LogoUrl = channel.LogoUrl;
-                stream.Group = channel.GroupTitle;
+                stream.Group = group;
                 stream.IsActive = true;
                 stream.UpdatedAt = timeProvider.GetUtcNow().DateTime;
                 
@@ -77,7 +84,7 @@ public class ProviderSynchronizer(
                     TvgId = channel.TvgId,
                     MediaUrl = channel.MediaUrl,
                     LogoUrl = channel.LogoUrl,
-                    Group = channel.GroupTitle,
+                    Group = group,
                     IsActive = true,
                     Provider = provider,
                     CreatedAt = timeProvider.GetUtcNow().DateTime,
@@ -87,8 +94,7 @@ public class ProviderSynchronizer(
         }
         
         // Handle streams that weren't in the m3u file
-        var validStreams = document.Channels.Select(c => (c.Title, (string?)c.GroupTitle)).ToHashSet();
-        var streamsToRemove = streams.Where(s => !validStreams.Contains((s.Title, s.Group))).ToList();
+        var streamsToRemove = streams.Where(s => !seenStreams.Contains((s.Title, s.Group ?? string.Empty))).ToList();
             
         // Save changes
         await workerContext.BulkInsertAsync(streamsToAdd, cancellationToken: cancellationToken);
@@ -4,22 +4,28 @@ const express = require('express');
 const bodyParser = require('body-parser');
 const { exec } = require('child_process');
 const fs = require('fs');
+const os = require('os');
 const path = require('path');
 const xml2js = require('xml2js');
 
 const app = express();
-app.use(bodyParser.text({ type: 'application/xml' }));
-app.use(bodyParser.json());
+// Shared grabs post the channels of several playlists at once
+app.use(bodyParser.text({ type: 'application/xml', limit: '10mb' }));
+app.use(bodyParser.json({ limit: '10mb' }));
 
-app.post('/generate-guide/:id', async (req, res) => {
+let requestCount = 0;
+
+// Grab the guide of the channels posted in the request body to the target path, for the given number of days
+// (default: the DAYS environment variable)
+async function grab(req, res, targetPath, days = process.env.DAYS) {
     try {
-        const channelsXmlPath = path.join(process.cwd(), 'channels.xml');
+        // Each request gets its own channels file, so concurrent grabs do not overwrite each other's channels
+        const channelsXmlPath = path.join(os.tmpdir(), `channels-${process.pid}-${Date.now()}-${requestCount++}.xml`);
         const contentTypeHeader = req.get('Content-Type');
         const contentType = contentTypeHeader != null ? contentTypeHeader.split(';')[0] : null;
-        const { id } = req.params;
 
         // Create directory path if it doesn't exist
-        const dirPath = path.join(process.env.CONFIG_DIR, 'playlists', id);
+        const dirPath = path.dirname(targetPath);
         if (!fs.existsSync(dirPath)) {
             fs.mkdirSync(dirPath, { recursive: true });
         }
@@ -69,12 +75,11 @@ app.post('/generate-guide/:id', async (req, res) => {
         const npmArgsString = Object.keys(npmArgs).map(key => `--${key}=${npmArgs[key]}`).join(' ');
 
         // 'grab' command arguments
-        const targetPath = path.join(dirPath, 'guide.xml');
         const grabArgs = {
             channels: channelsXmlPath,
             output: targetPath,
             maxConnections: process.env.MAX_CONNECTIONS,
-            days: process.env.DAYS,
+            days: days,
             timeout: process.env.TIMEOUT,
         }
         if (process.env.GZIP === 'true') {
@@ -110,6 +115,26 @@ app.post('/generate-guide/:id', async (req, res) => {
         console.error(err);
         res.status(500).json({ success: false, error: err.message });
     }
+}
+
+// Grab the guide of a playlist to CONFIG_DIR/playlists/:id/guide.xml
+app.post('/generate-guide/:id', async (req, res) => {
+    const { id } = req.params;
+    await grab(req, res, path.join(process.env.CONFIG_DIR, 'playlists', id, 'guide.xml'));
+});
+
+// Grab the guide of a set of channels shared by several playlists to CONFIG_DIR/grabs/:name.xml, optionally for
+// ?days=N days from today
+app.post('/grab/:name', async (req, res) => {
+    const { name } = req.params;
+    if (!/^[\w.-]+$/.test(name)) {
+        return res.status(400).json({ success: false, error: `Invalid grab name: ${name}` });
+    }
+    const { days } = req.query;
+    if (days !== undefined && !/^[1-9]\d*$/.test(days)) {
+        return res.status(400).json({ success: false, error: `Invalid number of days: ${days}` });
+    }
+    await grab(req, res, path.join(process.env.CONFIG_DIR, 'grabs', `${name}.xml`), days);
 });
 
 app.listen(3000, () => {
@@ -0,0 +1,70 @@
+"""
+Summary of the guide catalog (entity counts and guide languages).
+
+The reference tables only change during EPG data syncs, so the summary is computed once per completed sync and
+shared by all processes through the config store. It is identified by the date of the sync it was computed after.
+"""
+import logging
+import threading
+
+from job_manager.models import Job, JobState, JobType
+from main.utils import ConfigStore
+from .models import Category, Channel, Country, Guide
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CONFIG_KEY = "guide_manager:catalog"
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def last_sync_date():
+    """
+    Get the date of the last completed EPG data sync, None if there was none.
+    """
+    return Job.objects.filter(
+        type=JobType.EPG_DATA_SYNC,
+        state=JobState.COMPLETED
+    ).order_by('-updated_at').values_list('updated_at', flat=True).first()
+
+
+def get_catalog():
+    """
+    Get the catalog summary, computing it again when an EPG data sync completed since it was computed.
+
+    Returns:
+        dict: The summary, with the guides, channels, countries and categories counts, the guide languages and
+            the date of the last sync (ISO format, None before the first sync).
+    """
+    global _catalog
+
+    synced_at = last_sync_date()
+    version = synced_at.isoformat() if synced_at else None
+
+    with _catalog_lock:
+        if _catalog is not None and _catalog['last_synced'] == version:
+            return _catalog
+
+        catalog = ConfigStore().get(CATALOG_CONFIG_KEY)
+        if catalog is None or catalog.get('last_synced') != version:
+            catalog = refresh_catalog(version)
+        _catalog = catalog
+        return catalog
+
+
+def refresh_catalog(version):
+    """
+    Compute the catalog summary and store it.
+    """
+    catalog = {
+        'guides': Guide.objects.count(),
+        'channels': Channel.objects.count(),
+        'countries': Country.objects.count(),
+        'categories': Category.objects.count(),
+        'languages': list(Guide.objects.order_by('lang').values_list('lang', flat=True).distinct()),
+        'last_synced': version,
+    }
+    ConfigStore().set(CATALOG_CONFIG_KEY, catalog)
+    logger.info(f"Guide catalog summary refreshed (last sync: {version})")
+    return catalog
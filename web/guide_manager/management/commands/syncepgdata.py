@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from guide_manager.sync import DEFAULT_BATCH_SIZE, TABLES, EpgDataSynchronizer
+from job_manager.models import Job, JobState, JobType
+
+
+class Command(BaseCommand):
+    help = ('Synchronize the EPG reference data (countries, categories, channels and guides) with the iptv-org API, '
+            'or with local JSON files.')
+
+    def add_arguments(self, parser):
+        for table in TABLES:
+            parser.add_argument(f'--{table.name}', help=f'URL or file path of the {table.name} JSON source')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Number of rows written per batch')
+        parser.add_argument('--force', action='store_true', help='Sync even if the sources did not change since the last sync')
+
+    def handle(self, *args, **options):
+        active_job = Job.objects.filter(
+            type=JobType.EPG_DATA_SYNC,
+            state__in=[JobState.QUEUED, JobState.IN_PROGRESS]
+        ).first()
+        if active_job:
+            self.stdout.write(self.style.WARNING(f"Skipping: job {active_job.job_id} is already {active_job.state}"))
+            return
+
+        job = Job.objects.create(type=JobType.EPG_DATA_SYNC, state=JobState.QUEUED, max_attempts=1)
+        synchronizer = EpgDataSynchronizer(
+            sources={table.name: options[table.name] for table in TABLES if options[table.name]},
+            batch_size=options['batch_size'],
+            force=options['force']
+        )
+        job = synchronizer.run_job(job.pk)
+        if job is None:
+            self.stdout.write(self.style.WARNING("Skipping: the job was claimed by the job worker"))
+            return
+
+        style = self.style.SUCCESS if job.state == JobState.COMPLETED else self.style.ERROR
+        self.stdout.write(style(f"{job.state} - {job.status_description}"))
@@ -0,0 +1,269 @@
+"""
+In-memory index matching stream titles to guides.
+
+Guides are indexed by the normalized tokens of their site name, channel name and xmltv_id. A lookup only
+scores the guides sharing a token with the title, weighting tokens by rarity, so suggestions are returned in
+milliseconds instead of comparing the title against every guide in the database.
+"""
+import heapq
+import logging
+import math
+import re
+import threading
+import unicodedata
+from typing import NamedTuple, Optional
+
+from job_manager.models import Job, JobState, JobType
+from .models import Guide
+
+logger = logging.getLogger(__name__)
+
+# Tokens describing the stream quality/format rather than the channel
+QUALITY_TAGS = frozenset({
+    'sd', 'hd', 'fhd', 'uhd', 'qhd', 'hq', 'lq', '4k', '8k', 'hdr', 'hevc', 'h264', 'h265', 'raw',
+    '480p', '576p', '720p', '1080i', '1080p', '2160p', '25fps', '50fps', '60fps',
+})
+
+# Country prefix of a stream title, e.g. "US: CNN", "UK | BBC One", "[FR] TF1" or "DE - ZDF"
+COUNTRY_PREFIX_PATTERN = re.compile(r'^\s*(?:[\[(|]\s*([a-z]{2,3})\s*[\])|]\s*[:|-]?|([a-z]{2,3})\s*(?:[:|]|\s-\s))\s*')
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Tokens shared by more guides than this are not used to collect candidates (unless the title has no other
+# token), they still count when scoring the candidates found through rarer tokens
+MAX_CANDIDATE_POSTINGS = 5000
+
+# Score bonuses added to the token overlap (a value between 0 and 1)
+TVG_ID_BONUS = 2.0
+COMPACT_NAME_BONUS = 1.0
+COUNTRY_BONUS = 0.1
+
+
+class NormalizedName(NamedTuple):
+    tokens: frozenset
+    # The tokens joined together, so that "BBC One", "BBCOne" and "BBC.One" are equal
+    compact: str
+    country: Optional[str]
+
+
+def _fold(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return text.replace('&', ' and ').replace('+', ' plus ')
+
+
+def normalize_title(title) -> NormalizedName:
+    """
+    Normalize a stream title or channel name: fold case and accents, split a leading country prefix and strip
+    quality tags.
+    """
+    text = _fold(title or '')
+    country = None
+    match = COUNTRY_PREFIX_PATTERN.match(text)
+    if match:
+        country = match.group(1) or match.group(2)
+        text = text[match.end():]
+
+    tokens = [token for token in TOKEN_PATTERN.findall(text) if token not in QUALITY_TAGS]
+    return NormalizedName(frozenset(tokens), ''.join(tokens), country)
+
+
+def normalize_xmltv_id(xmltv_id) -> NormalizedName:
+    """
+    Normalize an xmltv_id, e.g. "BBCOne.uk@HD" is the name "bbcone" in the country "uk".
+    """
+    text = _fold(xmltv_id or '').split('@', 1)[0]
+    name, _, country = text.rpartition('.')
+    if not name:
+        name, country = country, None
+
+    tokens = TOKEN_PATTERN.findall(name)
+    return NormalizedName(frozenset(tokens), ''.join(tokens), country or None)
+
+
+def _tvg_key(xmltv_id):
+    return (xmltv_id or '').split('@', 1)[0].lower() or None
+
+
+class _Entry(NamedTuple):
+    # The indexed columns, to detect changed guides on refresh
+    signature: tuple
+    tokens: frozenset
+    compacts: frozenset
+    tvg_key: Optional[str]
+    country: Optional[str]
+    lang: str
+
+
+class GuideMatcher:
+    """
+    Token index of the guides, refreshed incrementally after each EPG data sync.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._postings = {}
+        self._compacts = {}
+        self._tvg_ids = {}
+        # Date of the EPG data sync the index was built from, False when it was never built
+        self._version = False
+
+    def match(self, title, tvg_id=None, lang=None, limit=5):
+        """
+        Find the guides best matching a stream.
+
+        Args:
+            title (str): The stream title.
+            tvg_id (str, optional): The stream tvg_id, an exact match with the guide xmltv_id ranks first.
+            lang (str, optional): Only match guides in this language.
+            limit (int): Max number of results.
+
+        Returns:
+            list: (guide ID, score) tuples, best match first.
+        """
+        return self.match_many([(title, tvg_id)], lang=lang, limit=limit)[0]
+
+    def match_many(self, streams, lang=None, limit=1):
+        """
+        Find the guides best matching each of several streams, checking the index freshness once.
+
+        Args:
+            streams (list): (title, tvg_id) tuples.
+            lang (str, optional): Only match guides in this language.
+            limit (int): Max number of results per stream.
+
+        Returns:
+            list: For each stream, (guide ID, score) tuples, best match first.
+        """
+        self.refresh_if_stale()
+
+        with self._lock:
+            return [self._match(normalize_title(title), _tvg_key(tvg_id), lang, limit) for title, tvg_id in streams]
+
+    def _match(self, name, tvg_key, lang, limit):
+        total = len(self._entries) or 1
+        weights = {token: math.log(1 + total / len(self._postings[token]))
+                   for token in name.tokens if token in self._postings}
+
+        # Collect candidates through the rarest tokens
+        candidates = set()
+        tokens = sorted(weights, key=lambda token: len(self._postings[token]))
+        for token in tokens:
+            postings = self._postings[token]
+            if candidates and len(postings) > MAX_CANDIDATE_POSTINGS:
+                break
+            candidates.update(postings)
+        candidates.update(self._compacts.get(name.compact, ()))
+        if tvg_key:
+            candidates.update(self._tvg_ids.get(tvg_key, ()))
+
+        query_weight = sum(weights.values())
+        scored = []
+        for guide_id in candidates:
+            entry = self._entries[guide_id]
+            if lang and entry.lang != lang:
+                continue
+
+            score = self._overlap(weights, query_weight, entry, total)
+            if tvg_key and entry.tvg_key == tvg_key:
+                score += TVG_ID_BONUS
+            if name.compact and name.compact in entry.compacts:
+                score += COMPACT_NAME_BONUS
+            if name.country and name.country == entry.country:
+                score += COUNTRY_BONUS
+            scored.append((score, -guide_id))
+
+        return [(-guide_id, score) for score, guide_id in heapq.nlargest(limit, scored)]
+
+    def _overlap(self, weights, query_weight, entry, total):
+        """
+        Weighted Jaccard similarity of the title and guide tokens.
+        """
+        shared = sum(weight for token, weight in weights.items() if token in entry.tokens)
+        if not shared:
+            return 0.0
+        entry_weight = sum(math.log(1 + total / len(self._postings[token])) for token in entry.tokens)
+        return shared / (query_weight + entry_weight - shared)
+
+    def refresh_if_stale(self):
+        """
+        Refresh the index if an EPG data sync completed since it was built.
+        """
+        version = Job.objects.filter(
+            type=JobType.EPG_DATA_SYNC,
+            state=JobState.COMPLETED
+        ).order_by('-updated_at').values_list('updated_at', flat=True).first()
+
+        if version != self._version:
+            self.refresh(version)
+
+    def refresh(self, version=None):
+        """
+        Bring the index in step with the guides, only re-indexing the guides that were added, changed or
+        removed since the last refresh.
+        """
+        rows = Guide.objects.values_list('id', 'site_name', 'lang', 'channel_id', 'channel__name').iterator(chunk_size=5000)
+
+        with self._lock:
+            if version == self._version:
+                # Refreshed by another request in the meantime
+                return
+
+            added = changed = 0
+            stale_ids = set(self._entries)
+            for guide_id, site_name, lang, xmltv_id, channel_name in rows:
+                stale_ids.discard(guide_id)
+                signature = (site_name, lang, xmltv_id, channel_name)
+                entry = self._entries.get(guide_id)
+                if entry is not None:
+                    if entry.signature == signature:
+                        continue
+                    self._remove(guide_id, entry)
+                    changed += 1
+                else:
+                    added += 1
+                self._add(guide_id, self._build_entry(signature))
+
+            for guide_id in stale_ids:
+                self._remove(guide_id, self._entries[guide_id])
+
+            self._version = version
+            logger.info(f"Guide matching index refreshed (added: {added}; changed: {changed}; removed: {len(stale_ids)})")
+
+    @staticmethod
+    def _build_entry(signature):
+        site_name, lang, xmltv_id, channel_name = signature
+        names = [normalize_title(site_name), normalize_xmltv_id(xmltv_id)]
+        if channel_name:
+            names.append(normalize_title(channel_name))
+
+        return _Entry(
+            signature=signature,
+            tokens=frozenset().union(*(name.tokens for name in names)),
+            compacts=frozenset(name.compact for name in names if name.compact),
+            tvg_key=_tvg_key(xmltv_id),
+            country=names[1].country,
+            lang=lang
+        )
+
+    def _add(self, guide_id, entry):
+        self._entries[guide_id] = entry
+        for token in entry.tokens:
+            self._postings.setdefault(token, set()).add(guide_id)
+        for compact in entry.compacts:
+            self._compacts.setdefault(compact, set()).add(guide_id)
+        if entry.tvg_key:
+            self._tvg_ids.setdefault(entry.tvg_key, set()).add(guide_id)
+
+    def _remove(self, guide_id, entry):
+        del self._entries[guide_id]
+        for index, keys in ((self._postings, entry.tokens), (self._compacts, entry.compacts),
+                            (self._tvg_ids, [entry.tvg_key] if entry.tvg_key else [])):
+            for key in keys:
+                ids = index[key]
+                ids.discard(guide_id)
+                if not ids:
+                    del index[key]
+
+
+guide_matcher = GuideMatcher()
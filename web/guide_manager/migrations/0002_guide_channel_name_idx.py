@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guide_manager', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='channel',
+            index=models.Index(fields=['name'], name='channel_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guide',
+            index=models.Index(fields=['site_name'], name='guide_site_name_idx'),
+        ),
+    ]
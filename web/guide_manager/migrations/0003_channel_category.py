@@ -0,0 +1,113 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Channel.categories holds ';' separated category codes. The links of a channel are rebuilt when its categories
+# change, and the links of a category when its code changes. SQLite drops the triggers of a table rebuilt by a
+# migration (e.g. AlterField), such migrations must run CHANNEL_CATEGORY_TRIGGERS again.
+CHANNEL_MATCHES_CATEGORY = "instr(';' || replace({channel}.categories, ' ', '') || ';', ';' || {category}.code || ';') > 0"
+
+CHANNEL_CATEGORY_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS channel_category_channel_insert AFTER INSERT ON guide_manager_channel
+    BEGIN
+        INSERT OR IGNORE INTO guide_manager_channelcategory (channel_id, category_id)
+        SELECT NEW.id, category.id FROM guide_manager_category AS category
+        WHERE {CHANNEL_MATCHES_CATEGORY.format(channel='NEW', category='category')};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS channel_category_channel_update AFTER UPDATE OF categories ON guide_manager_channel
+    WHEN OLD.categories IS NOT NEW.categories
+    BEGIN
+        DELETE FROM guide_manager_channelcategory WHERE channel_id = NEW.id;
+        INSERT OR IGNORE INTO guide_manager_channelcategory (channel_id, category_id)
+        SELECT NEW.id, category.id FROM guide_manager_category AS category
+        WHERE {CHANNEL_MATCHES_CATEGORY.format(channel='NEW', category='category')};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS channel_category_channel_delete AFTER DELETE ON guide_manager_channel
+    BEGIN
+        DELETE FROM guide_manager_channelcategory WHERE channel_id = OLD.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS channel_category_category_insert AFTER INSERT ON guide_manager_category
+    BEGIN
+        INSERT OR IGNORE INTO guide_manager_channelcategory (channel_id, category_id)
+        SELECT channel.id, NEW.id FROM guide_manager_channel AS channel
+        WHERE {CHANNEL_MATCHES_CATEGORY.format(channel='channel', category='NEW')};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS channel_category_category_update AFTER UPDATE OF code ON guide_manager_category
+    WHEN OLD.code IS NOT NEW.code
+    BEGIN
+        DELETE FROM guide_manager_channelcategory WHERE category_id = NEW.id;
+        INSERT OR IGNORE INTO guide_manager_channelcategory (channel_id, category_id)
+        SELECT channel.id, NEW.id FROM guide_manager_channel AS channel
+        WHERE {CHANNEL_MATCHES_CATEGORY.format(channel='channel', category='NEW')};
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS channel_category_category_delete AFTER DELETE ON guide_manager_category
+    BEGIN
+        DELETE FROM guide_manager_channelcategory WHERE category_id = OLD.id;
+    END
+    """,
+]
+
+DROP_CHANNEL_CATEGORY_TRIGGERS = [
+    f"DROP TRIGGER IF EXISTS channel_category_{table}_{event}"
+    for table in ('channel', 'category') for event in ('insert', 'update', 'delete')
+]
+
+POPULATE_CHANNEL_CATEGORIES = f"""
+    INSERT OR IGNORE INTO guide_manager_channelcategory (channel_id, category_id)
+    SELECT channel.id, category.id FROM guide_manager_channel AS channel, guide_manager_category AS category
+    WHERE {CHANNEL_MATCHES_CATEGORY.format(channel='channel', category='category')}
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guide_manager', '0002_guide_channel_name_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChannelCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='channel',
+            index=models.Index(fields=['country', 'name'], name='channel_country_name_idx'),
+        ),
+        migrations.AddField(
+            model_name='channelcategory',
+            name='category',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='channel_links', to='guide_manager.category'),
+        ),
+        migrations.AddField(
+            model_name='channelcategory',
+            name='channel',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='category_links', to='guide_manager.channel'),
+        ),
+        migrations.AddIndex(
+            model_name='channelcategory',
+            index=models.Index(fields=['channel'], name='channel_category_channel_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='channelcategory',
+            constraint=models.UniqueConstraint(fields=('category', 'channel'), name='unique_channel_category'),
+        ),
+        migrations.RunSQL(
+            sql=[*CHANNEL_CATEGORY_TRIGGERS, POPULATE_CHANNEL_CATEGORIES],
+            reverse_sql=DROP_CHANNEL_CATEGORY_TRIGGERS,
+        ),
+    ]
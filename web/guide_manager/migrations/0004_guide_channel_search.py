@@ -0,0 +1,231 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Full-text indexes of the channels and guides and the triggers keeping them in step, as of this migration
+CREATE_CHANNEL_SEARCH_TABLE = [
+    """
+    CREATE VIRTUAL TABLE guide_manager_channel_fts USING fts5(
+        xmltv_id, name, network,
+        content='guide_manager_channel', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+    """,
+    "INSERT INTO guide_manager_channel_fts(guide_manager_channel_fts, rank) VALUES ('rank', 'bm25(5.0, 10.0, 2.0)');",
+    "INSERT INTO guide_manager_channel_fts(guide_manager_channel_fts) VALUES ('rebuild');",
+]
+
+DROP_CHANNEL_SEARCH_TABLE = [
+    "DROP TABLE IF EXISTS guide_manager_channel_fts;",
+]
+
+CREATE_CHANNEL_SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER channel_search_insert AFTER INSERT ON guide_manager_channel
+    BEGIN
+        INSERT INTO guide_manager_channel_fts(rowid, xmltv_id, name, network)
+        VALUES (NEW.id, NEW.xmltv_id, NEW.name, NEW.network);
+    END;
+    """,
+    """
+    CREATE TRIGGER channel_search_delete AFTER DELETE ON guide_manager_channel
+    BEGIN
+        INSERT INTO guide_manager_channel_fts(guide_manager_channel_fts, rowid, xmltv_id, name, network)
+        VALUES ('delete', OLD.id, OLD.xmltv_id, OLD.name, OLD.network);
+    END;
+    """,
+    """
+    CREATE TRIGGER channel_search_update AFTER UPDATE OF xmltv_id, name, network ON guide_manager_channel
+    WHEN OLD.xmltv_id IS NOT NEW.xmltv_id OR OLD.name IS NOT NEW.name OR OLD.network IS NOT NEW.network
+    BEGIN
+        INSERT INTO guide_manager_channel_fts(guide_manager_channel_fts, rowid, xmltv_id, name, network)
+        VALUES ('delete', OLD.id, OLD.xmltv_id, OLD.name, OLD.network);
+        INSERT INTO guide_manager_channel_fts(rowid, xmltv_id, name, network)
+        VALUES (NEW.id, NEW.xmltv_id, NEW.name, NEW.network);
+    END;
+    """,
+]
+
+DROP_CHANNEL_SEARCH_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS channel_search_insert;",
+    "DROP TRIGGER IF EXISTS channel_search_delete;",
+    "DROP TRIGGER IF EXISTS channel_search_update;",
+]
+
+CREATE_GUIDE_SEARCH_TABLE = [
+    """
+    CREATE VIRTUAL TABLE guide_manager_guide_fts USING fts5(
+        site, site_id, site_name, xmltv_id, channel_name, lang, country,
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+    """,
+    "INSERT INTO guide_manager_guide_fts(guide_manager_guide_fts, rank) VALUES ('rank', 'bm25(1.0, 2.0, 10.0, 5.0, 10.0, 0.0, 0.0)');",
+    """
+    INSERT INTO guide_manager_guide_fts(rowid, site, site_id, site_name, xmltv_id, channel_name, lang, country)
+    SELECT guide.id, guide.site, guide.site_id, guide.site_name, guide.xmltv_id, channel.name, guide.lang,
+           channel.country
+    FROM guide_manager_guide AS guide
+    LEFT JOIN guide_manager_channel AS channel ON channel.xmltv_id = guide.xmltv_id
+    WHERE 1
+;""",
+]
+
+DROP_GUIDE_SEARCH_TABLE = [
+    "DROP TABLE IF EXISTS guide_manager_guide_fts;",
+]
+
+CREATE_GUIDE_SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER guide_search_insert AFTER INSERT ON guide_manager_guide
+    BEGIN
+        
+    INSERT INTO guide_manager_guide_fts(rowid, site, site_id, site_name, xmltv_id, channel_name, lang, country)
+    SELECT guide.id, guide.site, guide.site_id, guide.site_name, guide.xmltv_id, channel.name, guide.lang,
+           channel.country
+    FROM guide_manager_guide AS guide
+    LEFT JOIN guide_manager_channel AS channel ON channel.xmltv_id = guide.xmltv_id
+    WHERE guide.id = NEW.id
+;
+    END;
+    """,
+    """
+    CREATE TRIGGER guide_search_delete AFTER DELETE ON guide_manager_guide
+    BEGIN
+        DELETE FROM guide_manager_guide_fts WHERE rowid = OLD.id;
+    END;
+    """,
+    """
+    CREATE TRIGGER guide_search_update AFTER UPDATE OF site, site_id, site_name, xmltv_id, lang ON guide_manager_guide
+    WHEN OLD.site IS NOT NEW.site OR OLD.site_id IS NOT NEW.site_id OR OLD.site_name IS NOT NEW.site_name
+        OR OLD.xmltv_id IS NOT NEW.xmltv_id OR OLD.lang IS NOT NEW.lang
+    BEGIN
+        DELETE FROM guide_manager_guide_fts WHERE rowid = OLD.id;
+        
+    INSERT INTO guide_manager_guide_fts(rowid, site, site_id, site_name, xmltv_id, channel_name, lang, country)
+    SELECT guide.id, guide.site, guide.site_id, guide.site_name, guide.xmltv_id, channel.name, guide.lang,
+           channel.country
+    FROM guide_manager_guide AS guide
+    LEFT JOIN guide_manager_channel AS channel ON channel.xmltv_id = guide.xmltv_id
+    WHERE guide.id = NEW.id
+;
+    END;
+    """,
+    """
+    CREATE TRIGGER guide_search_channel_insert AFTER INSERT ON guide_manager_channel
+    BEGIN
+        
+        DELETE FROM guide_manager_guide_fts WHERE rowid IN (SELECT id FROM guide_manager_guide WHERE xmltv_id = NEW.xmltv_id);
+        
+    INSERT INTO guide_manager_guide_fts(rowid, site, site_id, site_name, xmltv_id, channel_name, lang, country)
+    SELECT guide.id, guide.site, guide.site_id, guide.site_name, guide.xmltv_id, channel.name, guide.lang,
+           channel.country
+    FROM guide_manager_guide AS guide
+    LEFT JOIN guide_manager_channel AS channel ON channel.xmltv_id = guide.xmltv_id
+    WHERE guide.xmltv_id = NEW.xmltv_id
+;
+    
+    END;
+    """,
+    """
+    CREATE TRIGGER guide_search_channel_delete AFTER DELETE ON guide_manager_channel
+    BEGIN
+        
+        DELETE FROM guide_manager_guide_fts WHERE rowid IN (SELECT id FROM guide_manager_guide WHERE xmltv_id = OLD.xmltv_id);
+        
+    INSERT INTO guide_manager_guide_fts(rowid, site, site_id, site_name, xmltv_id, channel_name, lang, country)
+    SELECT guide.id, guide.site, guide.site_id, guide.site_name, guide.xmltv_id, channel.name, guide.lang,
+           channel.country
+    FROM guide_manager_guide AS guide
+    LEFT JOIN guide_manager_channel AS channel ON channel.xmltv_id = guide.xmltv_id
+    WHERE guide.xmltv_id = OLD.xmltv_id
+;
+    
+    END;
+    """,
+    """
+    CREATE TRIGGER guide_search_channel_update AFTER UPDATE OF xmltv_id, name, country ON guide_manager_channel
+    WHEN OLD.xmltv_id IS NOT NEW.xmltv_id OR OLD.name IS NOT NEW.name OR OLD.country IS NOT NEW.country
+    BEGIN
+        
+        DELETE FROM guide_manager_guide_fts WHERE rowid IN (SELECT id FROM guide_manager_guide WHERE xmltv_id = OLD.xmltv_id);
+        
+    INSERT INTO guide_manager_guide_fts(rowid, site, site_id, site_name, xmltv_id, channel_name, lang, country)
+    SELECT guide.id, guide.site, guide.site_id, guide.site_name, guide.xmltv_id, channel.name, guide.lang,
+           channel.country
+    FROM guide_manager_guide AS guide
+    LEFT JOIN guide_manager_channel AS channel ON channel.xmltv_id = guide.xmltv_id
+    WHERE guide.xmltv_id = OLD.xmltv_id
+;
+    
+        
+        DELETE FROM guide_manager_guide_fts WHERE rowid IN (SELECT id FROM guide_manager_guide WHERE xmltv_id = NEW.xmltv_id);
+        
+    INSERT INTO guide_manager_guide_fts(rowid, site, site_id, site_name, xmltv_id, channel_name, lang, country)
+    SELECT guide.id, guide.site, guide.site_id, guide.site_name, guide.xmltv_id, channel.name, guide.lang,
+           channel.country
+    FROM guide_manager_guide AS guide
+    LEFT JOIN guide_manager_channel AS channel ON channel.xmltv_id = guide.xmltv_id
+    WHERE guide.xmltv_id = NEW.xmltv_id
+;
+    
+    END;
+    """,
+]
+
+DROP_GUIDE_SEARCH_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS guide_search_insert;",
+    "DROP TRIGGER IF EXISTS guide_search_delete;",
+    "DROP TRIGGER IF EXISTS guide_search_update;",
+    "DROP TRIGGER IF EXISTS guide_search_channel_insert;",
+    "DROP TRIGGER IF EXISTS guide_search_channel_delete;",
+    "DROP TRIGGER IF EXISTS guide_search_channel_update;",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guide_manager', '0003_channel_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChannelSearch',
+            fields=[
+                ('channel', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search', serialize=False, to='guide_manager.channel')),
+                ('xmltv_id', models.TextField()),
+                ('name', models.TextField()),
+                ('network', models.TextField(null=True)),
+                ('query', models.TextField(db_column='guide_manager_channel_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'guide_manager_channel_fts',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='GuideSearch',
+            fields=[
+                ('guide', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search', serialize=False, to='guide_manager.guide')),
+                ('site', models.TextField()),
+                ('site_id', models.TextField()),
+                ('site_name', models.TextField()),
+                ('xmltv_id', models.TextField(null=True)),
+                ('channel_name', models.TextField(null=True)),
+                ('lang', models.TextField()),
+                ('country', models.TextField(null=True)),
+                ('query', models.TextField(db_column='guide_manager_guide_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'guide_manager_guide_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(CREATE_CHANNEL_SEARCH_TABLE, reverse_sql=DROP_CHANNEL_SEARCH_TABLE),
+        migrations.RunSQL(CREATE_CHANNEL_SEARCH_TRIGGERS, reverse_sql=DROP_CHANNEL_SEARCH_TRIGGERS),
+        migrations.RunSQL(CREATE_GUIDE_SEARCH_TABLE, reverse_sql=DROP_GUIDE_SEARCH_TABLE),
+        migrations.RunSQL(CREATE_GUIDE_SEARCH_TRIGGERS, reverse_sql=DROP_GUIDE_SEARCH_TRIGGERS),
+    ]
@@ -1,5 +1,7 @@
 ﻿from django.db import models
 from django.core.validators import URLValidator
+from main.search import prefix_query, ranked, search_tokens, substring_search
+from .sql import CHANNEL_SEARCH_TABLE, GUIDE_SEARCH_TABLE
 
 
 class Country(models.Model):
@@ -25,6 +27,24 @@ class Category(models.Model):
         return self.name
 
 
+class ChannelQuerySet(models.QuerySet):
+    """
+    QuerySet for channels.
+    """
+
+    def search(self, text):
+        """
+        Filter the channels whose xmltv_id, name or network contain words starting with the words of the text,
+        using the full-text index.
+
+        The channels are annotated with `search_rank`, the BM25 relevance of the match (lower is more relevant).
+        """
+        tokens = search_tokens(text)
+        if not tokens:
+            return substring_search(self, text, ['xmltv_id', 'name', 'network'])
+        return ranked(self.filter(search__query=prefix_query(tokens)))
+
+
 class Channel(models.Model):
     """
     Model representing a channel.
@@ -41,15 +61,88 @@ class Channel(models.Model):
     website_url = models.TextField(validators=[URLValidator()], null=True, blank=True)
     logo_url = models.TextField(validators=[URLValidator()], null=True, blank=True)
 
+    objects = ChannelQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=['xmltv_id'], name='channel_xmltv_id_idx'),
+            models.Index(fields=['name'], name='channel_name_idx'),
+            models.Index(fields=['country', 'name'], name='channel_country_name_idx'),
         ]
 
     def __str__(self):
         return f'{self.name} ({self.xmltv_id})'
 
 
+class ChannelCategory(models.Model):
+    """
+    Model representing a category of a channel, the normalized form of Channel.categories.
+
+    Rows are maintained by database triggers on the channel and category tables (see migration
+    0003_channel_category), as both are written by the job worker during EPG data syncs. Foreign keys have no
+    database constraint for the same reason.
+    """
+    channel = models.ForeignKey(
+        Channel,
+        on_delete=models.DO_NOTHING,
+        related_name='category_links',
+        db_constraint=False
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.DO_NOTHING,
+        related_name='channel_links',
+        db_constraint=False
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'channel'], name='unique_channel_category')
+        ]
+        indexes = [
+            models.Index(fields=['channel'], name='channel_category_channel_idx')
+        ]
+
+    def __str__(self):
+        return f"{self.channel_id} - {self.category_id}"
+
+
+class GuideQuerySet(models.QuerySet):
+    """
+    QuerySet for guides.
+    """
+
+    def search(self, text, lang=None, country=None):
+        """
+        Filter the guides whose site, site_id, site_name, xmltv_id or channel name contain words starting with the
+        words of the text, using the full-text index. The lang and channel country filters are applied within the
+        index, without joining the channels.
+
+        The guides are annotated with `search_rank`, the BM25 relevance of the match (lower is more relevant).
+        """
+        tokens = search_tokens(text)
+        if not tokens:
+            queryset = self
+            if lang:
+                queryset = queryset.filter(lang=lang)
+            if country:
+                queryset = queryset.filter(channel__country=country)
+            return substring_search(
+                queryset, text, ['site', 'site_id', 'site_name', 'channel__xmltv_id', 'channel__name']
+            )
+
+        query = f'{{site site_id site_name xmltv_id channel_name}} : ({prefix_query(tokens)})'
+        filters = {}
+        for column, value in (('lang', lang), ('country', country)):
+            value_tokens = search_tokens(value)
+            if value_tokens:
+                # Narrows the match in the index, the exact value is then compared on the matched rows
+                query += f' AND {column} : ^"{" ".join(value_tokens)}"'
+            if value:
+                filters[f'search__{column}'] = value
+        return ranked(self.filter(search__query=query, **filters))
+
+
 class Guide(models.Model):
     """
     Model representing a guide.
@@ -69,11 +162,72 @@ class Guide(models.Model):
         blank=True
     )
 
+    objects = GuideQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=['site', 'site_id', 'site_name'], name='guide_site_site_id_name_idx'),
             models.Index(fields=['lang'], name='guide_lang_idx'),
+            models.Index(fields=['site_name'], name='guide_site_name_idx'),
         ]
 
     def __str__(self):
-        return f"{self.site_name} - {self.site_id}"
\ No newline at end of file
+        return f"{self.site_name} - {self.site_id}"
+
+
+class ChannelSearch(models.Model):
+    """
+    Full-text index of channels.
+
+    This is a SQLite FTS5 table kept in step with Channel by triggers (see migration 0004), query it through
+    Channel.objects.search().
+    """
+    channel = models.OneToOneField(
+        Channel,
+        on_delete=models.DO_NOTHING,
+        related_name='search',
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False
+    )
+    xmltv_id = models.TextField()
+    name = models.TextField()
+    network = models.TextField(null=True)
+    # Hidden FTS5 columns: comparing the table column to a query runs a full-text match, rank is its relevance
+    query = models.TextField(db_column=CHANNEL_SEARCH_TABLE)
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = CHANNEL_SEARCH_TABLE
+
+
+class GuideSearch(models.Model):
+    """
+    Full-text index of guides, with the name and country of their channel.
+
+    This is a SQLite FTS5 table kept in step with Guide and Channel by triggers (see migration 0004), query it through
+    Guide.objects.search().
+    """
+    guide = models.OneToOneField(
+        Guide,
+        on_delete=models.DO_NOTHING,
+        related_name='search',
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False
+    )
+    site = models.TextField()
+    site_id = models.TextField()
+    site_name = models.TextField()
+    xmltv_id = models.TextField(null=True)
+    channel_name = models.TextField(null=True)
+    lang = models.TextField()
+    country = models.TextField(null=True)
+    # Hidden FTS5 columns: comparing the table column to a query runs a full-text match, rank is its relevance
+    query = models.TextField(db_column=GUIDE_SEARCH_TABLE)
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = GUIDE_SEARCH_TABLE
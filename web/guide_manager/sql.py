@@ -0,0 +1,18 @@
+"""
+Names of the raw SQL objects maintained on the guide tables.
+
+The guide tables are written by EPG data syncs, in the job worker as well as in Django, so derived data is kept in
+step by triggers. The objects themselves (channel category links, full-text indexes and their triggers) are created
+by the migrations that own them (0003_channel_category and 0004_guide_channel_search), which keep their own frozen
+copy of the SQL they run. Changing these objects takes a new migration, this module only holds what the live code
+needs to query them.
+
+SQLite drops the triggers of a table whenever Django has to rebuild it in a migration (e.g. when altering a field),
+so migrations doing so must re-create them.
+"""
+
+# Full-text index over channel xmltv_id/name/network, an external content FTS5 table kept in step by triggers
+CHANNEL_SEARCH_TABLE = 'guide_manager_channel_fts'
+
+# Full-text index over guides and the name and country of their channel, kept in step by triggers on both tables
+GUIDE_SEARCH_TABLE = 'guide_manager_guide_fts'
@@ -0,0 +1,413 @@
+"""
+Synchronization of the EPG reference data (countries, categories, channels and guides) with the iptv-org API.
+
+Each source is a large JSON array. The modified sources are first downloaded to temporary files, then parsed item by
+item in a single transaction, each item being compared to the existing rows by a digest of its values, and only
+added, changed and removed rows are written, in batches. Sources are requested conditionally, with the ETag and
+Last-Modified of the last successful sync kept in the config store, and may also be local files (e.g. to benchmark or
+test the sync offline).
+"""
+import codecs
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Callable, NamedTuple
+
+import requests
+from django.db import transaction
+
+from job_manager.lifecycle import claim_job, complete_job, fail_job_attempt
+from job_manager.models import JobState
+from main.utils import ConfigStore
+from .catalog import get_catalog
+from .models import Category, Channel, Country, Guide
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT = 60
+CHUNK_SIZE = 64 * 1024
+DEFAULT_BATCH_SIZE = 1000
+
+SOURCE_URLS = {
+    'countries': 'https://iptv-org.github.io/api/countries.json',
+    'categories': 'https://iptv-org.github.io/api/categories.json',
+    'channels': 'https://iptv-org.github.io/api/channels.json',
+    'guides': 'https://iptv-org.github.io/api/guides.json',
+}
+
+# Conditional request metadata of each source (URL or file path) at its last successful sync
+SOURCES_CONFIG_KEY = "guide_manager:sources"
+
+
+def iter_json_array(chunks):
+    """
+    Parse a JSON array incrementally, yielding its items as soon as they are complete.
+
+    Args:
+        chunks (iterable): The UTF-8 encoded document, as byte chunks.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    started = False
+
+    def parse(final):
+        nonlocal buffer, started
+        position = 0
+        try:
+            while True:
+                while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                    position += 1
+                if position == len(buffer):
+                    return
+                if not started:
+                    if buffer[position] != '[':
+                        raise ValueError(f"Expected a JSON array, found {buffer[position]!r}")
+                    started = True
+                    position += 1
+                    continue
+                if buffer[position] == ']':
+                    started = None
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    # Incomplete item, wait for the next chunk
+                    return
+                if not final and (end == len(buffer) or buffer[end] not in ' \t\r\n,]'):
+                    # A number may go on in the next chunk
+                    return
+                position = end
+                yield item
+        finally:
+            buffer = buffer[position:]
+
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+        yield from parse(final=False)
+        if started is None:
+            return
+    buffer += text_decoder.decode(b'', final=True)
+    yield from parse(final=True)
+    if started is not None:
+        raise ValueError("Unterminated JSON array")
+
+
+def iter_file_chunks(file):
+    """
+    Read a binary file object in fixed-size chunks.
+    """
+    return iter(lambda: file.read(CHUNK_SIZE), b'')
+
+
+@contextmanager
+def spool_source(source, metadata=None):
+    """
+    Download a JSON source to a temporary file, conditionally when the metadata of its last sync is given, so that it
+    can be parsed later without holding a connection open.
+
+    Args:
+        source (str): An http(s) URL, or a local file path (optionally as a file:// URL).
+        metadata (dict, optional): The metadata of the last sync of the source.
+
+    Yields:
+        tuple: The binary file of the source (None when it did not change) and its metadata. Local files are opened
+            in place.
+    """
+    metadata = metadata or {}
+    if source.startswith(('http://', 'https://')):
+        headers = {}
+        if metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+
+        with requests.get(source, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            if response.status_code == 304:
+                yield None, metadata
+                return
+            response.raise_for_status()
+            source_metadata = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+            file = tempfile.TemporaryFile()
+            try:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    file.write(chunk)
+            except BaseException:
+                file.close()
+                raise
+
+        with file:
+            file.seek(0)
+            yield file, source_metadata
+        return
+
+    path = source[len('file://'):] if source.startswith('file://') else source
+    stat = os.stat(path)
+    file_metadata = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    if metadata == file_metadata:
+        yield None, metadata
+        return
+    with open(path, 'rb') as file:
+        yield file, file_metadata
+
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _country(item, context):
+    return {'code': item['code'], 'name': item['name'], 'flag': item.get('flag')}
+
+
+def _category(item, context):
+    return {'code': item['id'], 'name': item['name']}
+
+
+def _channel(item, context):
+    return {
+        'xmltv_id': item['id'],
+        'name': item['name'],
+        'network': item.get('network'),
+        'country': item['country'],
+        'city': item.get('city'),
+        'categories': ';'.join(item.get('categories') or []),
+        'is_nsfw': bool(item.get('is_nsfw')),
+        'launched_at': _parse_date(item.get('launched')),
+        'closed_at': _parse_date(item.get('closed')),
+        'website_url': item.get('website'),
+        'logo_url': item.get('logo'),
+    }
+
+
+def _guide(item, context):
+    # Guides of unknown channels are kept without channel
+    xmltv_id = item.get('channel')
+    return {
+        'site': item['site'],
+        'site_id': item['site_id'],
+        'site_name': item['site_name'],
+        'lang': item['lang'],
+        'channel_id': xmltv_id if xmltv_id in context['xmltv_ids'] else None,
+    }
+
+
+class SyncTable(NamedTuple):
+    """
+    A synchronized table and the source it is synchronized with.
+    """
+    name: str
+    model: type
+    key_fields: tuple
+    fields: tuple
+    parse: Callable
+    # Tables whose source changes may change the rows of this table even when its own source did not change
+    depends_on: tuple = ()
+
+
+# In synchronization order
+TABLES = [
+    SyncTable('countries', Country, ('code',), ('code', 'name', 'flag'), _country),
+    SyncTable('categories', Category, ('code',), ('code', 'name'), _category),
+    SyncTable('channels', Channel, ('xmltv_id',), (
+        'xmltv_id', 'name', 'network', 'country', 'city', 'categories', 'is_nsfw', 'launched_at', 'closed_at',
+        'website_url', 'logo_url'
+    ), _channel),
+    SyncTable('guides', Guide, ('site', 'site_id', 'lang'), ('site', 'site_id', 'lang', 'site_name', 'channel_id'),
+              _guide, depends_on=('channels',)),
+]
+
+
+def _digest(values):
+    return hashlib.blake2b(repr(values).encode(), digest_size=16).digest()
+
+
+class SyncStats:
+    """
+    Counts of the row changes applied to a table by an EPG data sync.
+    """
+
+    def __init__(self):
+        self.added = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.removed = 0
+        self.invalid = 0
+
+    @property
+    def modified(self):
+        return bool(self.added or self.changed or self.removed)
+
+    def __str__(self):
+        return (f"added: {self.added}; changed: {self.changed}; unchanged: {self.unchanged}; "
+                f"removed: {self.removed}; invalid: {self.invalid}")
+
+
+class EpgDataSynchronizer:
+    """
+    Synchronizes the countries, categories, channels and guides with their JSON sources, in a single transaction.
+    """
+
+    def __init__(self, sources=None, batch_size=DEFAULT_BATCH_SIZE, force=False):
+        """
+        Args:
+            sources (dict, optional): URL or file path of some sources, by table name, overriding the API URLs.
+            batch_size (int): Number of rows written per batch.
+            force (bool): Whether to sync the sources even if they did not change since the last sync.
+        """
+        self.sources = {**SOURCE_URLS, **(sources or {})}
+        self.batch_size = batch_size
+        self.force = force
+
+    def run(self):
+        """
+        Synchronize the tables with their sources.
+
+        The modified sources are downloaded to temporary files first, the transaction is only opened to parse them,
+        diff and write the rows, so other writers are not blocked during the downloads. Sources are parsed item by
+        item and never held in memory as a whole.
+
+        Returns:
+            tuple: Whether the sync succeeded, and a status description.
+        """
+        config_store = ConfigStore()
+        metadata = config_store.get(SOURCES_CONFIG_KEY) or {}
+        synced_metadata = dict(metadata)
+
+        with ExitStack() as stack:
+            # Downloaded file of each modified source, by table name
+            files = {}
+            for table in TABLES:
+                source = self.sources[table.name]
+                force = self.force or any(name in files for name in table.depends_on)
+                file, source_metadata = stack.enter_context(
+                    spool_source(source, None if force else metadata.get(source))
+                )
+                if file is None:
+                    logger.info(f"EPG data source {source} not modified since last sync")
+                    continue
+                files[table.name] = file
+                synced_metadata[source] = source_metadata
+
+            results = []
+            with transaction.atomic():
+                for table in TABLES:
+                    if table.name not in files:
+                        results.append(f"{table.name}: not modified")
+                        continue
+
+                    context = {}
+                    if table.name == 'guides':
+                        # Channels are synced first, these are the channels of the source when it was modified
+                        context['xmltv_ids'] = set(Channel.objects.values_list('xmltv_id', flat=True))
+                    items = iter_json_array(iter_file_chunks(files[table.name]))
+                    stats = self._sync_table(table, items, context)
+                    logger.info(f"EPG data {table.name} synced ({stats})")
+                    results.append(f"{table.name}: {stats}")
+
+        # Only recorded once the sync is committed, so that failed syncs are not skipped the next time
+        config_store.set(SOURCES_CONFIG_KEY, synced_metadata)
+        return True, f"Synced EPG data ({' / '.join(results)})"
+
+    def run_job(self, job_id):
+        """
+        Claim and process a queued EPG_DATA_SYNC job, then refresh the guide catalog summary. Used by the job runner
+        and the syncepgdata command.
+
+        Returns:
+            Job: The processed job, None if it was not queued anymore.
+        """
+        job = claim_job(job_id)
+        if job is None:
+            return None
+
+        start = time.perf_counter()
+        try:
+            success, description = self.run()
+            complete_job(job, success, f"{description} in {time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            logger.exception(f"Error processing job {job.job_id}")
+            fail_job_attempt(job, e)
+            return job
+
+        # Computed now rather than by the next stats request. The job is completed whatever happens here, a summary
+        # that could not be computed is computed again by the next request.
+        if job.state == JobState.COMPLETED:
+            try:
+                get_catalog()
+            except Exception:
+                logger.exception(f"Error computing the guide catalog summary after job {job.job_id}")
+        return job
+
+    def _sync_table(self, table: SyncTable, items, context):
+        """
+        Parse the items of a source, diff them against the rows of a table and write the differences.
+
+        Rows are matched on the key fields. When several rows share a key, the n-th item of the key matches the
+        n-th row (by ID), so rows referenced by other tables keep their ID.
+        """
+        model = table.model
+        existing = {}
+        occurrences = {}
+        rows = model.objects.order_by('pk').values_list('pk', *table.fields).iterator(chunk_size=5000)
+        key_indexes = [table.fields.index(field) for field in table.key_fields]
+        for pk, *values in rows:
+            key = tuple(values[index] for index in key_indexes)
+            occurrence = occurrences.get(key, 0)
+            occurrences[key] = occurrence + 1
+            existing[(key, occurrence)] = (pk, _digest(values))
+
+        stats = SyncStats()
+        occurrences = {}
+        inserts, updates = [], []
+        for item in items:
+            try:
+                values = table.parse(item, context)
+            except (KeyError, TypeError, AttributeError):
+                stats.invalid += 1
+                continue
+
+            key = tuple(values[field] for field in table.key_fields)
+            occurrence = occurrences.get(key, 0)
+            occurrences[key] = occurrence + 1
+
+            current = existing.pop((key, occurrence), None)
+            if current is None:
+                inserts.append(model(**values))
+                stats.added += 1
+            elif current[1] != _digest([values[field] for field in table.fields]):
+                updates.append(model(pk=current[0], **values))
+                stats.changed += 1
+            else:
+                stats.unchanged += 1
+
+            if len(inserts) + len(updates) >= self.batch_size:
+                self._write(table, inserts, updates)
+                inserts, updates = [], []
+        self._write(table, inserts, updates)
+
+        # Rows left are not in the source anymore
+        removed_ids = [pk for pk, _ in existing.values()]
+        for index in range(0, len(removed_ids), self.batch_size):
+            model.objects.filter(pk__in=removed_ids[index:index + self.batch_size]).delete()
+        stats.removed = len(removed_ids)
+        return stats
+
+    def _write(self, table: SyncTable, inserts, updates):
+        if inserts:
+            table.model.objects.bulk_create(inserts, batch_size=self.batch_size)
+        if updates:
+            fields = [field for field in table.fields if field not in table.key_fields]
+            table.model.objects.bulk_update(updates, fields, batch_size=self.batch_size)
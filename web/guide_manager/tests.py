@@ -0,0 +1,237 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from job_manager.models import Job, JobState, JobType
+from main.utils import ConfigStore
+from .catalog import CATALOG_CONFIG_KEY
+from .models import Category, Channel, Country, Guide
+from .sync import EpgDataSynchronizer, iter_json_array
+
+
+def country(code, name):
+    return {'code': code, 'name': name, 'flag': None}
+
+
+def channel(xmltv_id, name, country='US'):
+    return {'id': xmltv_id, 'name': name, 'country': country, 'categories': ['news']}
+
+
+def guide(xmltv_id, site_id):
+    return {'channel': xmltv_id, 'site': 'example.com', 'site_id': site_id, 'site_name': site_id, 'lang': 'en'}
+
+
+class IterJsonArrayTests(TestCase):
+
+    def test_items_split_across_chunks(self):
+        data = json.dumps([{'id': 1, 'name': 'One, two'}, 12345, [3]]).encode()
+        chunks = [data[index:index + 3] for index in range(0, len(data), 3)]
+
+        self.assertEqual(list(iter_json_array(chunks)), [{'id': 1, 'name': 'One, two'}, 12345, [3]])
+
+
+class EpgDataSynchronizerTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(CONFIG_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.sources = {name: os.path.join(self.directory, f'{name}.json')
+                        for name in ('countries', 'categories', 'channels', 'guides')}
+        self.write('countries', [country('US', 'United States'), country('FR', 'France')])
+        self.write('categories', [{'id': 'news', 'name': 'News'}])
+        self.write('channels', [channel('One.us', 'One'), channel('Two.us', 'Two')])
+        self.write('guides', [guide('One.us', 'one'), guide('Two.us', 'two'), guide('Unknown.us', 'unknown')])
+
+    def write(self, name, items):
+        with open(self.sources[name], 'w', encoding='utf-8') as file:
+            file.write(items if isinstance(items, str) else json.dumps(items))
+
+    def sync(self):
+        success, description = EpgDataSynchronizer(sources=self.sources).run()
+        self.assertTrue(success)
+        return dict(part.split(': ', 1) for part in description[len('Synced EPG data ('):-1].split(' / '))
+
+    def test_digest_diff(self):
+        results = self.sync()
+        self.assertEqual(results['channels'], "added: 2; changed: 0; unchanged: 0; removed: 0; invalid: 0")
+        self.assertEqual(results['guides'], "added: 3; changed: 0; unchanged: 0; removed: 0; invalid: 0")
+        # Guides of unknown channels are kept without channel
+        self.assertIsNone(Guide.objects.get(site_id='unknown').channel_id)
+        one_id = Channel.objects.get(xmltv_id='One.us').id
+
+        self.write('countries', [country('US', 'United States'), country('FR', 'France'), {'name': 'No code'}])
+        self.write('channels', [channel('One.us', 'One'), channel('Two.us', 'Two HD'), channel('Unknown.us', 'New')])
+        results = self.sync()
+
+        self.assertEqual(results['countries'], "added: 0; changed: 0; unchanged: 2; removed: 0; invalid: 1")
+        self.assertEqual(results['categories'], "not modified")
+        self.assertEqual(results['channels'], "added: 1; changed: 1; unchanged: 1; removed: 0; invalid: 0")
+        # Synced again as their channels changed, although their source did not
+        self.assertEqual(results['guides'], "added: 0; changed: 1; unchanged: 2; removed: 0; invalid: 0")
+        self.assertEqual(Guide.objects.get(site_id='unknown').channel_id, 'Unknown.us')
+        # Unchanged rows keep their ID
+        self.assertEqual(Channel.objects.get(xmltv_id='One.us').id, one_id)
+        self.assertEqual(Channel.objects.get(xmltv_id='Two.us').name, 'Two HD')
+
+        self.write('countries', [country('US', 'United States')])
+        results = self.sync()
+        self.assertEqual(results['countries'], "added: 0; changed: 0; unchanged: 1; removed: 1; invalid: 0")
+        self.assertEqual(results['guides'], "not modified")
+        self.assertEqual(list(Country.objects.values_list('code', flat=True)), ['US'])
+
+    def test_sources_are_parsed_incrementally(self):
+        self.write('channels', [channel(f'Channel{index}.us', f'Channel {index}') for index in range(10)])
+        # Items of the source being parsed so far, and at each write
+        parsed, written = [], []
+
+        def counting_iter_json_array(chunks):
+            parsed.clear()
+            for item in iter_json_array(chunks):
+                parsed.append(item)
+                yield item
+
+        def recording_write(synchronizer, table, inserts, updates):
+            if table.name == 'channels':
+                written.append((len(parsed), len(inserts)))
+            write(synchronizer, table, inserts, updates)
+
+        write = EpgDataSynchronizer._write
+        with mock.patch('guide_manager.sync.iter_json_array', counting_iter_json_array), \
+                mock.patch.object(EpgDataSynchronizer, '_write', recording_write):
+            EpgDataSynchronizer(sources=self.sources, batch_size=2).run()
+
+        self.assertEqual(written, [(2, 2), (4, 2), (6, 2), (8, 2), (10, 2), (10, 0)])
+        self.assertEqual(Channel.objects.count(), 10)
+
+    def test_failed_sync_writes_nothing(self):
+        self.write('guides', '[{"channel": "One.us"')
+
+        with self.assertRaises(json.JSONDecodeError):
+            EpgDataSynchronizer(sources=self.sources).run()
+
+        self.assertFalse(Channel.objects.exists())
+        # Not skipped as not modified the next time
+        self.write('guides', [guide('One.us', 'one')])
+        self.assertEqual(self.sync()['channels'], "added: 2; changed: 0; unchanged: 0; removed: 0; invalid: 0")
+
+    def test_job_refreshes_the_catalog(self):
+        job = Job.objects.create(type=JobType.EPG_DATA_SYNC, state=JobState.QUEUED)
+
+        job = EpgDataSynchronizer(sources=self.sources).run_job(job.pk)
+
+        self.assertEqual(job.state, JobState.COMPLETED)
+        catalog = ConfigStore().get(CATALOG_CONFIG_KEY)
+        self.assertEqual((catalog['channels'], catalog['guides']), (2, 3))
+
+    def test_catalog_error_keeps_the_job_completed(self):
+        job = Job.objects.create(type=JobType.EPG_DATA_SYNC, state=JobState.QUEUED)
+
+        with mock.patch('guide_manager.sync.get_catalog', side_effect=RuntimeError("Catalog error")), \
+                self.assertLogs('guide_manager.sync', 'ERROR'):
+            EpgDataSynchronizer(sources=self.sources).run_job(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, JobState.COMPLETED)
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        news = Channel.objects.create(xmltv_id='CNNInternational.us', name='CNN International', country='US')
+        sport = Channel.objects.create(xmltv_id='Eurosport.fr', name='Eurosport', country='FR')
+        Guide.objects.create(site='tvguide.com', site_id='cnn-intl', site_name='CNN Int.', lang='en', channel=news)
+        Guide.objects.create(site='tv.fr', site_id='euro', site_name='Eurosport 1', lang='fr', channel=sport)
+
+    def test_channel_prefix_search(self):
+        self.assertEqual(list(Channel.objects.search('cnn inter').values_list('xmltv_id', flat=True)),
+                         ['CNNInternational.us'])
+        self.assertFalse(Channel.objects.search('cnn sport').exists())
+
+    def test_guide_search_filters(self):
+        guides = Guide.objects.search('euro', lang='fr', country='FR')
+        self.assertEqual(list(guides.values_list('site_id', flat=True)), ['euro'])
+        self.assertFalse(Guide.objects.search('euro', lang='en').exists())
+        # Matches the name of the channel of the guide
+        self.assertEqual(list(Guide.objects.search('international').values_list('site_id', flat=True)), ['cnn-intl'])
+
+    def test_substring_fallback(self):
+        guides = Guide.objects.search('.', lang='en')
+        self.assertEqual([(guide.site_id, guide.search_rank) for guide in guides], [('cnn-intl', 0.0)])
+
+
+class SearchEndpointTests(TestCase):
+
+    def setUp(self):
+        Category.objects.create(code='news', name='News')
+        Category.objects.create(code='sports', name='Sports')
+        channels = {
+            xmltv_id: Channel.objects.create(xmltv_id=xmltv_id, name=name, country=country, categories=categories)
+            for xmltv_id, name, country, categories in [
+                ('CNNInternational.us', 'CNN International', 'US', 'news'),
+                ('CNNPortugal.pt', 'CNN Portugal', 'PT', 'news'),
+                ('Eurosport.fr', 'Eurosport', 'FR', 'sports'),
+                ('Euronews.fr', 'Euronews', 'FR', 'news'),
+            ]
+        }
+        for site_id, lang, xmltv_id in [
+            ('cnn-intl', 'en', 'CNNInternational.us'), ('cnn-es', 'es', 'CNNInternational.us'),
+            ('cnn-pt', 'pt', 'CNNPortugal.pt'), ('eurosport', 'fr', 'Eurosport.fr'),
+            ('euronews-en', 'en', 'Euronews.fr'), ('euronews-fr', 'fr', 'Euronews.fr'),
+        ]:
+            Guide.objects.create(site='example.com', site_id=site_id, site_name=channels[xmltv_id].name, lang=lang,
+                                 channel=channels[xmltv_id])
+
+    def get(self, name, **params):
+        response = self.client.get(f'/api/{name}/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_guide_prefix_search_with_filters(self):
+        for params, site_ids in [
+            ({'q': 'euro'}, {'eurosport', 'euronews-en', 'euronews-fr'}),
+            ({'q': 'euro', 'lang': 'fr'}, {'eurosport', 'euronews-fr'}),
+            ({'q': 'euron', 'lang': 'fr', 'country': 'FR'}, {'euronews-fr'}),
+            ({'q': 'euro', 'country': 'US'}, set()),
+            ({'q': 'cn', 'country': 'US'}, {'cnn-intl', 'cnn-es'}),
+            ({'q': 'cnn inter', 'lang': 'es'}, {'cnn-es'}),
+            ({'q': 'cnn', 'lang': 'e'}, set()),
+            # Without search, the filters are applied by the query
+            ({'lang': 'en', 'country': 'FR'}, {'euronews-en'}),
+        ]:
+            with self.subTest(params=params):
+                self.assertEqual({guide['site_id'] for guide in self.get('guides', **params)['items']}, site_ids)
+
+    def test_guide_search_pages_keep_the_filters(self):
+        data = self.get('guides', q='euro', lang='fr', page_size=1, cursor='')
+        site_ids = [data['items'][0]['site_id']]
+        self.assertIn('lang=fr', data['links']['next'])
+
+        data = self.get('guides', q='euro', lang='fr', page_size=1, cursor=data['cursors']['next'])
+        site_ids.append(data['items'][0]['site_id'])
+        self.assertNotIn('next', data['cursors'])
+        self.assertEqual(set(site_ids), {'eurosport', 'euronews-fr'})
+
+    def test_channel_facets(self):
+        data = self.get('channels', q='cnn', facets='true')
+        self.assertEqual({channel['xmltv_id'] for channel in data['items']}, {'CNNInternational.us', 'CNNPortugal.pt'})
+        self.assertEqual(data['facets'], {
+            'categories': [{'code': 'news', 'name': 'News', 'count': 2}],
+            'countries': [{'code': 'PT', 'count': 1}, {'code': 'US', 'count': 1}],
+        })
+
+        # Each facet ignores its own filter
+        data = self.get('channels', q='eur', country='FR', category='news', facets='true', cursor='')
+        self.assertEqual([channel['xmltv_id'] for channel in data['items']], ['Euronews.fr'])
+        self.assertEqual(data['facets'], {
+            'categories': [{'code': 'news', 'name': 'News', 'count': 1},
+                           {'code': 'sports', 'name': 'Sports', 'count': 1}],
+            'countries': [{'code': 'FR', 'count': 1}],
+        })
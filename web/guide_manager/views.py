@@ -1,13 +1,36 @@
-﻿from django.db.models import Count, Q
+﻿import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count
+from django.http import HttpResponseNotModified
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags, quote_etag
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from math import ceil
 
-from .models import Guide, Channel, Country, Category
+from .catalog import get_catalog
+from .models import Guide, Channel, ChannelCategory, Country, Category
 from .serializers import CountrySerializer, CategorySerializer, ChannelSerializer, GuideSerializer
 from job_manager.models import Job, JobState, JobType
 from job_manager.serializers import JobSerializer
+from main.pagination import is_cursor_request, paginate_by_cursor
+
+
+def conditional_response(request, data):
+    """
+    Build the response of a JSON endpoint with an ETag computed from its data, answering 304 Not Modified when the
+    client already has it. Clients must revalidate before using their copy.
+    """
+    etag = quote_etag(hashlib.sha1(json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()).hexdigest())
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        return HttpResponseNotModified(headers=headers)
+    return Response(data, headers=headers)
 
 
 class CountriesViewSet(viewsets.ReadOnlyModelViewSet):
@@ -26,6 +49,51 @@ class CategoriesViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CategorySerializer
 
 
+def filter_channels(queryset, countries=None, categories=None):
+    """
+    Filter channels by country and category codes, channels matching any of the codes of a filter are kept.
+    Categories are matched through the indexed channel categories.
+    """
+    if countries:
+        queryset = queryset.filter(country__in=countries)
+    if categories:
+        queryset = queryset.filter(
+            id__in=ChannelCategory.objects.filter(category__code__in=categories).values('channel_id')
+        )
+    return queryset
+
+
+def channel_facets(queryset, countries, categories):
+    """
+    Count the channels of each category and country, with two grouped queries.
+
+    Each facet applies the other filters but not its own, so that the counts are those of the values a client may
+    add to the filter.
+
+    Returns:
+        dict: The category (code, name, count) and country (code, count) facets, by decreasing count.
+    """
+    category_channels = filter_channels(queryset, countries=countries)
+    links = ChannelCategory.objects.all()
+    if category_channels.query.has_filters():
+        links = links.filter(channel__in=category_channels.values('id'))
+    category_counts = links.values('category__code', 'category__name').annotate(
+        count=Count('id')
+    ).order_by('-count', 'category__code')
+
+    country_counts = filter_channels(queryset, categories=categories).order_by().values('country').annotate(
+        count=Count('id')
+    ).order_by('-count', 'country')
+
+    return {
+        'categories': [
+            {'code': row['category__code'], 'name': row['category__name'], 'count': row['count']}
+            for row in category_counts
+        ],
+        'countries': [{'code': row['country'], 'count': row['count']} for row in country_counts],
+    }
+
+
 class ChannelsViewSet(viewsets.ViewSet):
     """
     API endpoint for channels.
@@ -35,6 +103,17 @@ class ChannelsViewSet(viewsets.ViewSet):
     def list(self, request):
         """
         Get a paginated list of channels with optional filtering.
+
+        Query Parameters:
+            page: The page number (default: 1)
+            page_size: The page size (default: 20)
+            cursor: Opaque cursor for keyset pagination (optional, an empty value returns the first page).
+                When set, the page number is ignored and the total is only counted with with_total=true
+            q: Search in xmltv_id, name and network (optional)
+            country: Country code, may be repeated (optional)
+            category: Category code, may be repeated (optional)
+            launched_gte: Minimum launch date (optional)
+            facets: Include the number of channels of each category and country (optional, true/false)
         """
         # Validate pagination parameters
         page = int(request.query_params.get('page', 1))
@@ -52,37 +131,33 @@ class ChannelsViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        queryset = Channel.objects.all().order_by('name')
+        queryset = Channel.objects.all()
+        order_by_fields = ['name']
 
-        # Text search in xmltv_id, name, network
+        # Text search in xmltv_id, name, network, most relevant first
         q = request.query_params.get('q')
         if q:
-            queryset = queryset.filter(
-                Q(xmltv_id__icontains=q) | 
-                Q(name__icontains=q) | 
-                Q(network__icontains=q)
-            )
-
-        # Filter by countries
-        countries = request.query_params.getlist('country')
-        if countries:
-            queryset = queryset.filter(country__in=countries)
-
-        # Filter by categories
-        categories = request.query_params.getlist('category')
-        if categories:
-            # Since categories is a comma-separated string, we need to filter differently
-            category_queries = [Q(categories__icontains=category) for category in categories]
-            query = category_queries.pop()
-            for categoryQuery in category_queries:
-                query |= categoryQuery
-            queryset = queryset.filter(query)
+            queryset = queryset.search(q)
+            order_by_fields = ['search_rank'] + order_by_fields
 
         # Filter by launched_at greater than or equal to
         launched_gte = request.query_params.get('launched_gte')
         if launched_gte:
             queryset = queryset.filter(launched_at__gte=launched_gte)
 
+        # Filter by countries and categories (category codes)
+        countries = request.query_params.getlist('country')
+        categories = request.query_params.getlist('category')
+        facets = channel_facets(queryset, countries, categories) \
+            if request.query_params.get('facets', '').lower() == 'true' else None
+        queryset = filter_channels(queryset, countries, categories).order_by(*order_by_fields)
+
+        if is_cursor_request(request):
+            response = paginate_by_cursor(request, queryset, order_by_fields, size, ChannelSerializer)
+            if facets is not None and response.status_code == status.HTTP_200_OK:
+                response.data['facets'] = facets
+            return response
+
         # Get total count
         total_items = queryset.count()
 
@@ -111,6 +186,8 @@ class ChannelsViewSet(viewsets.ViewSet):
             'items': ChannelSerializer(channels, many=True).data,
             'links': {}
         }
+        if facets is not None:
+            response_data['facets'] = facets
 
         # Add pagination links
         if page > 1:
@@ -132,6 +209,16 @@ class GuidesViewSet(viewsets.ViewSet):
     def list(self, request):
         """
         Get a paginated list of guides with optional filtering.
+
+        Query Parameters:
+            page: The page number (default: 1)
+            page_size: The page size (default: 20)
+            cursor: Opaque cursor for keyset pagination (optional, an empty value returns the first page).
+                When set, the page number is ignored and the total is only counted with with_total=true
+            q: Search in site, site_id, site_name, xmltv_id and channel name, by word prefix (optional)
+            lang: Guide language (optional)
+            xmltv_id: Channel xmltv_id (optional)
+            country: Channel country code (optional)
         """
         # Validate pagination parameters
         page = int(request.query_params.get('page', 1))
@@ -150,20 +237,19 @@ class GuidesViewSet(viewsets.ViewSet):
             )
 
         queryset = Guide.objects.all().select_related('channel')
+        order_by_fields = ['site_name']
+        lang = request.query_params.get('lang')
+        country = request.query_params.get('country')
 
-        # Text search in site, site_id, site_name, xmltv_id, channel__name
+        # Text search in site, site_id, site_name, xmltv_id, channel__name, most relevant first. The language
+        # and country filters are applied by the search
         q = request.query_params.get('q')
         if q:
-            queryset = queryset.filter(
-                Q(site__icontains=q) | 
-                Q(site_id__icontains=q) | 
-                Q(site_name__icontains=q) |
-                Q(channel__xmltv_id__icontains=q) |
-                Q(channel__name__icontains=q)
-            )
+            queryset = queryset.search(q, lang=lang, country=country)
+            order_by_fields = ['search_rank'] + order_by_fields
+            lang = country = None
 
         # Filter by language
-        lang = request.query_params.get('lang')
         if lang:
             queryset = queryset.filter(lang=lang)
 
@@ -173,10 +259,13 @@ class GuidesViewSet(viewsets.ViewSet):
             queryset = queryset.filter(xmltv_id=xmltv_id)
 
         # Filter by country
-        country = request.query_params.get('country')
         if country:
             queryset = queryset.filter(channel__country=country)
 
+        queryset = queryset.order_by(*order_by_fields)
+        if is_cursor_request(request):
+            return paginate_by_cursor(request, queryset, order_by_fields, size, GuideSerializer)
+
         # Get total count
         total_items = queryset.count()
 
@@ -185,7 +274,7 @@ class GuidesViewSet(viewsets.ViewSet):
         skip = (page - 1) * size
 
         # Get the guides for the current page
-        guides = queryset.order_by('site_name')[skip:skip+size]
+        guides = queryset[skip:skip+size]
 
         # Create response with pagination links
         base_url = request.build_absolute_uri().split('?')[0]
@@ -222,20 +311,13 @@ class GuidesViewSet(viewsets.ViewSet):
         """
         Get statistics about guides, channels, countries, and categories.
 
+        Counts come from the catalog summary, computed once per EPG data sync. The response has an ETag, so
+        clients polling with If-None-Match get a 304 response while nothing changed.
+
         Returns:
             Response: A response containing counts of entities and job information.
         """
-        # Get counts of entities
-        guides_count = Guide.objects.count()
-        channels_count = Channel.objects.count()
-        countries_count = Country.objects.count()
-        categories_count = Category.objects.count()
-
-        # Get the last completed EPG data sync job
-        last_completed_job = Job.objects.filter(
-            type=JobType.EPG_DATA_SYNC,
-            state=JobState.COMPLETED
-        ).order_by('-updated_at').first()
+        catalog = get_catalog()
 
         # Get the most recent active EPG data sync job
         active_job = Job.objects.filter(
@@ -244,15 +326,15 @@ class GuidesViewSet(viewsets.ViewSet):
         ).order_by('-created_at').first()
 
         response_data = {
-            'guides': guides_count,
-            'channels': channels_count,
-            'countries': countries_count,
-            'categories': categories_count,
-            'last_synced': last_completed_job.updated_at if last_completed_job else None,
+            'guides': catalog['guides'],
+            'channels': catalog['channels'],
+            'countries': catalog['countries'],
+            'categories': catalog['categories'],
+            'last_synced': parse_datetime(catalog['last_synced']) if catalog['last_synced'] else None,
             'active_job': JobSerializer(active_job).data if active_job else None
         }
 
-        return Response(response_data)
+        return conditional_response(request, response_data)
 
     @action(detail=False, methods=['post'])
     def sync(self, request):
@@ -296,9 +378,10 @@ class LanguagesViewSet(viewsets.ViewSet):
     """
 
     def list(self, request):
-        languages = Guide.objects.values('lang').order_by('lang').values_list('lang', flat=True).distinct()
-
+        """
+        Get the languages of the guides, from the catalog summary.
+        """
         response_data = {
-            'items': languages,
+            'items': get_catalog()['languages'],
         }
-        return Response(response_data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return conditional_response(request, response_data)
\ No newline at end of file
@@ -26,7 +26,12 @@ class SyncScheduleSerializer(serializers.Serializer):
     time = serializers.TimeField()
 
 class SettingsSerializer(serializers.Serializer):
-    """Serializer for IPTV settings."""
+    """
+    Serializer for IPTV settings.
+
+    The sync settings are read by the job runner (manage.py runjobs) rather than the web server: saved sync
+    schedules take effect at the runner's next poll, at most JOB_POLL_INTERVAL seconds later.
+    """
     sync_enabled = serializers.BooleanField(default=False)
     sync_schedules = serializers.ListField(
         child=SyncScheduleSerializer(),
@@ -34,6 +39,9 @@ class SettingsSerializer(serializers.Serializer):
     )
     sync_job_max_attempts = serializers.IntegerField(default=3, min_value=1, max_value=100, allow_null=True)
     allow_stream_auto_deletion = serializers.BooleanField(default=True)
+    epg_past_days = serializers.IntegerField(default=1, min_value=0, max_value=30)
+    epg_future_days = serializers.IntegerField(default=14, min_value=1, max_value=30)
+    epg_max_age_hours = serializers.IntegerField(default=24, min_value=1)
 
     def create(self, validated_data):
         """Not used for this serializer."""
@@ -95,7 +95,12 @@ class SettingsView(APIView):
         return Response(serializer.validated_data)
 
     def put(self, request):
-        """Update the settings."""
+        """
+        Update the settings.
+
+        The job runner picks up changed sync schedules at its next poll (JOB_POLL_INTERVAL): the next scheduled
+        sync is then computed from the time of that poll.
+        """
         serializer = SettingsSerializer(data=request.data)
         if serializer.is_valid():
             config_store = ConfigStore()
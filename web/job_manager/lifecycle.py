@@ -0,0 +1,173 @@
+import logging
+import threading
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job, JobState
+
+logger = logging.getLogger(__name__)
+
+# Max attempts of a job that does not define one
+ABSOLUTE_MAX_ATTEMPTS = 100
+# Seconds before retrying a heartbeat that could not be written (e.g. the database was locked by a long write)
+HEARTBEAT_RETRY_DELAY = 1
+
+# Jobs processed by this process, whose heartbeat is refreshed until they complete or fail
+_active_jobs = set()
+_active_jobs_lock = threading.Lock()
+_heartbeat_thread = None
+
+
+def claim_job(job_id) -> Optional[Job]:
+    """
+    Atomically move a queued job to the InProgress state and start a new attempt.
+
+    The transition is a conditional UPDATE on the job state, so a job can only be claimed once even when
+    several processes compete for it.
+
+    Args:
+        job_id: The primary key of the job.
+
+    Returns:
+        Job: The claimed job (with its provider and playlist loaded), or None if it was not queued anymore.
+    """
+    now = timezone.now()
+    claimed = Job.objects.filter(pk=job_id, state=JobState.QUEUED).update(
+        state=JobState.IN_PROGRESS,
+        attempt_count=F('attempt_count') + 1,
+        last_attempt_started_at=now,
+        updated_at=now
+    )
+    if not claimed:
+        return None
+
+    job = Job.objects.select_related('provider', 'playlist').get(pk=job_id)
+    job.status_description = f"Processing job (attempt {job.attempt_count} of {job.max_attempts or 'Unlimited'})"
+    job.save(update_fields=['status_description', 'updated_at'])
+    track_job(job.pk)
+    return job
+
+
+def complete_job(job: Job, success: bool, description: Optional[str]):
+    """
+    Record the outcome of a job that ran to completion.
+
+    Graceful unsuccessful processing fails the job, only errors are retried.
+    """
+    job.state = JobState.COMPLETED if success else JobState.FAILED
+    job.status_description = description
+    job.save(update_fields=['state', 'status_description', 'updated_at'])
+    _untrack_job(job.pk)
+
+
+def fail_job_attempt(job: Job, error: Exception):
+    """
+    Record an error raised while processing a job, queueing it for retry unless its last attempt was reached.
+    """
+    max_attempts = job.max_attempts or ABSOLUTE_MAX_ATTEMPTS
+    if job.attempt_count < max_attempts:
+        job.state = JobState.QUEUED
+        job.status_description = f"Error processing job (attempt {job.attempt_count} of {max_attempts}). Queued for retry"
+    else:
+        job.state = JobState.FAILED
+        job.status_description = f"Error processing job: {str(error).rstrip('.')}. Last attempt reached."
+    job.save(update_fields=['state', 'status_description', 'updated_at'])
+    _untrack_job(job.pk)
+
+
+def track_job(job_pk):
+    """
+    Refresh the heartbeat of an in progress job processed by this process until it completes or fails, so that
+    job runners do not reclaim it as abandoned.
+
+    The heartbeat is the last_attempt_started_at date, moved forward every JOB_HEARTBEAT_INTERVAL seconds.
+    """
+    global _heartbeat_thread
+    with _active_jobs_lock:
+        _active_jobs.add(job_pk)
+        if _heartbeat_thread is None:
+            _heartbeat_thread = threading.Thread(target=_heartbeat, name='job-heartbeat', daemon=True)
+            _heartbeat_thread.start()
+
+
+def _untrack_job(job_pk):
+    with _active_jobs_lock:
+        _active_jobs.discard(job_pk)
+
+
+def tracked_jobs():
+    """
+    Get the primary keys of the in progress jobs processed by this process.
+    """
+    with _active_jobs_lock:
+        return set(_active_jobs)
+
+
+def _heartbeat():
+    event = threading.Event()
+    delay = settings.JOB_HEARTBEAT_INTERVAL
+    while not event.wait(delay):
+        job_pks = tracked_jobs()
+        if not job_pks:
+            continue
+        try:
+            Job.objects.filter(pk__in=job_pks, state=JobState.IN_PROGRESS).update(
+                last_attempt_started_at=timezone.now()
+            )
+            delay = settings.JOB_HEARTBEAT_INTERVAL
+        except Exception:
+            # e.g. the database is locked by a long sync, retried until it gets through rather than at the next
+            # interval, so that the jobs do not look abandoned to other runners
+            logger.exception("Error refreshing the heartbeat of the running jobs")
+            delay = HEARTBEAT_RETRY_DELAY
+        finally:
+            connection.close()
+
+
+def reclaim_stale_jobs(stale_after, job_types=None):
+    """
+    Queue again (or fail, once their last attempt was reached) the in progress jobs whose heartbeat stopped, as the
+    process running them died.
+
+    Each job is reclaimed with a conditional UPDATE on its state and heartbeat, so a job is only reclaimed once even
+    when several runners look for stale jobs, and not at all if its heartbeat moved in the meantime. The jobs still
+    processed by this process are never reclaimed, even when their heartbeat could not be written for a while.
+
+    Args:
+        stale_after (timedelta): Time without heartbeat after which a job is abandoned.
+        job_types (iterable, optional): Only reclaim the jobs of these types, e.g. the types a runner processes, as
+            the jobs of other workers (such as the C# worker) may not refresh a heartbeat.
+
+    Returns:
+        list: The reclaimed jobs.
+    """
+    now = timezone.now()
+    stale_jobs = Job.objects.filter(
+        state=JobState.IN_PROGRESS,
+        last_attempt_started_at__lt=now - stale_after
+    ).exclude(pk__in=tracked_jobs())
+    if job_types is not None:
+        stale_jobs = stale_jobs.filter(type__in=list(job_types))
+
+    reclaimed = []
+    for job in stale_jobs:
+        max_attempts = job.max_attempts or ABSOLUTE_MAX_ATTEMPTS
+        if job.attempt_count < max_attempts:
+            job.state = JobState.QUEUED
+            job.status_description = (f"Job runner stopped responding (attempt {job.attempt_count} of "
+                                      f"{max_attempts}). Queued for retry")
+        else:
+            job.state = JobState.FAILED
+            job.status_description = "Job runner stopped responding. Last attempt reached."
+
+        updated = Job.objects.filter(
+            pk=job.pk, state=JobState.IN_PROGRESS, last_attempt_started_at=job.last_attempt_started_at
+        ).update(state=job.state, status_description=job.status_description, updated_at=now)
+        if updated:
+            logger.warning(f"Reclaimed stale job {job.job_id}: {job.status_description}")
+            reclaimed.append(job)
+    return reclaimed
@@ -0,0 +1,48 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from job_manager.models import JobType
+from job_manager.runner import JobRunner
+from provider_manager.schedule import SyncScheduler
+
+
+def _concurrency(value):
+    job_type, _, limit = value.partition('=')
+    try:
+        return JobType(job_type), int(limit)
+    except ValueError:
+        raise CommandError(f"Invalid concurrency {value!r}, expected TYPE=N with TYPE one of "
+                           f"{', '.join(JobType.values)}")
+
+
+class Command(BaseCommand):
+    help = ('Process the queued jobs, several at once with a concurrency limit per job type. Several runners may run '
+            'side by side, each job is only claimed by one of them. Types limited to 0 are left to another worker '
+            '(e.g. the C# worker), whose jobs are never reclaimed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', action='append', default=[], metavar='TYPE=N',
+                            help='Max number of jobs of a type processed at once, e.g. PlaylistEpgGen=1 (repeatable, 0 to skip the type)')
+        parser.add_argument('--poll-interval', type=int, help='Seconds between polls of the queued jobs (default: the JOB_POLL_INTERVAL setting)')
+        parser.add_argument('--stale-timeout', type=int, help='Seconds without heartbeat after which a running job is queued again (default: the JOB_STALE_TIMEOUT setting)')
+        parser.add_argument('--stagger', type=int, help='Seconds between the scheduled syncs of two providers (default: the PROVIDER_SYNC_STAGGER setting)')
+        parser.add_argument('--no-schedule', action='store_true', help='Do not queue the provider syncs of the sync schedules, e.g. when another runner does')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is queued or running anymore (the sync schedules are not run)')
+
+    def handle(self, *args, **options):
+        runner = JobRunner(
+            concurrency=dict(_concurrency(value) for value in options['concurrency']),
+            poll_interval=options['poll_interval'],
+            stale_timeout=options['stale_timeout'],
+            scheduler=None if options['no_schedule'] or options['once'] else SyncScheduler(stagger=options['stagger'])
+        )
+
+        # Running jobs are completed before exiting, jobs cut off by a hard kill are reclaimed by the next runner
+        def stop(signum, frame):
+            self.stdout.write("Stopping, waiting for the running jobs")
+            runner.stop()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        runner.run(once=options['once'])
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job_manager', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['provider', 'type', 'state', 'updated_at'], name='job_provider_type_state_idx'),
+        ),
+    ]
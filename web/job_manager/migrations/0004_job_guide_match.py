@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job_manager', '0003_job_provider_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='guide_match_overwrite',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='guide_match_threshold',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='type',
+            field=models.CharField(choices=[('ProviderSync', 'Provider Sync'), ('EpgDataSync', 'Epg Data Sync'), ('PlaylistEpgGen', 'Playlist Epg Gen'), ('PlaylistGuideMatch', 'Playlist Guide Match')], editable=False, max_length=20),
+        ),
+    ]
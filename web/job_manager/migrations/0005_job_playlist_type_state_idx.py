@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job_manager', '0004_job_guide_match'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['playlist', 'type', 'state', 'updated_at'], name='job_playlist_type_state_idx'),
+        ),
+    ]
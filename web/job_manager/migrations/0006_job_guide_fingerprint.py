@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job_manager', '0005_job_playlist_type_state_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='guide_fingerprint',
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+    ]
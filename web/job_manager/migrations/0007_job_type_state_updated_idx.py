@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('job_manager', '0006_job_guide_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['type', 'state', 'updated_at'], name='job_type_state_updated_idx'),
+        ),
+    ]
@@ -9,6 +9,7 @@ class JobType(models.TextChoices):
     PROVIDER_SYNC = 'ProviderSync'
     EPG_DATA_SYNC = 'EpgDataSync'
     PLAYLIST_EPG_GEN = 'PlaylistEpgGen'
+    PLAYLIST_GUIDE_MATCH = 'PlaylistGuideMatch'
 
 class JobState(models.TextChoices):
     """
@@ -51,7 +52,7 @@ class Job(models.Model):
         blank=True,
     )
 
-    # PlaylistEpgGen
+    # PlaylistEpgGen, PlaylistGuideMatch
     playlist = models.ForeignKey(
         'playlist_manager.Playlist',
         on_delete=models.CASCADE,
@@ -60,10 +61,21 @@ class Job(models.Model):
         blank=True,
     )
 
+    # PlaylistEpgGen: fingerprint of the guides the playlist EPG is generated from
+    guide_fingerprint = models.CharField(max_length=40, null=True, blank=True)
+
+    # PlaylistGuideMatch
+    guide_match_threshold = models.FloatField(null=True, blank=True)
+    guide_match_overwrite = models.BooleanField(null=True, blank=True)
+
     class Meta:
         indexes = [
             models.Index(fields=['state', 'created_at'], name='job_state_created_idx'),
-            models.Index(fields=['job_id'], name='job_jobid_idx')
+            models.Index(fields=['job_id'], name='job_jobid_idx'),
+            models.Index(fields=['provider', 'type', 'state', 'updated_at'], name='job_provider_type_state_idx'),
+            models.Index(fields=['provider', 'updated_at'], name='job_provider_updated_idx'),
+            models.Index(fields=['playlist', 'type', 'state', 'updated_at'], name='job_playlist_type_state_idx'),
+            models.Index(fields=['type', 'state', 'updated_at'], name='job_type_state_updated_idx')
         ]
 
     def __str__(self):
@@ -0,0 +1,192 @@
+"""
+Job runner processing the queued jobs in a pool of threads.
+
+Jobs are picked up oldest first, up to a concurrency limit per job type, so a long EPG generation does not hold back
+the provider syncs queued after it. Every job is claimed with a conditional UPDATE on its state (see claim_job), so
+several runners, or a runner and the jobs started by the web app, never process the same job twice. Running jobs
+refresh a heartbeat, and the jobs whose heartbeat stopped (their runner died) are queued again. The runner also
+queues the provider syncs of the sync schedules.
+
+Types limited to 0 are left to another worker: the C# worker processes the provider and EPG data syncs next to a
+runner processing the other types (see docker-compose.yml). It neither claims its jobs conditionally nor refreshes
+their heartbeat, so a runner never processes nor reclaims the jobs of the types it leaves to it.
+"""
+import datetime
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple
+
+from django.conf import settings
+from django.db import connection
+
+from guide_manager.sync import EpgDataSynchronizer
+from playlist_manager.grab import SharedEpgGrabber
+from playlist_manager.jobs import run_queued_playlist_guide_match
+from provider_manager.sync import MultiProviderSynchronizer
+from .lifecycle import reclaim_stale_jobs
+from .models import Job, JobState, JobType
+
+logger = logging.getLogger(__name__)
+
+
+class JobHandler(NamedTuple):
+    """
+    Processes the queued jobs of a type.
+    """
+    # Claims and processes the jobs of the given IDs, skipping the jobs that are not queued anymore
+    run: Callable
+    # Max number of jobs of the type processed at once
+    concurrency: int
+    # Whether the jobs picked up together are handed over in a single call (e.g. to share downloads), rather than
+    # processed one per thread
+    batch: bool = False
+
+
+def _run_single(process_job):
+    def run(job_ids):
+        for job_id in job_ids:
+            process_job(job_id)
+    return run
+
+
+JOB_HANDLERS = {
+    JobType.PROVIDER_SYNC: JobHandler(
+        lambda job_ids: MultiProviderSynchronizer().run(job_ids), concurrency=4, batch=True
+    ),
+    # Syncs rewrite the whole guide tables in a single transaction
+    JobType.EPG_DATA_SYNC: JobHandler(
+        _run_single(lambda job_id: EpgDataSynchronizer().run_job(job_id)), concurrency=1
+    ),
+    # Playlists picked up together share a single grab of their guides
+    JobType.PLAYLIST_EPG_GEN: JobHandler(
+        lambda job_ids: SharedEpgGrabber().run(job_ids), concurrency=4, batch=True
+    ),
+    JobType.PLAYLIST_GUIDE_MATCH: JobHandler(
+        _run_single(run_queued_playlist_guide_match), concurrency=2
+    ),
+}
+
+
+class JobRunner:
+    """
+    Polls the queued jobs and processes them with the handler of their type.
+    """
+
+    def __init__(self, concurrency=None, poll_interval=None, stale_timeout=None, scheduler=None):
+        """
+        Args:
+            concurrency (dict, optional): Max number of jobs processed at once by job type, overriding the
+                concurrency of the handlers. Types limited to 0 are not processed.
+            poll_interval (int, optional): Seconds between polls of the queued jobs.
+            stale_timeout (int, optional): Seconds without heartbeat after which a running job is reclaimed.
+            scheduler (SyncScheduler, optional): Queues the jobs of the sync schedules, ticked before each poll.
+        """
+        self.limits = {job_type: handler.concurrency for job_type, handler in JOB_HANDLERS.items()}
+        self.limits.update(concurrency or {})
+        self.poll_interval = poll_interval or settings.JOB_POLL_INTERVAL
+        self.stale_after = datetime.timedelta(seconds=stale_timeout or settings.JOB_STALE_TIMEOUT)
+        self.scheduler = scheduler
+
+        # Jobs handed over to the pool and not done yet, by type
+        self._running = {job_type: set() for job_type in JOB_HANDLERS}
+        self._lock = threading.Lock()
+        # Set to poll again right away, when jobs are done and their slots are free
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def run(self, once=False):
+        """
+        Process the queued jobs until stopped.
+
+        Args:
+            once (bool): Return once no job is queued or running anymore, instead of polling.
+        """
+        max_workers = sum(limit for limit in self.limits.values() if limit > 0)
+        if not max_workers:
+            raise ValueError("No job type can be processed")
+
+        logger.info(f"Job runner starting ({', '.join(f'{t}: {n}' for t, n in self.limits.items())})")
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job-runner') as executor:
+            while not self._stopping.is_set():
+                self._wakeup.clear()
+                timeout = self.poll_interval
+                try:
+                    if self.scheduler is not None:
+                        # Settings changes are picked up here, the wait ends by the next scheduled event
+                        next_event = self.scheduler.tick()
+                        if next_event is not None:
+                            timeout = min(timeout, next_event)
+                    reclaim_stale_jobs(self.stale_after, self._job_types())
+                    dispatched = self._dispatch(executor)
+                except Exception:
+                    # e.g. the database is locked by a long sync, polled again at the next interval
+                    logger.exception("Error polling the queued jobs")
+                    dispatched = 0
+
+                with self._lock:
+                    running = sum(len(job_ids) for job_ids in self._running.values())
+                if once and not dispatched and not running:
+                    break
+                self._wakeup.wait(timeout)
+
+            logger.info("Job runner stopping, waiting for the running jobs")
+        connection.close()
+
+    def stop(self):
+        """
+        Stop picking up jobs. The running jobs are completed before run returns.
+        """
+        self._stopping.set()
+        self._wakeup.set()
+
+    def _job_types(self):
+        return [job_type for job_type, limit in self.limits.items() if limit > 0]
+
+    def _dispatch(self, executor):
+        """
+        Hand the oldest queued jobs of each type over to the pool, up to the free slots of the type.
+
+        Returns:
+            int: The number of dispatched jobs.
+        """
+        with self._lock:
+            free_slots = {
+                job_type: self.limits[job_type] - len(job_ids) for job_type, job_ids in self._running.items()
+            }
+            running_ids = set().union(*self._running.values())
+
+        queued = Job.objects.filter(
+            state=JobState.QUEUED,
+            type__in=[job_type for job_type, slots in free_slots.items() if slots > 0]
+        ).exclude(pk__in=running_ids).order_by('created_at').values_list('pk', 'type')
+
+        picked = {}
+        for job_id, job_type in queued.iterator():
+            job_type = JobType(job_type)
+            job_ids = picked.setdefault(job_type, [])
+            if len(job_ids) < free_slots[job_type]:
+                job_ids.append(job_id)
+
+        for job_type, job_ids in picked.items():
+            with self._lock:
+                self._running[job_type].update(job_ids)
+            if JOB_HANDLERS[job_type].batch:
+                executor.submit(self._run_jobs, job_type, job_ids)
+            else:
+                for job_id in job_ids:
+                    executor.submit(self._run_jobs, job_type, [job_id])
+        return sum(len(job_ids) for job_ids in picked.values())
+
+    def _run_jobs(self, job_type, job_ids):
+        try:
+            logger.info(f"Processing {job_type} jobs {job_ids}")
+            JOB_HANDLERS[job_type].run(job_ids)
+        except Exception:
+            # Handlers record the errors of their jobs, this is an error outside of any job
+            logger.exception(f"Error processing {job_type} jobs {job_ids}")
+        finally:
+            connection.close()
+            with self._lock:
+                self._running[job_type].difference_update(job_ids)
+            self._wakeup.set()
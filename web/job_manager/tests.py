@@ -1,3 +1,47 @@
+import datetime
+
 from django.test import TestCase
+from django.utils import timezone
+
+from .lifecycle import claim_job, complete_job, reclaim_stale_jobs
+from .models import Job, JobState, JobType
+
+
+class ReclaimStaleJobsTests(TestCase):
+
+    def stale_job(self, max_attempts=None, job_type=JobType.EPG_DATA_SYNC):
+        job = Job.objects.create(type=job_type, state=JobState.QUEUED, max_attempts=max_attempts)
+        job = claim_job(job.pk)
+        Job.objects.filter(pk=job.pk).update(last_attempt_started_at=timezone.now() - datetime.timedelta(hours=1))
+        return job
+
+    def test_jobs_of_this_process_are_not_reclaimed(self):
+        job = self.stale_job()
+        self.addCleanup(complete_job, job, True, None)
+
+        self.assertEqual(reclaim_stale_jobs(datetime.timedelta(minutes=5)), [])
+        job.refresh_from_db()
+        self.assertEqual(job.state, JobState.IN_PROGRESS)
+
+    def test_abandoned_jobs_are_reclaimed(self):
+        retried, failed = self.stale_job(), self.stale_job(max_attempts=1)
+        # As if processed by a process that died
+        for job in (retried, failed):
+            complete_job(job, True, None)
+            Job.objects.filter(pk=job.pk).update(state=JobState.IN_PROGRESS)
+
+        reclaimed = reclaim_stale_jobs(datetime.timedelta(minutes=5))
+
+        self.assertEqual({job.pk for job in reclaimed}, {retried.pk, failed.pk})
+        self.assertEqual(Job.objects.get(pk=retried.pk).state, JobState.QUEUED)
+        self.assertEqual(Job.objects.get(pk=failed.pk).state, JobState.FAILED)
+
+    def test_jobs_of_other_workers_are_not_reclaimed(self):
+        job = self.stale_job(job_type=JobType.PROVIDER_SYNC)
+        # As if processed by a worker that does not refresh a heartbeat
+        complete_job(job, True, None)
+        Job.objects.filter(pk=job.pk).update(state=JobState.IN_PROGRESS)
 
-# Create your tests here.
+        stale_after = datetime.timedelta(minutes=5)
+        self.assertEqual(reclaim_stale_jobs(stale_after, [JobType.PLAYLIST_EPG_GEN, JobType.EPG_DATA_SYNC]), [])
+        self.assertEqual([reclaimed.pk for reclaimed in reclaim_stale_jobs(stale_after)], [job.pk])
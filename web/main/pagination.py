@@ -0,0 +1,210 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+CURSOR_QUERY_PARAM = 'cursor'
+TOTAL_QUERY_PARAM = 'with_total'
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a cursor cannot be decoded or does not belong to the requested ordering.
+    """
+
+
+def is_cursor_request(request):
+    """
+    Whether the request opted in to cursor pagination (`?cursor=` with an empty value requests the first page).
+    """
+    return CURSOR_QUERY_PARAM in request.query_params
+
+
+def _encode_value(value):
+    # Keep the full precision of dates, as the cursor is compared for equality
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(ordering, values, reverse=False):
+    """
+    Encode an opaque cursor pointing at the row with the given sort key values.
+    """
+    payload = {'o': ordering, 'v': values}
+    if reverse:
+        payload['r'] = 1
+    data = json.dumps(payload, default=_encode_value, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    """
+    Decode a cursor created by encode_cursor for the same ordering.
+
+    Returns:
+        tuple: The sort key values and whether the cursor seeks backwards.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(data)
+        values = payload['v']
+        reverse = bool(payload.get('r'))
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor('Invalid cursor')
+
+    if payload.get('o') != ordering or not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor('Cursor does not match the requested ordering')
+    return values, reverse
+
+
+class KeysetPaginator:
+    """
+    Keyset (seek) pagination over a queryset.
+
+    Instead of skipping `OFFSET` rows, a page starts right after the sort key of the last row of the previous
+    page, so every page costs the same index range scan as the first one when an index matches the ordering.
+    The primary key is appended to the ordering as a tie breaker so the sort key is unique.
+
+    NULL values are treated as the smallest values, which is how SQLite orders them.
+    """
+
+    def __init__(self, ordering):
+        """
+        Args:
+            ordering (list): Field names to order by, prefixed with '-' for descending order.
+        """
+        self.ordering = list(ordering)
+        if not any(field.lstrip('-') in ('pk', 'id') for field in self.ordering):
+            self.ordering.append('id')
+
+    def paginate(self, queryset, size, cursor=None):
+        """
+        Get a page of rows.
+
+        Args:
+            queryset: The filtered queryset, its ordering is replaced.
+            size (int): The page size.
+            cursor (str, optional): A cursor returned by a previous page, None for the first page.
+
+        Returns:
+            tuple: The rows of the page, the next cursor and the previous cursor (None when there is no such page).
+        """
+        reverse = False
+        if cursor:
+            values, reverse = decode_cursor(cursor, self.ordering)
+            ordering = self._reversed(self.ordering) if reverse else self.ordering
+            queryset = queryset.filter(self._seek(ordering, values))
+        else:
+            ordering = self.ordering
+
+        # Fetch one more row to know whether there is a page after this one
+        rows = list(queryset.order_by(*ordering)[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size]
+
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(cursor)
+
+        next_cursor = encode_cursor(self.ordering, self._values(rows[-1])) if rows and has_next else None
+        previous_cursor = encode_cursor(self.ordering, self._values(rows[0]), reverse=True) if rows and has_previous else None
+        return rows, next_cursor, previous_cursor
+
+    def _values(self, row):
+        return [getattr(row, field.lstrip('-')) for field in self.ordering]
+
+    @staticmethod
+    def _reversed(ordering):
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+    @staticmethod
+    def _seek(ordering, values):
+        """
+        Build the condition selecting the rows that sort strictly after the given sort key.
+
+        For an ordering (a, -b, id) this is:
+            a > va OR (a = va AND b < vb) OR (a = va AND b = vb AND id > vid)
+        """
+        branches = []
+        equal = Q()
+        for field, value in zip(ordering, values):
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+
+            if value is None:
+                # NULL sorts first: only non NULL values follow it in ascending order, none in descending order
+                if not descending:
+                    branches.append(equal & Q(**{f'{name}__isnull': False}))
+                equal &= Q(**{f'{name}__isnull': True})
+            else:
+                after = Q(**{f'{name}__lt' if descending else f'{name}__gt': value})
+                if descending:
+                    after |= Q(**{f'{name}__isnull': True})
+                branches.append(equal & after)
+                equal &= Q(**{name: value})
+
+        condition = branches[0]
+        for branch in branches[1:]:
+            condition |= branch
+
+        # Redundant bound on the leading sort key, lets the database seek the index instead of scanning it
+        name, value = ordering[0].lstrip('-'), values[0]
+        if value is not None:
+            if ordering[0].startswith('-'):
+                condition &= Q(**{f'{name}__lte': value}) | Q(**{f'{name}__isnull': True})
+            else:
+                condition &= Q(**{f'{name}__gte': value})
+        return condition
+
+
+def paginate_by_cursor(request, queryset, ordering, size, serializer_class, prepare_items=None):
+    """
+    Build the response of a cursor paginated list endpoint.
+
+    The exact total is only counted when requested with `?with_total=true`, so deep pages cost the same as the
+    first one. prepare_items, when given, is called with the items of the page before they are serialized.
+
+    Returns:
+        Response: A response containing:
+            - total: The total number of items (only with `with_total=true`)
+            - items: The items of the page
+            - cursors: The next and previous cursors
+            - links: Links to the next and previous pages
+    """
+    try:
+        items, next_cursor, previous_cursor = KeysetPaginator(ordering).paginate(
+            queryset, size, request.query_params.get(CURSOR_QUERY_PARAM) or None
+        )
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if prepare_items:
+        prepare_items(items)
+
+    url = remove_query_param(request.build_absolute_uri(), 'page')
+    response_data = {
+        'items': serializer_class(items, many=True).data,
+        'cursors': {},
+        'links': {}
+    }
+
+    if request.query_params.get(TOTAL_QUERY_PARAM, '').lower() == 'true':
+        response_data['total'] = queryset.count()
+
+    if previous_cursor:
+        response_data['cursors']['previous'] = previous_cursor
+        response_data['links']['previous'] = replace_query_param(url, CURSOR_QUERY_PARAM, previous_cursor)
+
+    if next_cursor:
+        response_data['cursors']['next'] = next_cursor
+        response_data['links']['next'] = replace_query_param(url, CURSOR_QUERY_PARAM, next_cursor)
+
+    return Response(response_data)
@@ -0,0 +1,44 @@
+"""
+Helpers of the full-text searches of the querysets backed by an FTS5 index (provider streams, channels and guides).
+
+Texts are split into word tokens, and every token must match as a prefix of an indexed token. Texts without any
+token (e.g. only punctuation) cannot be matched by the index, a substring search is used instead.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.db.models import F, FloatField, Q, Value
+
+SEARCH_TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def search_tokens(text):
+    """
+    Get the word tokens of a search text.
+    """
+    return SEARCH_TOKEN_PATTERN.findall(text or '')
+
+
+def prefix_query(tokens):
+    """
+    Build the FTS5 query matching every token as a token prefix, e.g. ["cnn", "us"] becomes '"cnn"* "us"*'.
+    """
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def ranked(queryset):
+    """
+    Annotate the rows matched through the index (the `search` relation) with `search_rank`, the BM25 relevance of the
+    match (lower is more relevant).
+    """
+    return queryset.annotate(search_rank=F('search__rank'))
+
+
+def substring_search(queryset, text, fields):
+    """
+    Filter the rows having any of the fields containing the text, annotated with a constant `search_rank` so that
+    results are ordered the same way as ranked ones.
+    """
+    condition = reduce(or_, (Q(**{f'{field}__icontains': text}) for field in fields))
+    return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
@@ -22,6 +22,28 @@ DEBUG = os.environ.get('DEBUG', 'False') == 'True'
 # Config Store
 CONFIG_DIR = os.environ.get('CONFIG_DIR', '../config')
 
+# Number of provider playlists downloaded and parsed concurrently when syncing several providers
+PROVIDER_SYNC_CONCURRENCY = int(os.environ.get('PROVIDER_SYNC_CONCURRENCY', '4'))
+# Seconds between the sync jobs of two providers queued by a sync schedule
+PROVIDER_SYNC_STAGGER = int(os.environ.get('PROVIDER_SYNC_STAGGER', '30'))
+
+# EPG service grabbing the playlist guides
+EPG_SERVICE = os.environ.get('EPG_SERVICE', 'http://localhost:3000')
+# Number of sites grabbed concurrently by a shared EPG grab
+EPG_GRAB_CONCURRENCY = int(os.environ.get('EPG_GRAB_CONCURRENCY', '4'))
+
+# Job runner (manage.py runjobs): seconds between polls of the queued jobs, between heartbeats of the running
+# jobs, and without heartbeat after which a running job is reclaimed
+JOB_POLL_INTERVAL = int(os.environ.get('JOB_POLL_INTERVAL', '15'))
+JOB_HEARTBEAT_INTERVAL = int(os.environ.get('JOB_HEARTBEAT_INTERVAL', '30'))
+JOB_STALE_TIMEOUT = int(os.environ.get('JOB_STALE_TIMEOUT', '300'))
+
+# Header handing the guide.xml downloads off to a front web server, 'X-Sendfile' (Apache, lighttpd) or
+# 'X-Accel-Redirect' (nginx). Empty to send the files from Django.
+EPG_SENDFILE_HEADER = os.environ.get('EPG_SENDFILE_HEADER', '')
+# Internal location of the front web server mapped to CONFIG_DIR, used with X-Accel-Redirect
+EPG_SENDFILE_PREFIX = os.environ.get('EPG_SENDFILE_PREFIX', '/protected/')
+
 ALLOWED_HOSTS = ['*']
 
 # Application definition
@@ -107,6 +129,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(CONFIG_DIR, 'db.sqlite3'),
+        # Seconds a write waits for the lock held by another writer (e.g. jobs run concurrently by the job runner)
+        'OPTIONS': {'timeout': 30},
     }
 }
 
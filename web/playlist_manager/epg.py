@@ -0,0 +1,308 @@
+import datetime
+import gzip
+import logging
+import os
+import re
+import shutil
+import tempfile
+
+import brotli
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from main.utils import ConfigStore
+from .models import Playlist, PlaylistChannel
+from .programmes import ingest_programmes
+from .xmltv import XmltvChannel, postprocess_xmltv
+
+GUIDE_CONTENT_TYPE = 'application/xml'
+# Precompressed variants of guide.xml, by order of preference
+GUIDE_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 6
+RANGE_CHUNK_SIZE = 64 * 1024
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+logger = logging.getLogger(__name__)
+
+# Default window of the post-processed guides, in days before and after the processing date
+DEFAULT_EPG_PAST_DAYS = 1
+DEFAULT_EPG_FUTURE_DAYS = 14
+
+
+def guide_path(playlist_id):
+    """
+    Get the path of the guide.xml file generated for a playlist.
+    """
+    return os.path.join(settings.CONFIG_DIR, f"playlists/{playlist_id}/guide.xml")
+
+
+def grabbed_guide_path(playlist_id):
+    """
+    Get the path of the guide assembled by the generation job, before it is post-processed into guide.xml.
+    """
+    return os.path.join(settings.CONFIG_DIR, f"playlists/{playlist_id}/guide.grabbed.xml")
+
+
+def refresh_epg_metadata(playlists):
+    """
+    Record the guide.xml metadata of the playlists whose EPG was generated since it was last recorded.
+
+    The guide.xml files are written by the job worker, so the file is only looked at once after each completed
+    generation job rather than every time the playlists are listed. Playlists must be annotated by
+    `Playlist.objects.with_summary()`.
+    """
+    for playlist in playlists:
+        if playlist.last_epg_job_at and (playlist.epg_checked_at is None or playlist.epg_checked_at < playlist.last_epg_job_at):
+            record_epg_metadata(playlist, playlist.last_epg_job_at)
+
+
+def record_epg_metadata(playlist: Playlist, checked_at):
+    """
+    Record the modification date and size of the guide.xml file of a playlist.
+    """
+    try:
+        stat = os.stat(guide_path(playlist.id))
+        playlist.epg_generated_at = datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc)
+        playlist.epg_size = stat.st_size
+    except FileNotFoundError:
+        playlist.epg_generated_at = playlist.epg_size = None
+    playlist.epg_checked_at = checked_at
+
+    # Not a change of the playlist itself, updated_at is kept
+    Playlist.objects.filter(pk=playlist.pk).update(
+        epg_generated_at=playlist.epg_generated_at,
+        epg_size=playlist.epg_size,
+        epg_checked_at=playlist.epg_checked_at
+    )
+
+
+def epg_window():
+    """
+    Get the number of past and future days of programmes kept in the playlist guides.
+    """
+    settings_data = ConfigStore().get("iptv:settings") or {}
+    return (
+        settings_data.get("epg_past_days", DEFAULT_EPG_PAST_DAYS),
+        settings_data.get("epg_future_days", DEFAULT_EPG_FUTURE_DAYS)
+    )
+
+
+def guide_channels(playlist: Playlist):
+    """
+    Get the channels of a playlist by guide xmltv_id, identified by their channel number as in the M3U playlist.
+    """
+    rows = PlaylistChannel.objects.filter(playlist=playlist).order_by('order').values_list(
+        'guide__channel_id', 'title', 'provider_stream__title', 'logo_url'
+    )
+
+    channels = {}
+    for number, (xmltv_id, title, stream_title, logo_url) in enumerate(rows, start=playlist.starting_channel_number):
+        if xmltv_id:
+            channels.setdefault(xmltv_id, []).append(XmltvChannel(str(number), title or stream_title, logo_url))
+    return channels
+
+
+def process_guide(playlist: Playlist):
+    """
+    Post-process the guide grabbed for a playlist into its guide.xml file, then ingest its programmes.
+
+    Called by the generation job once the grabbed guide is written, so guide.xml only changes with a generation:
+    changes of the playlist channels and of the window settings apply from the next generation.
+
+    Returns:
+        XmltvStats: The statistics of the post-processed file.
+    """
+    path = guide_path(playlist.id)
+    past_days, future_days = epg_window()
+    now = timezone.now()
+    stats = postprocess_xmltv(
+        grabbed_guide_path(playlist.id), path, guide_channels(playlist),
+        start=now - datetime.timedelta(days=past_days),
+        end=now + datetime.timedelta(days=future_days)
+    )
+    logger.info(f"Guide of playlist {playlist.id} post-processed (channels: {stats.channels}; "
+                f"programmes: {stats.programmes}; skipped programmes: {stats.skipped_programmes})")
+
+    count = ingest_programmes(playlist, path)
+    logger.info(f"Programmes of playlist {playlist.id} ingested ({count} programmes)")
+    return stats
+
+
+def compress_guide(playlist_id):
+    """
+    Write the precompressed variants (guide.xml.br and guide.xml.gz) of the guide.xml file of a playlist, unless they
+    are up to date. Called by the generation job once guide.xml is written, so requests only pick a variant.
+
+    The variants get the modification date of guide.xml, so a variant is stale when the dates differ.
+    """
+    path = guide_path(playlist_id)
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return
+
+    for encoding, suffix in GUIDE_ENCODINGS:
+        variant_path = path + suffix
+        if _is_fresh(variant_path, mtime_ns):
+            continue
+
+        # Unique name, so that concurrent writers never share a temporary file
+        target = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix='.tmp', delete=False)
+        try:
+            with target, open(path, 'rb') as source:
+                if encoding == 'gzip':
+                    with gzip.GzipFile(filename='', mode='wb', compresslevel=GZIP_LEVEL, fileobj=target) as output:
+                        shutil.copyfileobj(source, output, RANGE_CHUNK_SIZE)
+                else:
+                    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+                    while chunk := source.read(RANGE_CHUNK_SIZE):
+                        target.write(compressor.process(chunk))
+                    target.write(compressor.finish())
+            os.utime(target.name, ns=(mtime_ns, mtime_ns))
+            os.replace(target.name, variant_path)
+        finally:
+            if os.path.exists(target.name):
+                os.remove(target.name)
+
+
+def _is_fresh(variant_path, mtime_ns):
+    try:
+        return os.stat(variant_path).st_mtime_ns == mtime_ns
+    except FileNotFoundError:
+        return False
+
+
+def _accepted_encodings(request):
+    encodings = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = part.strip().partition(';')
+        if re.fullmatch(r'\s*q\s*=\s*0(\.0*)?\s*', params):
+            continue
+        encodings.add(name.strip().lower())
+    return encodings
+
+
+def _select_variant(request, path):
+    """
+    Select the up to date variant of guide.xml accepted by the client.
+
+    Returns:
+        tuple: The path of the variant, its content encoding (None for guide.xml) and its stat.
+    """
+    stat = os.stat(path)
+    accepted = _accepted_encodings(request)
+    for encoding, suffix in GUIDE_ENCODINGS:
+        if encoding in accepted or '*' in accepted:
+            try:
+                variant_stat = os.stat(path + suffix)
+            except FileNotFoundError:
+                continue
+            if variant_stat.st_mtime_ns == stat.st_mtime_ns:
+                return path + suffix, encoding, variant_stat
+    return path, None, stat
+
+
+def _parse_range(request, etag, last_modified, size):
+    """
+    Parse the single byte range requested by the client, ignoring it when If-Range does not match the file.
+
+    Returns:
+        tuple: The first and last byte positions, None to send the whole file, or False when not satisfiable.
+    """
+    header = request.META.get('HTTP_RANGE')
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if not match or not any(match.groups()):
+        # Multiple ranges are not supported, the whole file is sent instead
+        return None
+
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        return None
+
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last bytes of the file
+        first, last = max(size - int(last), 0), size - 1
+    else:
+        first, last = int(first), min(int(last), size - 1) if last else size - 1
+    if first > last or first >= size:
+        return False
+    return first, last
+
+
+def _iter_range(path, first, last):
+    with open(path, 'rb') as file:
+        file.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = file.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def guide_response(request, playlist: Playlist):
+    """
+    Build the response sending the guide.xml file of a playlist.
+
+    Supports conditional requests (ETag and Last-Modified), single byte ranges and the precompressed variants chosen
+    by Accept-Encoding, when they are up to date. With EPG_SENDFILE_HEADER set, the bytes are sent by the front web server instead.
+
+    Returns:
+        HttpResponse: The response, None when the playlist has no guide.xml file.
+    """
+    path = guide_path(playlist.id)
+    if not os.path.exists(path):
+        return None
+
+    path, encoding, stat = _select_variant(request, path)
+    # Each variant has its own size, hence its own ETag
+    etag = quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    last_modified = int(stat.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding',
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': f'attachment; filename="playlist_{playlist.id}_guide.xml"',
+    }
+    if encoding:
+        headers['Content-Encoding'] = encoding
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        for header in ('ETag', 'Last-Modified', 'Cache-Control', 'Vary'):
+            not_modified[header] = headers[header]
+        return not_modified
+
+    if settings.EPG_SENDFILE_HEADER:
+        # The front web server sends the file and handles ranges itself
+        if settings.EPG_SENDFILE_HEADER.lower() == 'x-accel-redirect':
+            relative_path = os.path.relpath(path, settings.CONFIG_DIR).replace(os.sep, '/')
+            headers['X-Accel-Redirect'] = settings.EPG_SENDFILE_PREFIX.rstrip('/') + '/' + relative_path
+        else:
+            headers[settings.EPG_SENDFILE_HEADER] = os.path.abspath(path)
+        return HttpResponse(content_type=GUIDE_CONTENT_TYPE, headers=headers)
+
+    byte_range = _parse_range(request, etag, last_modified, stat.st_size)
+    if byte_range is False:
+        return HttpResponse(status=416, headers={'Content-Range': f'bytes */{stat.st_size}', 'ETag': etag})
+    if byte_range:
+        first, last = byte_range
+        headers['Content-Range'] = f'bytes {first}-{last}/{stat.st_size}'
+        headers['Content-Length'] = str(last - first + 1)
+        return StreamingHttpResponse(
+            _iter_range(path, first, last), status=206, content_type=GUIDE_CONTENT_TYPE, headers=headers
+        )
+
+    response = FileResponse(open(path, 'rb'), content_type=GUIDE_CONTENT_TYPE)
+    for header, value in headers.items():
+        response[header] = value
+    return response
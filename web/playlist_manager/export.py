@@ -0,0 +1,113 @@
+import hashlib
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+
+from job_manager.models import Job, JobState, JobType
+from .models import Playlist, PlaylistChannel
+
+# Rendered playlists are kept until their content signature changes
+M3U_CACHE_TIMEOUT = 24 * 60 * 60
+M3U_ITERATOR_CHUNK_SIZE = 2000
+# Channels rendered per chunk of a streamed playlist
+M3U_STREAM_CHUNK_CHANNELS = 500
+
+
+def _m3u_cache_key(playlist_id):
+    return f"playlist_manager:m3u:{playlist_id}"
+
+
+def playlist_etag(playlist: Playlist):
+    """
+    Compute the ETag of the M3U rendering of a playlist from an aggregate signature of its channels, their
+    provider streams and guides, using a single query.
+
+    Any change of a rendered value updates the signature: edits bump updated_at, additions and removals change the
+    count and id sum, and reorders change the order sum or updated_at. Guides only change with EPG data syncs.
+    """
+    signature = PlaylistChannel.objects.filter(playlist=playlist).aggregate(
+        count=Count('id'),
+        id_sum=Sum('id'),
+        order_sum=Sum('order'),
+        guide_sum=Sum('guide_id'),
+        channel_updated_at=Max('updated_at'),
+        stream_updated_at=Max('provider_stream__updated_at'),
+    )
+    last_guide_sync = Job.objects.filter(
+        type=JobType.EPG_DATA_SYNC,
+        state=JobState.COMPLETED
+    ).order_by('-updated_at').values_list('updated_at', flat=True).first()
+
+    content = repr((sorted(signature.items()), playlist.starting_channel_number, last_guide_sync))
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def _attribute(value):
+    # Attribute values are double quoted and entries are single lines
+    return (value or '').replace('"', "'").replace('\r', ' ').replace('\n', ' ')
+
+
+def iter_playlist_m3u(playlist: Playlist):
+    """
+    Render a playlist as M3U, one chunk per channel, reading the channels through a single database cursor.
+
+    Channels whose provider stream is inactive are skipped, the other channels keep their number. Channels with a
+    guide are identified by their number, as in the post-processed guide.xml.
+    """
+    yield b'#EXTM3U\n'
+
+    channels = PlaylistChannel.objects.filter(playlist=playlist).order_by('order').values_list(
+        'title', 'logo_url', 'category', 'guide__channel_id',
+        'provider_stream__title', 'provider_stream__logo_url', 'provider_stream__media_url', 'provider_stream__is_active'
+    )
+
+    # Order keys are sparse, channel numbers follow the position in the playlist
+    rows = channels.iterator(chunk_size=M3U_ITERATOR_CHUNK_SIZE)
+    for number, row in enumerate(rows, start=playlist.starting_channel_number):
+        title, logo_url, category, xmltv_id, stream_title, stream_logo_url, media_url, is_active = row
+        if not is_active:
+            continue
+        name = _attribute(title or stream_title)
+        tvg_id = number if xmltv_id else ''
+        yield (
+            f'#EXTINF:-1 tvg-chno="{number}" tvg-id="{tvg_id}" tvg-name="{name}" '
+            f'tvg-logo="{_attribute(logo_url or stream_logo_url)}" group-title="{_attribute(category)}",{name}\n'
+            f'{media_url.strip()}\n'
+        ).encode()
+
+
+def get_cached_m3u(playlist_id, etag):
+    """
+    Get the cached M3U rendering of a playlist, if it is still the rendering of the given ETag.
+    """
+    cached = cache.get(_m3u_cache_key(playlist_id))
+    if cached and cached[0] == etag:
+        return cached[1]
+    return None
+
+
+async def stream_and_cache_m3u(playlist: Playlist, etag):
+    """
+    Render a playlist as M3U for a streaming response, and cache the rendering under its ETag once fully sent.
+
+    The app is served by daphne (ASGI), which buffers the whole body of a streaming response over a synchronous
+    iterator, so the rendering is an asynchronous iterator. The channels are read in chunks from the single cursor of
+    iter_playlist_m3u, on the thread of the request, whose database connection holds the cursor. The cache is the
+    default, per-process cache, so each server process renders a playlist once per ETag.
+
+    Yields:
+        bytes: Chunks of the M3U file content.
+    """
+    chunks = iter_playlist_m3u(playlist)
+    read = sync_to_async(lambda: b''.join(islice(chunks, M3U_STREAM_CHUNK_CHANNELS)))
+    content = []
+    try:
+        while chunk := await read():
+            content.append(chunk)
+            yield chunk
+    finally:
+        # Releases the cursor when the client disconnected
+        await sync_to_async(chunks.close)()
+    await cache.aset(_m3u_cache_key(playlist.id), (etag, b''.join(content)), M3U_CACHE_TIMEOUT)
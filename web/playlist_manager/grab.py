@@ -0,0 +1,215 @@
+"""
+Shared EPG grab of several playlists.
+
+Playlists often share guides, and the EPG service grabs each posted guide again for every playlist. A shared grab
+posts the stale guides of the playlists once, as one request per site, language and number of days so that sites
+are grabbed in parallel, caches the grabbed days, then assembles the guide.xml file of each playlist from the cache.
+"""
+import datetime
+import logging
+import os
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from job_manager.lifecycle import claim_job, complete_job, fail_job_attempt
+from job_manager.models import Job
+from .epg import compress_guide, epg_window, grabbed_guide_path, process_guide
+from .guide_cache import missing_days, purge_cache, stale_days, store_grab, write_guide
+from .models import PlaylistChannel
+
+logger = logging.getLogger(__name__)
+
+# Grabs take minutes, only connecting to the EPG service is bounded
+EPG_SERVICE_CONNECT_TIMEOUT = 10
+
+
+def _grab_name(site, lang, days):
+    site, lang = (re.sub(r'[^\w.-]', '_', value) for value in (site, lang))
+    return f"site-{site}-{lang}-{days}d"
+
+
+def grab_path(site, lang, days):
+    """
+    Get the path of the file the days of a site in a language are grabbed to by the EPG service.
+    """
+    return os.path.join(settings.CONFIG_DIR, 'grabs', f"{_grab_name(site, lang, days)}.xml")
+
+
+def channels_xml(guides):
+    """
+    Build the channels.xml document of a grab, in the format of the EPG service.
+
+    Args:
+        guides (iterable): (site, site_id, lang, xmltv_id, site_name) tuples.
+    """
+    channels = ET.Element('channels')
+    for site, site_id, lang, xmltv_id, site_name in guides:
+        channel = ET.SubElement(channels, 'channel', {
+            'site': site, 'lang': lang, 'xmltv_id': xmltv_id or '', 'site_id': site_id
+        })
+        channel.text = site_name
+    return ET.tostring(channels, encoding='utf-8', xml_declaration=True)
+
+
+class SharedEpgGrabber:
+    """
+    Generates the EPG of the playlists of several PLAYLIST_EPG_GEN jobs with a single grab of their guides.
+    """
+
+    def __init__(self, service_url=None, concurrency=None):
+        self.service_url = (service_url or settings.EPG_SERVICE).rstrip('/')
+        self.concurrency = concurrency or settings.EPG_GRAB_CONCURRENCY
+
+    def run(self, job_ids):
+        """
+        Claim and process the given queued jobs. Jobs that are not queued anymore are skipped.
+
+        Returns:
+            list: The processed jobs.
+        """
+        jobs = [job for job in map(claim_job, job_ids) if job is not None]
+        if not jobs:
+            return jobs
+
+        start = time.perf_counter()
+        now = timezone.now()
+        today = now.date()
+        past_days, future_days = epg_window()
+        try:
+            playlist_guides, guide_details = self._collect_guides([job.playlist_id for job in jobs])
+            stale = stale_days(guide_details, today, future_days, now)
+
+            # Guides of a site and language needing the same number of days are grabbed together
+            grabs = defaultdict(list)
+            for (site, site_id, lang, xmltv_id), days in stale.items():
+                grabs[(site, lang, days)].append(guide_details[(site, site_id, lang, xmltv_id)])
+            failed_guides, errors = self._grab(grabs, today, now)
+            if guide_details and len(failed_guides) == len(guide_details):
+                raise RuntimeError(f"No site could be grabbed ({'; '.join(errors)})")
+
+            for playlist_id, guides in playlist_guides.items():
+                path = grabbed_guide_path(playlist_id)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                write_guide(path, guides, today - datetime.timedelta(days=past_days),
+                            today + datetime.timedelta(days=future_days - 1))
+            purge_cache(today - datetime.timedelta(days=past_days))
+            missing = missing_days(guide_details, today, future_days)
+        except Exception as e:
+            logger.exception("Error processing the shared EPG grab")
+            for job in jobs:
+                fail_job_attempt(job, e)
+            return jobs
+
+        grabbed = {guide: days for guide, days in stale.items() if guide not in failed_guides}
+        description = (f"Guide generated from a shared grab of {len(jobs)} playlists in "
+                       f"{time.perf_counter() - start:.1f}s: {len(grabbed)} guides grabbed ({sum(grabbed.values())} "
+                       f"days), {len(guide_details) - len(stale)} from cache")
+        if errors:
+            description += f". Failed sites: {'; '.join(errors)}"
+        for job in jobs:
+            try:
+                process_guide(job.playlist)
+                compress_guide(job.playlist_id)
+            except Exception as e:
+                # The previous guide.xml, if any, is kept
+                logger.exception(f"Error post-processing the guide of playlist {job.playlist_id}")
+                fail_job_attempt(job, e)
+                continue
+            if playlist_guides[job.playlist_id] & failed_guides:
+                # Partial guide, the next sync must not skip the playlist as up to date
+                Job.objects.filter(pk=job.pk).update(guide_fingerprint=None)
+            shortfall = self._shortfall(playlist_guides[job.playlist_id], missing, future_days)
+            complete_job(job, True, description + shortfall)
+        return jobs
+
+    @staticmethod
+    def _shortfall(guides, missing, days):
+        """
+        Describe the guides of a playlist missing days of the window (not grabbed yet, or failed).
+        """
+        counts = [missing[guide] for guide in guides if guide in missing]
+        if not counts:
+            return ""
+        return (f". {len(counts)} of {len(guides)} guides miss days of the window "
+                f"(at most {max(counts)} of {days} days)")
+
+    @staticmethod
+    def _collect_guides(playlist_ids):
+        """
+        Get the guides of the playlists with a single query.
+
+        Returns:
+            tuple: The set of (site, site_id, lang, xmltv_id) guides of each playlist ID, and the
+                (site, site_id, lang, xmltv_id, site_name) details of each guide.
+        """
+        rows = PlaylistChannel.objects.filter(playlist_id__in=playlist_ids, guide__isnull=False).values_list(
+            'playlist_id', 'guide__site', 'guide__site_id', 'guide__lang', 'guide__channel_id', 'guide__site_name'
+        ).distinct()
+
+        playlist_guides = {playlist_id: set() for playlist_id in playlist_ids}
+        guide_details = {}
+        for playlist_id, site, site_id, lang, xmltv_id, site_name in rows:
+            playlist_guides[playlist_id].add((site, site_id, lang, xmltv_id))
+            guide_details[(site, site_id, lang, xmltv_id)] = (site, site_id, lang, xmltv_id, site_name)
+        return playlist_guides, guide_details
+
+    def _grab(self, grabs, today, now):
+        """
+        Grab the guides of each (site, lang, days) with concurrent requests to the EPG service, caching each grab
+        once done.
+
+        Returns:
+            tuple: The set of (site, site_id, lang, xmltv_id) guides that could not be grabbed, and the error of each
+                failed grab.
+        """
+        def grab(site, lang, days):
+            url = f"{self.service_url}/grab/{_grab_name(site, lang, days)}"
+            response = requests.post(
+                url,
+                params={'days': days},
+                data=channels_xml(sorted(grabs[(site, lang, days)], key=lambda guide: (guide[1], guide[3] or ''))),
+                headers={'Content-Type': 'application/xml'},
+                timeout=(EPG_SERVICE_CONNECT_TIMEOUT, None)
+            )
+            response.raise_for_status()
+
+        failed_guides, errors = set(), []
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='epg-grab') as executor:
+            futures = {executor.submit(grab, *key): key for key in grabs}
+            for future, (site, lang, days) in futures.items():
+                guides = grabs[(site, lang, days)]
+                try:
+                    future.result()
+                    # Cached from this thread, grab threads do not use the database
+                    count = store_grab(site, lang, grab_path(site, lang, days),
+                                       [(guide[1], guide[3]) for guide in guides], today, days, now)
+                    logger.info(f"Site {site} grabbed ({lang}; {len(guides)} guides; {days} days; "
+                                f"{count} programmes)")
+                except Exception as e:
+                    logger.error(f"Error grabbing site {site} ({lang}; {days} days): {e}")
+                    errors.append(f"{site}: {e}")
+                    failed_guides.update((site, guide[1], lang, guide[3]) for guide in guides)
+        return failed_guides, errors
+
+
+def start_shared_epg_grab(job_ids):
+    """
+    Process queued PLAYLIST_EPG_GEN jobs with a shared grab in a background thread, once the current transaction
+    commits. Jobs claimed by the job worker in the meantime are generated by it instead.
+    """
+    def run():
+        try:
+            SharedEpgGrabber().run(job_ids)
+        finally:
+            connection.close()
+
+    transaction.on_commit(lambda: threading.Thread(target=run, daemon=True).start())
@@ -0,0 +1,298 @@
+"""
+Programme cache of the shared EPG grab, by guide (site, site_id and lang) and UTC day.
+
+The grabber always grabs a number of days starting today, it cannot grab a later day alone. Grabbed days are cached
+until they expire, today sooner than later days whose programmes rarely change, so a regeneration only grabs the
+guides having a missing or expired day, and only up to the last such day. Playlist guides are then assembled from the
+cache.
+
+Each new day adds a missing day at the end of the window, whose grab would take every day before it. The last
+TAIL_GRACE_DAYS days of the window may therefore stay missing or expired: daily regenerations only grab the first days,
+and the tail is grabbed along with the later days once these expire, or once a day of the tail has been uncovered for
+TAIL_MAX_UNCOVERED. Guides missing days of the tail are reported by missing_days.
+"""
+import datetime
+import logging
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, TextField, Value
+from django.db.models.functions import Concat
+
+from .models import GuideDayCache
+from .xmltv import iter_elements, parse_xmltv_time
+
+logger = logging.getLogger(__name__)
+
+TODAY_TTL = datetime.timedelta(hours=6)
+TOMORROW_TTL = datetime.timedelta(hours=24)
+LATER_TTL = datetime.timedelta(hours=72)
+# Days at the end of the window grabbed only along with the days before them, see stale_days
+TAIL_GRACE_DAYS = LATER_TTL.days
+# How long a day of the tail may stay missing or expired
+TAIL_MAX_UNCOVERED = datetime.timedelta(days=TAIL_GRACE_DAYS)
+CACHE_BATCH_SIZE = 500
+
+
+def day_ttl(offset):
+    """
+    Get how long a grabbed day stays fresh, from its current offset to today: a day cached as a later day expires
+    sooner once it becomes tomorrow or today.
+    """
+    if offset <= 0:
+        return TODAY_TTL
+    if offset == 1:
+        return TOMORROW_TTL
+    return LATER_TTL
+
+
+def stale_days(guides, today, days, now):
+    """
+    Find the guides having a missing or expired day before the tail of the window, or a day of the tail uncovered for
+    more than TAIL_MAX_UNCOVERED, with one query per site.
+
+    Args:
+        guides (iterable): (site, site_id, lang, xmltv_id) tuples.
+        today (date): The first day.
+        days (int): The number of days from today the guides must cover.
+        now (datetime): The current date.
+
+    Returns:
+        dict: The number of days to grab of each stale guide, from today up to its last stale day before the tail,
+            or up to its last stale day when the grab reaches the tail anyway or the tail was uncovered for too long.
+    """
+    site_guides = _site_guides(guides)
+    # Offset of the first day of the tail
+    tail = max(days - TAIL_GRACE_DAYS, 1)
+
+    result = {}
+    for site, site_guide_keys in site_guides.items():
+        # Date since which each cached day of the window is expired (in the future when fresh)
+        expires = {
+            (site_id, lang, xmltv_id, day): grabbed_at + day_ttl((day - today).days)
+            for site_id, lang, xmltv_id, day, grabbed_at in _entries(site, site_guide_keys, today, days, 'grabbed_at')
+        }
+
+        for site_id, lang, xmltv_id in site_guide_keys:
+            stale = {}
+            for offset in range(days):
+                day = today + datetime.timedelta(days=offset)
+                # Missing days are uncovered since they entered the window
+                uncovered_since = expires.get((site_id, lang, xmltv_id, day), datetime.datetime.combine(
+                    day - datetime.timedelta(days=days - 1), datetime.time(), tzinfo=datetime.timezone.utc
+                ))
+                if uncovered_since <= now:
+                    stale[offset] = uncovered_since
+            if not stale:
+                continue
+
+            last = max(stale)
+            required = [offset for offset in stale if offset < tail]
+            overdue = any(now - stale[offset] > TAIL_MAX_UNCOVERED for offset in stale if offset >= tail)
+            if overdue or (required and required[-1] == tail - 1):
+                result[(site, site_id, lang, xmltv_id)] = last + 1
+            elif required:
+                result[(site, site_id, lang, xmltv_id)] = required[-1] + 1
+    return result
+
+
+def missing_days(guides, today, days):
+    """
+    Count the days of the window missing from the cache of each guide, whose assembled guide is therefore shorter
+    than the window.
+
+    Args:
+        guides (iterable): (site, site_id, lang, xmltv_id) tuples.
+        today (date): The first day.
+        days (int): The number of days from today the guides should cover.
+
+    Returns:
+        dict: The number of missing days of each guide missing days.
+    """
+    result = {}
+    for site, site_guide_keys in _site_guides(guides).items():
+        cached = defaultdict(int)
+        for site_id, lang, xmltv_id, _ in _entries(site, site_guide_keys, today, days):
+            cached[(site_id, lang, xmltv_id)] += 1
+        for site_id, lang, xmltv_id in site_guide_keys:
+            if cached[(site_id, lang, xmltv_id)] < days:
+                result[(site, site_id, lang, xmltv_id)] = days - cached[(site_id, lang, xmltv_id)]
+    return result
+
+
+def _site_guides(guides):
+    site_guides = defaultdict(set)
+    for site, site_id, lang, xmltv_id in guides:
+        site_guides[site].add((site_id, lang, xmltv_id))
+    return site_guides
+
+
+def _entries(site, site_guide_keys, today, days, *fields):
+    """
+    Get the cached days of the window of guides of a site, as (site_id, lang, xmltv_id, day, *fields) tuples.
+    """
+    entries = GuideDayCache.objects.filter(
+        site=site,
+        site_id__in={site_id for site_id, _, _ in site_guide_keys},
+        day__range=(today, today + datetime.timedelta(days=days - 1))
+    ).values_list('site_id', 'lang', 'xmltv_id', 'day', *fields)
+    return [entry for entry in entries if entry[:3] in site_guide_keys]
+
+
+def store_grab(site, lang, path, guides, today, days, now):
+    """
+    Cache the days grabbed for guides of a site in a language, replacing their previous entries.
+
+    The entries are first reset, then the programmes are appended to the entry of their day in batches while the
+    file is parsed, so memory use does not depend on the size of the grab. Everything is written in one transaction:
+    a grab that cannot be cached in full leaves the previous entries.
+
+    Programmes starting outside of the grabbed days are ignored, as they would replace cached days with a partial
+    day. Grabbed days without programmes are cached as well, so they are not grabbed again until they expire.
+
+    Args:
+        site (str): The site.
+        lang (str): The language of the guides.
+        path (str): The file written by the grabber.
+        guides (iterable): The grabbed (site_id, xmltv_id) guides.
+        today (date): The first grabbed day.
+        days (int): The number of grabbed days.
+        now (datetime): The grab date.
+
+    Returns:
+        int: The number of cached programmes.
+    """
+    site_ids = defaultdict(list)
+    for site_id, xmltv_id in guides:
+        site_ids[xmltv_id].append(site_id)
+    last_day = today + datetime.timedelta(days=days - 1)
+
+    entries = [
+        GuideDayCache(
+            site=site,
+            site_id=site_id,
+            lang=lang,
+            day=today + datetime.timedelta(days=offset),
+            xmltv_id=xmltv_id,
+            channel=None,
+            programmes='',
+            grabbed_at=now
+        )
+        for site_id, xmltv_id in guides
+        for offset in range(days)
+    ]
+
+    # Programmes not written yet, by (site_id, day)
+    pending = defaultdict(list)
+    pending_count = count = 0
+    with transaction.atomic():
+        GuideDayCache.objects.bulk_create(
+            entries,
+            batch_size=CACHE_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['site', 'site_id', 'lang', 'day'],
+            update_fields=['xmltv_id', 'channel', 'programmes', 'grabbed_at']
+        )
+
+        for element in iter_elements(path):
+            if element.tag == 'channel':
+                xmltv_id = element.get('id')
+            elif element.tag == 'programme':
+                xmltv_id = element.get('channel')
+            else:
+                continue
+            if xmltv_id not in site_ids:
+                continue
+
+            element.tail = '\n'
+            xml = ET.tostring(element, encoding='unicode')
+            if element.tag == 'channel':
+                GuideDayCache.objects.filter(
+                    site=site, site_id__in=site_ids[xmltv_id], lang=lang, day__range=(today, last_day)
+                ).update(channel=xml)
+                continue
+
+            start = parse_xmltv_time(element.get('start'))
+            if start is None:
+                continue
+            day = start.astimezone(datetime.timezone.utc).date()
+            if today <= day <= last_day:
+                for site_id in site_ids[xmltv_id]:
+                    pending[(site_id, day)].append(xml)
+                    pending_count += 1
+                count += 1
+                if pending_count >= CACHE_BATCH_SIZE:
+                    _append_programmes(site, lang, pending)
+                    pending.clear()
+                    pending_count = 0
+        _append_programmes(site, lang, pending)
+    return count
+
+
+def _append_programmes(site, lang, pending):
+    """
+    Append programmes to their cached days, with one UPDATE per day of a guide. The grabber writes the programmes of
+    a channel one after the other, so a batch only spans a few days.
+    """
+    for (site_id, day), programmes in pending.items():
+        GuideDayCache.objects.filter(site=site, site_id=site_id, lang=lang, day=day).update(
+            programmes=Concat(F('programmes'), Value(''.join(programmes)), output_field=TextField())
+        )
+
+
+def write_guide(target_path, guides, first_day, last_day):
+    """
+    Assemble an XMLTV file from the cached days of guides, in the grabber format, writing it atomically.
+
+    Args:
+        target_path (str): The XMLTV file.
+        guides (iterable): (site, site_id, lang, xmltv_id) tuples.
+        first_day (date): The first day of programmes.
+        last_day (date): The last day of programmes.
+    """
+    site_guides = _site_guides(guides)
+
+    def entries(site, *fields):
+        return GuideDayCache.objects.filter(
+            site=site,
+            site_id__in={site_id for site_id, _, _ in site_guides[site]},
+            day__range=(first_day, last_day)
+        ).values_list('site_id', 'lang', 'xmltv_id', *fields)
+
+    output = tempfile.NamedTemporaryFile(
+        'w', encoding='utf-8', dir=os.path.dirname(target_path), suffix='.tmp', delete=False
+    )
+    try:
+        with output:
+            output.write('<?xml version="1.0" encoding="UTF-8"?>\n<tv>\n')
+            # Channels come first, from the last grab of each guide
+            for site in site_guides:
+                written = set()
+                rows = entries(site, 'channel').exclude(channel__isnull=True).order_by('site_id', '-grabbed_at')
+                for site_id, lang, xmltv_id, channel in rows:
+                    if (site_id, lang, xmltv_id) in site_guides[site] and (site_id, lang) not in written:
+                        output.write(channel)
+                        written.add((site_id, lang))
+
+            # Programmes of a guide follow each other by day, as the post-processor expects
+            for site in site_guides:
+                rows = entries(site, 'programmes').order_by('site_id', 'lang', 'day').iterator()
+                for site_id, lang, xmltv_id, programmes in rows:
+                    if (site_id, lang, xmltv_id) in site_guides[site]:
+                        output.write(programmes)
+            output.write('</tv>\n')
+        os.replace(output.name, target_path)
+    finally:
+        if os.path.exists(output.name):
+            os.remove(output.name)
+
+
+def purge_cache(before_day):
+    """
+    Delete the cached days before a day.
+    """
+    deleted, _ = GuideDayCache.objects.filter(day__lt=before_day).delete()
+    return deleted
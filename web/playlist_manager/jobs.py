@@ -0,0 +1,215 @@
+import datetime
+import hashlib
+import logging
+from typing import NamedTuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from guide_manager.matching import guide_matcher
+from guide_manager.models import Guide
+from job_manager.lifecycle import claim_job, complete_job, fail_job_attempt
+from job_manager.models import Job, JobState, JobType
+from main.utils import ConfigStore
+from .models import Playlist, PlaylistChannel
+
+logger = logging.getLogger(__name__)
+
+# Minimum match score applied by default: a full token overlap scores 1, an exact tvg_id hit adds 2
+DEFAULT_GUIDE_MATCH_THRESHOLD = 0.6
+# Number of channels matched between two progress updates of a guide match job
+GUIDE_MATCH_BATCH_SIZE = 250
+# Age after which the EPG of a playlist is generated again, even when its guides did not change
+DEFAULT_EPG_MAX_AGE_HOURS = 24
+
+
+class GuideMatch(NamedTuple):
+    """
+    Best guide found for a playlist channel.
+    """
+    channel: PlaylistChannel
+    guide_id: int
+    score: float
+
+
+def guide_fingerprints(playlist_ids):
+    """
+    Compute the fingerprint of the guides assigned to the channels of several playlists, with a single query.
+
+    The fingerprint covers the (site, site_id, lang, xmltv_id) set sent to the EPG grabber, so it only changes when
+    the grabbed guides change, not when channels are reordered or renamed.
+
+    Returns:
+        dict: The fingerprint of each playlist ID.
+    """
+    fields = ['playlist_id', 'guide__site', 'guide__site_id', 'guide__lang', 'guide__channel_id']
+    rows = PlaylistChannel.objects.filter(
+        playlist_id__in=playlist_ids,
+        guide__isnull=False
+    ).values_list(*fields).distinct().order_by(*fields)
+
+    hashes = {playlist_id: hashlib.sha1() for playlist_id in playlist_ids}
+    for playlist_id, *guide in rows:
+        hashes[playlist_id].update(repr(guide).encode())
+    return {playlist_id: digest.hexdigest() for playlist_id, digest in hashes.items()}
+
+
+def enqueue_epg_generation(playlist: Playlist, fingerprint, force=False):
+    """
+    Queue a PLAYLIST_EPG_GEN job for a playlist, unless one is already queued or in progress, or the last generated
+    EPG is from the same guides and is not older than the max age setting.
+
+    Args:
+        playlist: The playlist.
+        fingerprint (str): The current fingerprint of the playlist guides, see guide_fingerprints.
+        force (bool): Whether to generate the EPG even if it is up to date.
+
+    Returns:
+        tuple: The queued, active or last completed job, and whether it was created.
+    """
+    active_job = playlist.jobs.filter(
+        type=JobType.PLAYLIST_EPG_GEN,
+        state__in=[JobState.QUEUED, JobState.IN_PROGRESS]
+    ).order_by('created_at').first()
+    if active_job:
+        return active_job, False
+
+    if not force:
+        settings_data = ConfigStore().get("iptv:settings") or {}
+        max_age = datetime.timedelta(hours=settings_data.get("epg_max_age_hours", DEFAULT_EPG_MAX_AGE_HOURS))
+        last_job = playlist.jobs.filter(
+            type=JobType.PLAYLIST_EPG_GEN,
+            state=JobState.COMPLETED
+        ).order_by('-updated_at').first()
+        if last_job and last_job.guide_fingerprint == fingerprint and last_job.updated_at > timezone.now() - max_age:
+            return last_job, False
+
+    job = playlist.jobs.create(
+        type=JobType.PLAYLIST_EPG_GEN,
+        state=JobState.QUEUED,
+        max_attempts=1,  # when running manual sync, allow one failure only
+        guide_fingerprint=fingerprint
+    )
+    return job, True
+
+
+def match_playlist_guides(playlist: Playlist, threshold=DEFAULT_GUIDE_MATCH_THRESHOLD, overwrite=False,
+                          on_progress=None):
+    """
+    Find the best guide of each channel of a playlist in one pass over the guide matching index.
+
+    Args:
+        playlist: The playlist.
+        threshold (float): The minimum score of a match.
+        overwrite (bool): Whether to also match the channels that already have a guide.
+        on_progress (callable, optional): Called with the number of matched and total channels after each batch.
+
+    Returns:
+        list: The GuideMatch of each channel with a match above the threshold, in playlist order.
+    """
+    channels = PlaylistChannel.objects.filter(playlist=playlist).select_related('provider_stream').order_by('order')
+    if not overwrite:
+        channels = channels.filter(guide__isnull=True)
+    channels = list(channels)
+
+    matches = []
+    for start in range(0, len(channels), GUIDE_MATCH_BATCH_SIZE):
+        batch = channels[start:start + GUIDE_MATCH_BATCH_SIZE]
+        results = guide_matcher.match_many(
+            [(channel.title or channel.provider_stream.title, channel.provider_stream.tvg_id) for channel in batch]
+        )
+        for channel, result in zip(batch, results):
+            if result and result[0][1] >= threshold:
+                guide_id, score = result[0]
+                matches.append(GuideMatch(channel, guide_id, score))
+
+        if on_progress:
+            on_progress(start + len(batch), len(channels))
+
+    return matches
+
+
+@transaction.atomic
+def apply_guide_matches(matches):
+    """
+    Assign the matched guides to their channels in a single transaction.
+
+    Returns:
+        int: The number of updated channels.
+    """
+    # Guides may have been removed by an EPG data sync since they were matched
+    existing_ids = set(Guide.objects.filter(pk__in={match.guide_id for match in matches}).values_list('id', flat=True))
+
+    now = timezone.now()
+    channels = []
+    for match in matches:
+        if match.guide_id in existing_ids and match.channel.guide_id != match.guide_id:
+            match.channel.guide_id = match.guide_id
+            match.channel.updated_at = now
+            channels.append(match.channel)
+
+    PlaylistChannel.objects.bulk_update(channels, ['guide', 'updated_at'], batch_size=500)
+    return len(channels)
+
+
+def run_playlist_guide_match(job: Job):
+    """
+    Process a PLAYLIST_GUIDE_MATCH job, reporting the matching progress in the job status.
+
+    Returns:
+        tuple: Whether the job succeeded, and a status description.
+    """
+    def on_progress(matched, total):
+        Job.objects.filter(pk=job.pk).update(
+            status_description=f"Matching guides ({matched} of {total} channels)",
+            updated_at=timezone.now()
+        )
+
+    threshold = job.guide_match_threshold if job.guide_match_threshold is not None else DEFAULT_GUIDE_MATCH_THRESHOLD
+    matches = match_playlist_guides(job.playlist, threshold, bool(job.guide_match_overwrite), on_progress)
+    updated = apply_guide_matches(matches)
+    return True, f"Guides matched ({len(matches)} matched; {updated} updated)"
+
+
+def start_playlist_guide_match(playlist: Playlist, threshold, overwrite):
+    """
+    Queue a PLAYLIST_GUIDE_MATCH job for a playlist, processed by the job runner, unless one is already active.
+
+    Returns:
+        tuple: The queued (or already active) job, and whether it was created.
+    """
+    active_job = playlist.jobs.filter(
+        type=JobType.PLAYLIST_GUIDE_MATCH,
+        state__in=[JobState.QUEUED, JobState.IN_PROGRESS]
+    ).first()
+    if active_job:
+        return active_job, False
+
+    job = playlist.jobs.create(
+        type=JobType.PLAYLIST_GUIDE_MATCH,
+        state=JobState.QUEUED,
+        max_attempts=1,
+        guide_match_threshold=threshold,
+        guide_match_overwrite=overwrite
+    )
+    return job, True
+
+
+def run_queued_playlist_guide_match(job_id):
+    """
+    Claim and process a queued PLAYLIST_GUIDE_MATCH job.
+
+    Returns:
+        Job: The processed job, None if it was not queued anymore.
+    """
+    job = claim_job(job_id)
+    if job is None:
+        return None
+
+    try:
+        success, description = run_playlist_guide_match(job)
+        complete_job(job, success, description)
+    except Exception as e:
+        logger.exception(f"Error processing job {job.job_id}")
+        fail_job_attempt(job, e)
+    return job
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from job_manager.models import JobState
+from playlist_manager.grab import SharedEpgGrabber
+from playlist_manager.jobs import enqueue_epg_generation, guide_fingerprints
+from playlist_manager.models import Playlist
+
+
+class Command(BaseCommand):
+    help = ('Generate the EPG of several playlists with a single grab of their guides. Each site is grabbed once, '
+            'in parallel, and the result is split per playlist.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('playlist_ids', nargs='*', type=int, help='IDs of the playlists (default: all playlists)')
+        parser.add_argument('--force', action='store_true', help='Generate the EPG even if it is up to date')
+        parser.add_argument('--epg-service', help='Base URL of the EPG service (default: the EPG_SERVICE setting)')
+        parser.add_argument('--concurrency', type=int, help='Max number of sites grabbed concurrently')
+
+    def handle(self, *args, **options):
+        playlists = Playlist.objects.order_by('name')
+        if options['playlist_ids']:
+            playlists = playlists.filter(pk__in=options['playlist_ids'])
+        playlists = list(playlists)
+        fingerprints = guide_fingerprints([playlist.id for playlist in playlists])
+
+        job_ids = []
+        for playlist in playlists:
+            job, created = enqueue_epg_generation(playlist, fingerprints[playlist.id], force=options['force'])
+            if created:
+                job_ids.append(job.pk)
+            elif job.state == JobState.COMPLETED:
+                self.stdout.write(f"Skipping playlist {playlist.id}: guide is up to date")
+            else:
+                self.stdout.write(self.style.WARNING(f"Skipping playlist {playlist.id}: job {job.job_id} is already {job.state}"))
+
+        grabber = SharedEpgGrabber(service_url=options['epg_service'], concurrency=options['concurrency'])
+        for job in grabber.run(job_ids):
+            style = self.style.SUCCESS if job.state == JobState.COMPLETED else self.style.ERROR
+            self.stdout.write(style(f"Playlist {job.playlist_id}: {job.state} - {job.status_description}"))
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+# Frozen copy of playlist_manager.ordering.ORDER_KEY_GAP
+ORDER_KEY_GAP = 1024
+
+
+def compact_playlists(apps, schema_editor, gap):
+    """
+    Re-space the order keys of every playlist by gap, keeping the channel order. Keys are first set to the negated
+    positions so that the unique (playlist, order) constraint holds after each statement.
+    """
+    Playlist = apps.get_model('playlist_manager', 'Playlist')
+    table = apps.get_model('playlist_manager', 'PlaylistChannel')._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        for playlist_id in Playlist.objects.values_list('id', flat=True):
+            cursor.execute(
+                f"""
+                UPDATE {table} SET "order" = -positions.position
+                FROM (
+                    SELECT id, ROW_NUMBER() OVER (ORDER BY "order") AS position
+                    FROM {table} WHERE playlist_id = %s
+                ) AS positions
+                WHERE {table}.id = positions.id
+                """,
+                [playlist_id]
+            )
+            cursor.execute(
+                f'UPDATE {table} SET "order" = -"order" * %s WHERE playlist_id = %s',
+                [gap, playlist_id]
+            )
+
+
+def space_order_keys(apps, schema_editor):
+    """
+    Turn the dense channel positions into order keys spaced by ORDER_KEY_GAP.
+    """
+    compact_playlists(apps, schema_editor, ORDER_KEY_GAP)
+
+
+def densify_order_keys(apps, schema_editor):
+    compact_playlists(apps, schema_editor, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlist_manager', '0001_initial'),
+        # Merging duplicate streams renumbers the affected playlists densely
+        ('provider_manager', '0003_provider_stream_natural_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(space_order_keys, reverse_code=densify_order_keys),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlist_manager', '0002_sparse_channel_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlist',
+            name='epg_checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='epg_generated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='playlist',
+            name='epg_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
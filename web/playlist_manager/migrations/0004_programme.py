@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlist_manager', '0003_playlist_epg_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlist',
+            name='programme_generation',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='Programme',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('stop', models.DateTimeField()),
+                ('title', models.CharField(max_length=255)),
+                ('sub_title', models.CharField(blank=True, max_length=255, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('category', models.CharField(blank=True, max_length=255, null=True)),
+                ('icon_url', models.TextField(blank=True, null=True)),
+                ('generation', models.IntegerField()),
+                ('channel', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='programmes', to='playlist_manager.playlistchannel')),
+                ('playlist', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='programmes', to='playlist_manager.playlist')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['playlist', 'channel', 'stop'], name='programme_channel_stop_idx'), models.Index(fields=['playlist', 'generation'], name='programme_generation_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='programme',
+            constraint=models.UniqueConstraint(fields=('channel', 'start', 'stop'), name='unique_programme_channel_time'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlist_manager', '0004_programme'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GuideDayCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site', models.CharField(max_length=255)),
+                ('site_id', models.CharField(max_length=255)),
+                ('lang', models.CharField(max_length=20)),
+                ('day', models.DateField()),
+                ('xmltv_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('channel', models.TextField(blank=True, null=True)),
+                ('programmes', models.TextField(blank=True, default='')),
+                ('grabbed_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='guide_day_cache_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='guidedaycache',
+            constraint=models.UniqueConstraint(fields=('site', 'site_id', 'lang', 'day'), name='unique_guide_day_cache'),
+        ),
+    ]
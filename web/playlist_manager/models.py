@@ -1,9 +1,34 @@
 ﻿from django.db import models
+from django.db.models import Count, OuterRef, Q, Subquery
 from django.core.validators import URLValidator
+from job_manager.models import Job, JobState, JobType
 from provider_manager.models import ProviderStream
 from guide_manager.models import Guide
 
 
+class PlaylistQuerySet(models.QuerySet):
+    """
+    QuerySet for playlists.
+    """
+
+    def with_summary(self):
+        """
+        Annotate each playlist with its channel counts, from one grouped aggregate, and the date of its last EPG
+        generation, so that listing playlists costs a single query regardless of how many playlists there are.
+        """
+        last_epg_generated = Job.objects.filter(
+            playlist=OuterRef('pk'),
+            type=JobType.PLAYLIST_EPG_GEN,
+            state=JobState.COMPLETED
+        ).order_by('-updated_at').values('updated_at')[:1]
+
+        return self.annotate(
+            channel_count=Count('channels'),
+            inactive_channel_count=Count('channels', filter=Q(channels__provider_stream__is_active=False)),
+            last_epg_job_at=Subquery(last_epg_generated)
+        )
+
+
 class Playlist(models.Model):
     """
     Model representing a playlist.
@@ -14,6 +39,15 @@ class Playlist(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Metadata of the generated guide.xml file, recorded once per EPG generation job
+    epg_generated_at = models.DateTimeField(null=True, blank=True)
+    epg_size = models.BigIntegerField(null=True, blank=True)
+    epg_checked_at = models.DateTimeField(null=True, blank=True)
+    # Generation of the programmes ingested from guide.xml
+    programme_generation = models.IntegerField(null=True, blank=True)
+
+    objects = PlaylistQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -58,3 +92,75 @@ class PlaylistChannel(models.Model):
 
     def __str__(self):
         return self.title or self.provider_stream.title
+
+
+class Programme(models.Model):
+    """
+    Model representing a programme of a playlist channel, ingested from the playlist guide.xml.
+
+    Foreign keys have no database constraint: channels are also deleted by the job worker, which does not know
+    about programmes. Programmes of deleted channels are removed by the next ingestion.
+    """
+    playlist = models.ForeignKey(
+        Playlist,
+        on_delete=models.CASCADE,
+        related_name='programmes',
+        db_constraint=False
+    )
+    channel = models.ForeignKey(
+        PlaylistChannel,
+        on_delete=models.CASCADE,
+        related_name='programmes',
+        db_constraint=False
+    )
+    start = models.DateTimeField()
+    stop = models.DateTimeField()
+    title = models.CharField(max_length=255)
+    sub_title = models.CharField(max_length=255, null=True, blank=True)
+    description = models.TextField(null=True, blank=True)
+    category = models.CharField(max_length=255, null=True, blank=True)
+    icon_url = models.TextField(null=True, blank=True)
+    # Ingestion that added or last updated the programme
+    generation = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['playlist', 'channel', 'stop'], name='programme_channel_stop_idx'),
+            models.Index(fields=['playlist', 'generation'], name='programme_generation_idx')
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['channel', 'start', 'stop'], name='unique_programme_channel_time')
+        ]
+
+    def __str__(self):
+        return f"{self.title} ({self.start} - {self.stop})"
+
+
+class GuideDayCache(models.Model):
+    """
+    Model representing the programmes grabbed for a guide on a day (UTC), kept to assemble playlist guides without
+    grabbing the day again until it expires.
+
+    Guides are identified by their site, site_id and lang rather than a foreign key, as EPG data syncs recreate
+    guides.
+    """
+    site = models.CharField(max_length=255)
+    site_id = models.CharField(max_length=255)
+    lang = models.CharField(max_length=20)
+    day = models.DateField()
+    # Channel id of the cached elements, the day is grabbed again when the guide xmltv_id changes
+    xmltv_id = models.CharField(max_length=255, null=True, blank=True)
+    channel = models.TextField(null=True, blank=True)
+    programmes = models.TextField(blank=True, default='')
+    grabbed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['site', 'site_id', 'lang', 'day'], name='unique_guide_day_cache')
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='guide_day_cache_day_idx')
+        ]
+
+    def __str__(self):
+        return f"{self.site}/{self.site_id}/{self.lang} ({self.day})"
@@ -0,0 +1,162 @@
+"""
+Sparse ordering of playlist channels.
+
+PlaylistChannel.order is a sort key spaced by ORDER_KEY_GAP rather than the channel position, so moving a channel
+only rewrites the moved row: its new key is the midpoint of its new neighbours' keys. When a gap runs out, the keys
+of the playlist are re-spaced (compacted) by the move itself, once gaps get small or when it finds no room left.
+Compacting is a single UPDATE ... FROM run in the transaction of the move, so it never races other moves.
+
+Clients only see dense positions (1, 2, 3...), computed from the keys.
+"""
+import logging
+
+from django.db import connection
+from django.db.models import Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import PlaylistChannel
+
+logger = logging.getLogger(__name__)
+
+ORDER_KEY_GAP = 1024
+# Gap between neighbouring keys below which a move compacts the playlist
+COMPACTION_GAP_THRESHOLD = 8
+
+
+def next_order_key(playlist_id):
+    """
+    Get the key appending a channel at the end of a playlist.
+    """
+    last = PlaylistChannel.objects.filter(playlist_id=playlist_id).order_by('-order').values_list('order', flat=True).first()
+    return ORDER_KEY_GAP if last is None else last + ORDER_KEY_GAP
+
+
+def append_streams(playlist_id, streams, order_by, category=None):
+    """
+    Append provider streams to the end of a playlist as new channels, with a single INSERT ... SELECT.
+
+    Args:
+        playlist_id (int): The playlist ID.
+        streams: A ProviderStream queryset, excluding the streams already in the playlist.
+        order_by (list): The expressions ordering the new channels.
+        category (str, optional): The category of the new channels.
+
+    Returns:
+        int: The number of added channels.
+    """
+    table = PlaylistChannel._meta.db_table
+    streams = streams.annotate(position=Window(RowNumber(), order_by=order_by)).values_list('id', 'position')
+    streams_sql, streams_params = streams.query.sql_with_params()
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (playlist_id, provider_stream_id, "order", category, created_at, updated_at)
+            SELECT %s, streams.id, last.key + streams.position * %s, %s, %s, %s
+            FROM ({streams_sql}) AS streams, (
+                SELECT COALESCE(MAX("order"), 0) AS key FROM {table} WHERE playlist_id = %s
+            ) AS last
+            """,
+            [playlist_id, ORDER_KEY_GAP, category, now, now, *streams_params, playlist_id]
+        )
+        return cursor.rowcount
+
+
+def channel_position(channel: PlaylistChannel):
+    """
+    Get the dense (1-based) position of a channel in its playlist.
+    """
+    return PlaylistChannel.objects.filter(playlist_id=channel.playlist_id, order__lt=channel.order).count() + 1
+
+
+def move_channel(channel: PlaylistChannel, position):
+    """
+    Move a channel to a dense (1-based) position of its playlist, only updating the channel row unless the keys
+    around the position must be compacted, before the move when there is no room left, or after it when the gaps left
+    are small.
+
+    Must run in a transaction. Positions past the end move the channel last.
+
+    Returns:
+        bool: Whether the playlist was compacted, changing the keys of its other channels.
+    """
+    compacted = False
+    key, gap = _key_at(channel, position)
+    if key is None:
+        compact_playlist(channel.playlist_id)
+        compacted = True
+        channel.refresh_from_db(fields=['order'])
+        key, gap = _key_at(channel, position)
+
+    if key != channel.order:
+        channel.order = key
+        PlaylistChannel.objects.filter(pk=channel.pk).update(order=key)
+
+    if gap < COMPACTION_GAP_THRESHOLD:
+        compact_playlist(channel.playlist_id)
+        compacted = True
+        channel.refresh_from_db(fields=['order'])
+    return compacted
+
+
+def _key_at(channel, position):
+    """
+    Compute the key placing a channel at a position, between the channels found around it once the channel is
+    taken out of the playlist.
+
+    Returns:
+        tuple: The key (None when there is no room between the neighbours) and the smallest gap left around it.
+    """
+    others = PlaylistChannel.objects.filter(playlist_id=channel.playlist_id).exclude(pk=channel.pk).order_by('order')
+    if position <= 1:
+        neighbours = [None] + list(others.values_list('order', flat=True)[:1])
+    else:
+        neighbours = list(others.values_list('order', flat=True)[position - 2:position])
+        if not neighbours:
+            # Past the end of the playlist
+            neighbours = [others.values_list('order', flat=True).last()]
+
+    previous_key = neighbours[0] if neighbours else None
+    next_key = neighbours[1] if len(neighbours) > 1 else None
+
+    if previous_key is None and next_key is None:
+        return ORDER_KEY_GAP, ORDER_KEY_GAP
+    if next_key is None:
+        return previous_key + ORDER_KEY_GAP, ORDER_KEY_GAP
+    if previous_key is None:
+        # Keys stay positive, negative keys are reserved for compaction
+        previous_key = 0
+
+    if next_key - previous_key < 2:
+        return None, 0
+    key = (previous_key + next_key) // 2
+    return key, min(key - previous_key, next_key - key)
+
+
+def compact_playlist(playlist_id, gap=ORDER_KEY_GAP):
+    """
+    Re-space the order keys of a playlist by gap, keeping the channel order.
+
+    Uses two statements so that the unique (playlist, order) constraint holds after each one: keys are first set
+    to the negated positions, then to the spaced keys.
+    """
+    table = PlaylistChannel._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {table} SET "order" = -positions.position
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (ORDER BY "order") AS position
+                FROM {table} WHERE playlist_id = %s
+            ) AS positions
+            WHERE {table}.id = positions.id
+            """,
+            [playlist_id]
+        )
+        cursor.execute(
+            f'UPDATE {table} SET "order" = -"order" * %s WHERE playlist_id = %s',
+            [gap, playlist_id]
+        )
+    logger.info(f"Compacted the channel order of playlist {playlist_id}")
@@ -0,0 +1,108 @@
+"""
+Programme index of the playlists, ingested from their post-processed guide.xml files by the EPG generation job.
+
+Each ingestion of a playlist is a new generation: programmes are upserted on their (channel, start, stop) key with
+the new generation, then the programmes left with an older generation are deleted. Unchanged programmes keep their
+rows, and clients reading during an ingestion still see the previous programmes.
+"""
+import datetime
+import logging
+
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Playlist, PlaylistChannel, Programme
+from .xmltv import iter_programmes
+
+logger = logging.getLogger(__name__)
+
+PROGRAMME_BATCH_SIZE = 1000
+# Max duration of the programmes looked at to find the next programme of each channel
+NEXT_PROGRAMME_HORIZON = datetime.timedelta(hours=24)
+
+
+def ingest_programmes(playlist: Playlist, path):
+    """
+    Replace the programmes of a playlist by the programmes of its post-processed guide.xml file.
+
+    Returns:
+        int: The number of ingested programmes.
+    """
+    # Channels are identified by their number in the post-processed file
+    channel_ids = PlaylistChannel.objects.filter(playlist=playlist).order_by('order').values_list('id', flat=True)
+    channel_ids = {str(number): channel_id
+                   for number, channel_id in enumerate(channel_ids, start=playlist.starting_channel_number)}
+
+    generation = (playlist.programme_generation or 0) + 1
+    count = 0
+    batch = []
+    for programme in iter_programmes(path):
+        channel_id = channel_ids.get(programme.channel)
+        if channel_id is None:
+            continue
+
+        batch.append(Programme(
+            playlist_id=playlist.id,
+            channel_id=channel_id,
+            start=programme.start,
+            stop=programme.stop,
+            title=programme.title[:255],
+            sub_title=programme.sub_title[:255] if programme.sub_title else None,
+            description=programme.description,
+            category=programme.category[:255] if programme.category else None,
+            icon_url=programme.icon_url,
+            generation=generation
+        ))
+        if len(batch) >= PROGRAMME_BATCH_SIZE:
+            count += _upsert(batch)
+            batch = []
+    if batch:
+        count += _upsert(batch)
+
+    with transaction.atomic():
+        Programme.objects.filter(playlist=playlist).exclude(generation=generation).delete()
+        Playlist.objects.filter(pk=playlist.pk).update(programme_generation=generation)
+    playlist.programme_generation = generation
+    return count
+
+
+def _upsert(programmes):
+    # One short transaction per batch, so that other writers are not blocked during the whole ingestion
+    Programme.objects.bulk_create(
+        programmes,
+        update_conflicts=True,
+        unique_fields=['channel', 'start', 'stop'],
+        update_fields=['playlist', 'title', 'sub_title', 'description', 'category', 'icon_url', 'generation']
+    )
+    return len(programmes)
+
+
+def now_next(playlist: Playlist, at, channel_ids=None):
+    """
+    Get the current and next programme of the channels of a playlist.
+
+    Args:
+        playlist: The playlist.
+        at (datetime): The date of the current programmes.
+        channel_ids (list, optional): Only get the programmes of these channels.
+
+    Returns:
+        dict: The (current, next) programmes of each channel ID having any, either may be None.
+    """
+    programmes = Programme.objects.filter(playlist=playlist, stop__gt=at, start__lt=at + NEXT_PROGRAMME_HORIZON)
+    if channel_ids is not None:
+        programmes = programmes.filter(channel_id__in=channel_ids)
+    programmes = programmes.annotate(
+        rank=Window(RowNumber(), partition_by=F('channel_id'), order_by=F('start').asc())
+    ).filter(rank__lte=2).order_by('channel_id', 'start')
+
+    result = {}
+    for programme in programmes:
+        current, following = result.get(programme.channel_id, (None, None))
+        if programme.rank == 1 and programme.start <= at:
+            current = programme
+        elif following is None:
+            following = programme
+        result[programme.channel_id] = (current, following)
+    return result
@@ -1,18 +1,23 @@
-﻿import os
-from django.conf import settings
-from pathlib import Path
-from rest_framework import serializers
+﻿from rest_framework import serializers
 
-from .models import Playlist, PlaylistChannel
+from .models import Playlist, PlaylistChannel, Programme
 from provider_manager.models import ProviderStream
 from provider_manager.serializers import ProviderStreamSerializer
 from guide_manager.models import Guide
 from guide_manager.serializers import GuideSerializer
+from .jobs import DEFAULT_GUIDE_MATCH_THRESHOLD
+from .ordering import channel_position
+
+# Max number of IDs listed in a bulk request, bounded by the number of SQLite query parameters
+BULK_MAX_IDS = 10000
 
 
 class PlaylistSerializer(serializers.ModelSerializer):
     """
     Serializer for Playlist model.
+
+    Playlists fetched through `Playlist.objects.with_summary()` carry `channel_count` and `inactive_channel_count`
+    annotations, which are used as-is. Otherwise, these values are counted per playlist.
     """
     channel_count = serializers.SerializerMethodField()
     inactive_channel_count = serializers.SerializerMethodField()
@@ -20,27 +25,30 @@ class PlaylistSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Playlist
-        fields = ['id', 'name', 'starting_channel_number', 'default_lang', 'created_at', 'updated_at', 'channel_count', 'inactive_channel_count', 'has_epg']
-        read_only_fields = ['id', 'created_at', 'updated_at', 'channel_count', 'inactive_channel_count', 'has_epg']
+        fields = ['id', 'name', 'starting_channel_number', 'default_lang', 'created_at', 'updated_at', 'channel_count', 'inactive_channel_count', 'has_epg', 'epg_generated_at', 'epg_size']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'channel_count', 'inactive_channel_count', 'has_epg', 'epg_generated_at', 'epg_size']
 
     def get_channel_count(self, obj):
         """
         Get the number of channels associated with this Playlist.
         """
+        if hasattr(obj, 'channel_count'):
+            return obj.channel_count
         return obj.channels.count()
 
     def get_inactive_channel_count(self, obj):
         """
         Get the number of deactivated channels associated with this Playlist.
         """
+        if hasattr(obj, 'inactive_channel_count'):
+            return obj.inactive_channel_count
         return obj.channels.filter(provider_stream__is_active=False).count()
     
     def get_has_epg(self, obj):
         """
-        Get whether the Playlist has EPG generated for it. 
+        Get whether the Playlist has EPG generated for it, from the recorded guide.xml metadata.
         """
-        guide_path = os.path.join(settings.CONFIG_DIR, f"playlists/{obj.id}/guide.xml")
-        return Path(guide_path).exists()
+        return obj.epg_size is not None
 
 
 class PlaylistCreateSerializer(serializers.ModelSerializer):
@@ -112,18 +120,31 @@ class PlaylistChannelSerializer(serializers.ModelSerializer):
     """
     provider_stream = ProviderStreamWithDetailsSerializer(read_only=True)
     num = serializers.SerializerMethodField()
+    order = serializers.SerializerMethodField()
     guide = GuideSerializer(read_only=True)
 
     class Meta:
         model = PlaylistChannel
         fields = ['id', 'title', 'category', 'logo_url', 'provider_stream', 'created_at', 'updated_at', 'num', 'order', 'guide']
-        read_only_fields = ['id', 'created_at', 'updated_at', 'num']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'num', 'order']
+
+    def get_order(self, obj):
+        """
+        Get the dense (1-based) position of the channel in the playlist.
+
+        The stored order is a sparse sort key, views listing channels set `position` from the page offset so that
+        it is not counted for every channel.
+        """
+        position = getattr(obj, 'position', None)
+        if position is None:
+            position = obj.position = channel_position(obj)
+        return position
 
     def get_num(self, obj):
         """
-        Calculate the channel number based on the order and the playlist's starting_channel_number.
+        Calculate the channel number based on the position and the playlist's starting_channel_number.
         """
-        return obj.playlist.starting_channel_number + obj.order - 1
+        return obj.playlist.starting_channel_number + self.get_order(obj) - 1
 
 
 class PlaylistChannelCreateSerializer(serializers.ModelSerializer):
@@ -197,3 +218,92 @@ class PlaylistChannelUpdateSerializer(serializers.ModelSerializer):
             except:
                 raise serializers.ValidationError("Guide does not exist.")
         return value
+
+
+class PlaylistChannelMoveSerializer(serializers.Serializer):
+    """
+    Serializer for moving a channel to a position of its playlist.
+    """
+    channel_id = serializers.IntegerField(required=True)
+    position = serializers.IntegerField(required=True, min_value=1)
+
+
+class PlaylistChannelMovesSerializer(serializers.Serializer):
+    """
+    Serializer for a batch of channel moves, applied in order.
+    """
+    moves = PlaylistChannelMoveSerializer(many=True, allow_empty=False)
+
+
+class PlaylistStreamFilterSerializer(serializers.Serializer):
+    """
+    Serializer for a filter of the streams available to a playlist, as in the available streams list.
+    """
+    provider_id = serializers.IntegerField(required=False)
+    group = serializers.CharField(required=False)
+    is_active = serializers.BooleanField(required=False)
+    q = serializers.CharField(required=False, allow_blank=True)
+
+
+class PlaylistChannelBulkAddSerializer(serializers.Serializer):
+    """
+    Serializer for adding many streams to a playlist, either listed by ID or matching a filter.
+    """
+    provider_stream_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False, max_length=BULK_MAX_IDS
+    )
+    filter = PlaylistStreamFilterSerializer(required=False)
+    category = serializers.CharField(required=False, allow_null=True)
+
+    def validate(self, data):
+        if ('provider_stream_ids' in data) == ('filter' in data):
+            raise serializers.ValidationError("Either provider_stream_ids or filter is required.")
+        return data
+
+
+class PlaylistChannelBulkRemoveSerializer(serializers.Serializer):
+    """
+    Serializer for removing many channels from a playlist.
+    """
+    channel_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=True, allow_empty=False, max_length=BULK_MAX_IDS
+    )
+
+
+class PlaylistChannelBulkUpdateSerializer(PlaylistChannelBulkRemoveSerializer):
+    """
+    Serializer for setting the category and/or guide of many channels of a playlist.
+    """
+    category = serializers.CharField(required=False, allow_null=True)
+    guide_id = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate_guide_id(self, value):
+        if value is not None and not Guide.objects.filter(pk=value).exists():
+            raise serializers.ValidationError("Guide does not exist.")
+        return value
+
+    def validate(self, data):
+        if 'category' not in data and 'guide_id' not in data:
+            raise serializers.ValidationError("Either category or guide_id is required.")
+        return data
+
+
+class PlaylistGuideMatchSerializer(serializers.Serializer):
+    """
+    Serializer for the options of a playlist guide auto-match.
+    """
+    threshold = serializers.FloatField(required=False, min_value=0, default=DEFAULT_GUIDE_MATCH_THRESHOLD)
+    overwrite = serializers.BooleanField(required=False, default=False)
+    apply = serializers.BooleanField(required=False, default=False)
+
+
+class ProgrammeSerializer(serializers.ModelSerializer):
+    """
+    Serializer for Programme model.
+    """
+    channel_id = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Programme
+        fields = ['id', 'channel_id', 'start', 'stop', 'title', 'sub_title', 'description', 'category', 'icon_url']
+        read_only_fields = fields
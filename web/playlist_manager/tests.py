@@ -1,3 +1,738 @@
-﻿from django.test import TestCase
+import datetime
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
\ No newline at end of file
+import brotli
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from guide_manager.models import Channel, Guide
+from job_manager.models import Job, JobState, JobType
+from provider_manager.models import Provider, ProviderStream
+from . import guide_cache
+from .epg import compress_guide, grabbed_guide_path, guide_path, process_guide
+from .grab import SharedEpgGrabber, grab_path
+from .models import GuideDayCache, Playlist, PlaylistChannel, Programme
+from .ordering import COMPACTION_GAP_THRESHOLD, compact_playlist
+from .serializers import BULK_MAX_IDS
+from .views import MAX_PROGRAMME_WINDOW_HOURS
+
+
+class MoveChannelsTests(TestCase):
+
+    def setUp(self):
+        provider = Provider.objects.create(name='Provider', url='http://provider/playlist.m3u')
+        self.playlist = Playlist.objects.create(name='Playlist')
+        # No room between the first two keys
+        self.channels = [
+            PlaylistChannel.objects.create(
+                playlist=self.playlist,
+                order=order,
+                provider_stream=ProviderStream.objects.create(
+                    provider=provider, title=f'Stream {index}', media_url=f'http://a/{index}'
+                )
+            )
+            for index, order in enumerate([1, 2, 1792, 5000], start=1)
+        ]
+
+    def titles(self):
+        channels = self.playlist.channels.order_by('order').values_list('provider_stream__title', flat=True)
+        return [title.split()[-1] for title in channels]
+
+    def test_moves_after_compaction(self):
+        _, _, three, four = self.channels
+
+        # Moving 4 compacts the playlist, the key computed for 3 then equals its key before the compaction
+        response = self.client.post(
+            f'/api/playlists/{self.playlist.id}/move/',
+            {'moves': [{'channel_id': four.id, 'position': 2}, {'channel_id': three.id, 'position': 3}]},
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.titles(), ['1', '4', '3', '2'])
+
+    def move(self, channel, position):
+        response = self.client.post(f'/api/playlists/{self.playlist.id}/move/',
+                                    {'moves': [{'channel_id': channel.id, 'position': position}]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 204)
+
+    def keys(self):
+        return dict(self.playlist.channels.values_list('id', 'order'))
+
+    def test_moves_only_update_the_moved_channel(self):
+        compact_playlist(self.playlist.id)
+        one, two, three, four = self.channels
+
+        for channel, position, titles in [(three, 1, ['3', '1', '2', '4']), (four, 2, ['3', '4', '1', '2']),
+                                          (three, 99, ['4', '1', '2', '3'])]:
+            keys = self.keys()
+            self.move(channel, position)
+
+            self.assertEqual(self.titles(), titles)
+            moved_keys = self.keys()
+            self.assertEqual({pk for pk in keys if keys[pk] != moved_keys[pk]}, {channel.id})
+
+    def test_exhausted_gaps_are_compacted_by_the_move(self):
+        compact_playlist(self.playlist.id)
+        titles = ['1', '2', '3', '4']
+
+        # Each move halves the gap after the first channel
+        for _ in range(8):
+            last = self.playlist.channels.order_by('-order').first()
+            self.move(last, 2)
+            titles.insert(1, titles.pop())
+
+            self.assertEqual(self.titles(), titles)
+            keys = sorted(self.keys().values())
+            self.assertGreaterEqual(min(b - a for a, b in zip(keys, keys[1:])), COMPACTION_GAP_THRESHOLD)
+        # The 8th move left a gap of 4, and compacted the playlist
+        self.assertEqual(sorted(self.keys().values()), [1024, 2048, 3072, 4096])
+
+
+class BulkChannelsTests(TestCase):
+
+    def setUp(self):
+        provider = Provider.objects.create(name='Provider', url='http://provider/playlist.m3u')
+        self.streams = [
+            ProviderStream.objects.create(provider=provider, title=title, group=group, media_url=f'http://a/{index}')
+            for index, (title, group) in enumerate([('CNN', 'News'), ('BBC News', 'News'), ('Eurosport', 'Sport'),
+                                                    ('Arte', 'Culture')])
+        ]
+        self.playlist = Playlist.objects.create(name='Playlist')
+        self.channel = PlaylistChannel.objects.create(playlist=self.playlist, order=1024,
+                                                      provider_stream=self.streams[0])
+        other_playlist = Playlist.objects.create(name='Other')
+        self.other_channel = PlaylistChannel.objects.create(playlist=other_playlist, order=1024,
+                                                            provider_stream=self.streams[1])
+
+    def post(self, name, data):
+        return self.client.post(f'/api/playlists/{self.playlist.id}/{name}/', data, content_type='application/json')
+
+    def titles(self):
+        return list(self.playlist.channels.order_by('order').values_list('provider_stream__title', 'category'))
+
+    def test_bulk_add(self):
+        response = self.post('bulk_add', {'provider_stream_ids': [stream.id for stream in self.streams],
+                                          'category': 'Added'})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'added': 3})
+        # Appended after the existing channels, by group and title
+        self.assertEqual(self.titles(), [('CNN', None), ('Arte', 'Added'), ('BBC News', 'Added'),
+                                         ('Eurosport', 'Added')])
+
+    def test_bulk_add_by_filter(self):
+        response = self.post('bulk_add', {'filter': {'q': 'news'}})
+
+        self.assertEqual(response.json(), {'added': 1})
+        self.assertEqual(self.titles(), [('CNN', None), ('BBC News', None)])
+
+    def test_bulk_remove_and_update_ignore_other_playlists(self):
+        channel_ids = [self.channel.id, self.other_channel.id]
+
+        response = self.post('bulk_update', {'channel_ids': channel_ids, 'category': 'News'})
+        self.assertEqual(response.json(), {'updated': 1})
+        self.assertEqual(self.titles(), [('CNN', 'News')])
+
+        response = self.post('bulk_remove', {'channel_ids': channel_ids})
+        self.assertEqual(response.json(), {'removed': 1})
+        self.assertEqual(self.titles(), [])
+        self.assertTrue(PlaylistChannel.objects.filter(pk=self.other_channel.pk).exists())
+
+    def test_id_limit(self):
+        ids = list(range(1, BULK_MAX_IDS + 1))
+        for name, data, field, result in [
+            ('bulk_add', {}, 'provider_stream_ids', {'added': 3}),
+            # Including the channels added above
+            ('bulk_update', {'category': 'News'}, 'channel_ids', {'updated': 4}),
+            ('bulk_remove', {}, 'channel_ids', {'removed': 4}),
+        ]:
+            with self.subTest(name=name):
+                response = self.post(name, {**data, field: ids + [BULK_MAX_IDS + 1]})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.json())
+
+                response = self.post(name, {**data, field: []})
+                self.assertEqual(response.status_code, 400)
+
+                # Exactly the limit fits in the statement
+                response = self.post(name, {**data, field: ids})
+                self.assertIn(response.status_code, (200, 201))
+                self.assertEqual(response.json(), result)
+
+    def test_invalid_requests(self):
+        for name, data in [('bulk_add', {'provider_stream_ids': [1], 'filter': {}}), ('bulk_add', {}),
+                           ('bulk_update', {'channel_ids': [self.channel.id]}),
+                           ('bulk_update', {'channel_ids': [self.channel.id], 'guide_id': 999})]:
+            with self.subTest(name=name, data=data):
+                self.assertEqual(self.post(name, data).status_code, 400)
+
+
+class ProgrammesEndpointTests(TestCase):
+    START = datetime.datetime(2026, 10, 12, tzinfo=datetime.timezone.utc)
+
+    def setUp(self):
+        provider = Provider.objects.create(name='Provider', url='http://provider/playlist.m3u')
+        self.playlist = Playlist.objects.create(name='Playlist')
+        self.channels = []
+        # The second channel comes first in the playlist
+        for index, order in enumerate([2048, 1024]):
+            stream = ProviderStream.objects.create(provider=provider, title=f'Stream {index}',
+                                                   media_url=f'http://a/{index}')
+            channel = PlaylistChannel.objects.create(playlist=self.playlist, order=order, provider_stream=stream)
+            self.channels.append(channel)
+            # Programmes of 1 hour, starting 30 minutes before the start
+            Programme.objects.bulk_create(
+                Programme(playlist=self.playlist, channel=channel, title=f'{index}-{hour}', generation=1,
+                          start=self.START + timedelta(hours=hour - 0.5),
+                          stop=self.START + timedelta(hours=hour + 0.5))
+                for hour in range(30)
+            )
+
+    def get(self, **params):
+        return self.client.get(f'/api/playlists/{self.playlist.id}/programmes/', {
+            name: value.isoformat() if isinstance(value, datetime.datetime) else value
+            for name, value in params.items()
+        })
+
+    def titles(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [item['title'] for item in response.json()['items']]
+
+    def test_default_window(self):
+        with mock.patch('django.utils.timezone.now', return_value=self.START):
+            response = self.get()
+
+        # Programmes airing during the window, including the one airing at its start
+        self.assertEqual(self.titles(response), ['1-0', '1-1', '1-2', '1-3', '0-0', '0-1', '0-2', '0-3'])
+        self.assertEqual(response.json()['end'], '2026-10-12T03:00:00Z')
+
+    def test_channel_ids(self):
+        response = self.get(start=self.START, end=self.START + timedelta(hours=1), channel_ids=self.channels[0].id)
+
+        self.assertEqual(self.titles(response), ['0-0', '0-1'])
+
+    def test_window_is_capped(self):
+        response = self.get(start=self.START, end=self.START + timedelta(hours=MAX_PROGRAMME_WINDOW_HOURS))
+        self.assertEqual(len(self.titles(response)), 2 * (MAX_PROGRAMME_WINDOW_HOURS + 1))
+
+        for end in [self.START + timedelta(hours=MAX_PROGRAMME_WINDOW_HOURS, seconds=1), self.START,
+                    self.START - timedelta(hours=1)]:
+            with self.subTest(end=end):
+                response = self.get(start=self.START, end=end)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(f'{MAX_PROGRAMME_WINDOW_HOURS} hours', response.json()['error'])
+
+    def test_invalid_parameters(self):
+        for params in [{'start': 'yesterday'}, {'end': '2026-13-01'}, {'channel_ids': '1,a'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params).status_code, 400)
+
+
+class M3UExportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        provider = Provider.objects.create(name='Provider', url='http://provider/playlist.m3u')
+        guide = Guide.objects.create(
+            site='example.com', site_id='news', site_name='News', lang='en',
+            channel=Channel.objects.create(xmltv_id='News.us', name='News', country='US')
+        )
+        self.playlist = Playlist.objects.create(name='Playlist', starting_channel_number=100)
+        self.streams = [
+            ProviderStream.objects.create(provider=provider, title=title, media_url=f'http://a/{title}', group='TV')
+            for title in ('News', 'Sport')
+        ]
+        self.channels = [
+            PlaylistChannel.objects.create(playlist=self.playlist, order=1024, provider_stream=self.streams[0],
+                                           guide=guide, category='Info'),
+            PlaylistChannel.objects.create(playlist=self.playlist, order=2048, provider_stream=self.streams[1]),
+        ]
+
+    def get(self, **headers):
+        async def get():
+            response = await self.async_client.get(f'/api/playlists/{self.playlist.id}/playlist.m3u', headers=headers)
+            if response.streaming:
+                return response, b''.join([chunk async for chunk in response.streaming_content])
+            return response, response.content
+
+        response, content = async_to_sync(get)()
+        return response, content.decode()
+
+    def test_streamed_then_cached(self):
+        response, content = self.get()
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(content, (
+            '#EXTM3U\n'
+            '#EXTINF:-1 tvg-chno="100" tvg-id="100" tvg-name="News" tvg-logo="" group-title="Info",News\n'
+            'http://a/News\n'
+            '#EXTINF:-1 tvg-chno="101" tvg-id="" tvg-name="Sport" tvg-logo="" group-title="",Sport\n'
+            'http://a/Sport\n'
+        ))
+
+        cached_response, cached_content = self.get()
+        self.assertFalse(cached_response.streaming)
+        self.assertEqual(cached_content, content)
+        self.assertEqual(cached_response['ETag'], response['ETag'])
+
+    def test_not_modified(self):
+        response, _ = self.get()
+
+        not_modified, content = self.get(if_none_match=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual((not_modified['ETag'], content), (response['ETag'], ''))
+
+        self.assertEqual(self.get(if_none_match='"other"')[0].status_code, 200)
+
+    def test_channel_changes_invalidate_the_cache(self):
+        response, _ = self.get()
+
+        patched = self.client.patch(f'/api/channels/{self.channels[1].id}/', {'title': 'Sports'},
+                                    content_type='application/json')
+        self.assertEqual(patched.status_code, 204)
+
+        changed, content = self.get(if_none_match=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertIn(',Sports\n', content)
+
+        self.channels[0].delete()
+        _, content = self.get(if_none_match=changed['ETag'])
+        self.assertNotIn('News', content)
+
+    def test_provider_stream_changes_invalidate_the_cache(self):
+        response, _ = self.get()
+
+        self.streams[0].media_url = 'http://b/News'
+        self.streams[0].save()
+        changed, content = self.get(if_none_match=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn('http://b/News\n', content)
+
+        # Channels of inactive streams are skipped, the other channels keep their number
+        self.streams[0].is_active = False
+        self.streams[0].save()
+        _, content = self.get(if_none_match=changed['ETag'])
+        self.assertNotIn('News', content)
+        self.assertIn('tvg-chno="101"', content)
+
+
+class GuideProcessingTests(TestCase):
+
+    def setUp(self):
+        config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, config_dir)
+        settings_override = override_settings(CONFIG_DIR=config_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        provider = Provider.objects.create(name='Provider', url='http://provider/playlist.m3u')
+        stream = ProviderStream.objects.create(provider=provider, title='News', media_url='http://a/1')
+        channel = Channel.objects.create(xmltv_id='News.us', name='News', country='US')
+        guide = Guide.objects.create(site='example.com', site_id='news', site_name='News', lang='en', channel=channel)
+        self.playlist = Playlist.objects.create(name='Playlist', starting_channel_number=100)
+        self.channel = PlaylistChannel.objects.create(
+            playlist=self.playlist, order=1024, provider_stream=stream, guide=guide, title='My News'
+        )
+
+    def write_grabbed_guide(self, now):
+        def xmltv_time(date):
+            return date.strftime('%Y%m%d%H%M%S +0000')
+
+        hour = now.replace(minute=0, second=0, microsecond=0)
+        path = grabbed_guide_path(self.playlist.id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(
+                '<?xml version="1.0" encoding="UTF-8"?>\n<tv>\n'
+                '<channel id="News.us"><display-name>News</display-name></channel>\n'
+                f'<programme start="{xmltv_time(hour)}" stop="{xmltv_time(hour + timedelta(hours=1))}" '
+                'channel="News.us"><title>Now</title></programme>\n'
+                f'<programme start="{xmltv_time(hour + timedelta(hours=1))}" '
+                f'stop="{xmltv_time(hour + timedelta(hours=2))}" channel="News.us"><title>Next</title></programme>\n'
+                f'<programme start="{xmltv_time(hour)}" stop="{xmltv_time(hour + timedelta(hours=1))}" '
+                'channel="Other.us"><title>Other</title></programme>\n'
+                '</tv>\n'
+            )
+
+    def test_process_guide(self):
+        now = timezone.now()
+        self.write_grabbed_guide(now)
+
+        stats = process_guide(self.playlist)
+        compress_guide(self.playlist.id)
+
+        self.assertEqual((stats.channels, stats.programmes, stats.skipped_programmes), (1, 2, 1))
+        with open(guide_path(self.playlist.id), encoding='utf-8') as file:
+            guide = file.read()
+        self.assertIn('<channel id="100"><display-name>My News</display-name></channel>', guide)
+        self.assertTrue(os.path.exists(guide_path(self.playlist.id) + '.gz'))
+        self.assertEqual(
+            list(Programme.objects.filter(channel=self.channel).order_by('start').values_list('title', flat=True)),
+            ['Now', 'Next']
+        )
+
+        response = self.client.get(f'/api/playlists/{self.playlist.id}/now_next/', {'at': now.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        item, = response.json()['items']
+        self.assertEqual((item['now']['title'], item['next']['title']), ('Now', 'Next'))
+
+    def test_requests_do_not_process_the_grabbed_guide(self):
+        self.write_grabbed_guide(timezone.now())
+
+        response = self.client.get(f'/api/playlists/{self.playlist.id}/now_next/')
+
+        self.assertEqual(response.json()['items'], [])
+        self.assertFalse(os.path.exists(guide_path(self.playlist.id)))
+        self.assertEqual(self.client.get(f'/api/playlists/{self.playlist.id}/guide.xml').status_code, 404)
+
+
+class GuideResponseTests(TestCase):
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config_dir)
+        settings_override = override_settings(CONFIG_DIR=self.config_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.playlist = Playlist.objects.create(name='Playlist')
+        self.url = f'/api/playlists/{self.playlist.id}/guide.xml'
+        self.guide = ''.join(f'<channel id="{number}"/>\n' for number in range(100)).encode()
+        self.path = guide_path(self.playlist.id)
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as file:
+            file.write(self.guide)
+        compress_guide(self.playlist.id)
+
+    def get(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        self.addCleanup(response.close)
+        return response
+
+    def content(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_variant_selected_by_accept_encoding(self):
+        for accept_encoding, encoding in [('', None), ('gzip, br', 'br'), ('br;q=0, gzip', 'gzip'),
+                                          ('gzip;q=0.0, br;q=0', None), ('*', 'br')]:
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.get(accept_encoding=accept_encoding)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+                content = self.content(response)
+                decompress = {None: bytes, 'br': brotli.decompress, 'gzip': gzip.decompress}[encoding]
+                self.assertEqual(decompress(content), self.guide)
+
+    def test_stale_variants_are_not_sent(self):
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        response = self.get(accept_encoding='br, gzip')
+        self.assertIsNone(response.get('Content-Encoding'))
+        self.assertEqual(self.content(response), self.guide)
+
+        compress_guide(self.playlist.id)
+        self.assertEqual(self.get(accept_encoding='br, gzip')['Content-Encoding'], 'br')
+
+    def test_not_modified(self):
+        etag = self.get()['ETag']
+
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response.content, b'')
+
+        # Each variant has its own ETag
+        response = self.get(if_none_match=etag, accept_encoding='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_ranges(self):
+        size = len(self.guide)
+        for byte_range, first, last in [('bytes=10-19', 10, 19), ('bytes=-5', size - 5, size - 1),
+                                        ('bytes=100-', 100, size - 1), ('bytes=0-99999', 0, size - 1)]:
+            with self.subTest(byte_range=byte_range):
+                response = self.get(range=byte_range)
+
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {first}-{last}/{size}')
+                self.assertEqual(response['Content-Length'], str(last - first + 1))
+                self.assertEqual(self.content(response), self.guide[first:last + 1])
+
+        # Multiple ranges are not supported, the whole file is sent
+        response = self.get(range='bytes=0-1,5-6')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), self.guide)
+
+    def test_unsatisfiable_range(self):
+        response = self.get(range=f'bytes={len(self.guide)}-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.guide)}')
+
+    def test_if_range(self):
+        response = self.get()
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        for if_range, status in [(etag, 206), (last_modified, 206), ('"changed"', 200),
+                                 ('Thu, 01 Jan 2015 00:00:00 GMT', 200)]:
+            with self.subTest(if_range=if_range):
+                response = self.get(range='bytes=0-9', if_range=if_range)
+
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(self.content(response), self.guide[:10] if status == 206 else self.guide)
+
+    def test_sendfile_headers(self):
+        with override_settings(EPG_SENDFILE_HEADER='X-Accel-Redirect', EPG_SENDFILE_PREFIX='/protected/'):
+            response = self.get(accept_encoding='gzip', range='bytes=0-9')
+
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Accel-Redirect'], f'/protected/playlists/{self.playlist.id}/guide.xml.gz')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response.content, b'')
+
+        with override_settings(EPG_SENDFILE_HEADER='X-Sendfile'):
+            response = self.get()
+
+            self.assertEqual(response['X-Sendfile'], os.path.abspath(self.path))
+            self.assertIsNone(response.get('Content-Encoding'))
+            self.assertEqual(response.content, b'')
+
+        # Conditional requests are still answered by the application
+        self.assertEqual(self.get(if_none_match=response['ETag']).status_code, 304)
+
+
+def xmltv_time(date):
+    return date.strftime('%Y%m%d%H%M%S +0000')
+
+
+class EpgService(ThreadingHTTPServer):
+    """
+    Local stand-in of the EPG service, writing one programme a day at noon (UTC) for each posted channel.
+    """
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), EpgServiceRequestHandler)
+        # (name, days, site_ids) of each grab
+        self.grabs = []
+        self.today = None
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class EpgServiceRequestHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        name = url.path.rsplit('/', 1)[-1]
+        days = int(parse_qs(url.query)['days'][0])
+        channels = ET.fromstring(self.rfile.read(int(self.headers['Content-Length'])))
+        (site, lang), = {(channel.get('site'), channel.get('lang')) for channel in channels}
+        self.server.grabs.append((name, days, sorted(channel.get('site_id') for channel in channels)))
+
+        # The grab files of the sites are named after the site, language and days, see grab_path
+        path = grab_path(site, lang, days)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('<?xml version="1.0" encoding="UTF-8"?>\n<tv>\n')
+            for channel in channels:
+                file.write(f'<channel id="{channel.get("xmltv_id")}"><display-name>{channel.text}</display-name>'
+                           '</channel>\n')
+            for channel in channels:
+                for offset in range(days):
+                    start = datetime.datetime.combine(
+                        self.server.today + timedelta(days=offset), datetime.time(12), tzinfo=datetime.timezone.utc
+                    )
+                    file.write(f'<programme start="{xmltv_time(start)}" stop="{xmltv_time(start + timedelta(hours=1))}" '
+                               f'channel="{channel.get("xmltv_id")}"><title>{channel.get("site_id")} {offset}</title>'
+                               '</programme>\n')
+            file.write('</tv>\n')
+
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SharedEpgGrabTests(TestCase):
+
+    def setUp(self):
+        config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, config_dir)
+        settings_override = override_settings(CONFIG_DIR=config_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.service = EpgService()
+        self.addCleanup(self.service.close)
+        self.grabber = SharedEpgGrabber(service_url=self.service.url, concurrency=2)
+
+        self.provider = Provider.objects.create(name='Provider', url='http://provider/playlist.m3u')
+        self.guides = {
+            name: Guide.objects.create(
+                site=site, site_id=name, site_name=name, lang='en',
+                channel=Channel.objects.create(xmltv_id=f'{name}.us', name=name, country='US')
+            )
+            for site, name in [('a.com', 'news'), ('a.com', 'sport'), ('b.com', 'movies')]
+        }
+
+    def playlist(self, *guide_names):
+        playlist = Playlist.objects.create(name='Playlist')
+        for order, name in enumerate(guide_names, start=1):
+            PlaylistChannel.objects.create(
+                playlist=playlist,
+                order=order * 1024,
+                provider_stream=ProviderStream.objects.create(
+                    provider=self.provider, title=f'{name} {playlist.id}', media_url=f'http://a/{name}'
+                ),
+                guide=self.guides[name]
+            )
+        return playlist
+
+    def generate(self, playlists, now):
+        self.service.today = now.date()
+        job_ids = [
+            Job.objects.create(type=JobType.PLAYLIST_EPG_GEN, state=JobState.QUEUED, playlist=playlist).pk
+            for playlist in playlists
+        ]
+        with mock.patch('playlist_manager.grab.timezone.now', return_value=now):
+            self.grabber.run(job_ids)
+        return Job.objects.filter(pk__in=job_ids)
+
+    def test_guides_are_grabbed_once_per_site(self):
+        first, second = self.playlist('news', 'sport'), self.playlist('news', 'movies')
+
+        jobs = self.generate([first, second], timezone.now())
+
+        self.assertEqual(set(jobs.values_list('state', flat=True)), {JobState.COMPLETED})
+        self.assertEqual(sorted(self.service.grabs), [
+            ('site-a.com-en-14d', 14, ['news', 'sport']),
+            ('site-b.com-en-14d', 14, ['movies']),
+        ])
+        # Each playlist only gets the programmes of its own guides
+        self.assertEqual(
+            sorted(Programme.objects.filter(playlist=second, title__endswith=' 0').values_list('title', flat=True)),
+            ['movies 0', 'news 0']
+        )
+        with open(guide_path(first.id), encoding='utf-8') as file:
+            self.assertNotIn('movies', file.read())
+
+    def test_daily_generations_only_grab_the_first_days(self):
+        playlist = self.playlist('news', 'movies')
+        now = timezone.now()
+
+        grabbed_days, descriptions = [], []
+        for day in range(5):
+            self.service.grabs.clear()
+            job = self.generate([playlist], now + timedelta(days=day)).get()
+            self.assertEqual(job.state, JobState.COMPLETED)
+            grabbed_days.append({days for _, days, _ in self.service.grabs})
+            descriptions.append(job.status_description)
+
+        # The later days expire after 3 days, and are then grabbed along with the missing days of the tail
+        self.assertEqual(grabbed_days, [{14}, {2}, {2}, {14}, {2}])
+        # The missing days of the tail are reported
+        self.assertNotIn("miss days", descriptions[0])
+        self.assertTrue(descriptions[2].endswith(". 2 of 2 guides miss days of the window (at most 2 of 14 days)"))
+        # Only the last day of the window is missing since the last full grab
+        today = (now + timedelta(days=4)).date()
+        self.assertEqual(
+            set(GuideDayCache.objects.filter(site_id='news', day__gte=today).values_list('day', flat=True)),
+            {today + timedelta(days=offset) for offset in range(13)}
+        )
+
+    def test_guides_are_cached_by_language(self):
+        french = Guide.objects.create(site='a.com', site_id='news', site_name='Nouvelles', lang='fr',
+                                      channel=self.guides['news'].channel)
+        playlist = self.playlist('news')
+        PlaylistChannel.objects.create(
+            playlist=playlist, order=4096, guide=french,
+            provider_stream=ProviderStream.objects.create(provider=self.provider, title='FR', media_url='http://a/fr')
+        )
+
+        self.generate([playlist], timezone.now())
+
+        self.assertEqual(sorted(name for name, _, _ in self.service.grabs), ['site-a.com-en-14d', 'site-a.com-fr-14d'])
+        channels = GuideDayCache.objects.filter(site='a.com', site_id='news').values_list('lang', 'channel')
+        self.assertEqual({lang for lang, _ in channels}, {'en', 'fr'})
+        self.assertTrue(all(('Nouvelles' in channel) == (lang == 'fr') for lang, channel in channels))
+
+    def test_tail_uncovered_for_too_long_is_grabbed(self):
+        now = timezone.now()
+        today = now.date()
+        guide = ('a.com', 'news', 'en', 'news.us')
+
+        def cache(offsets, grabbed_at):
+            for offset in offsets:
+                GuideDayCache.objects.update_or_create(
+                    site='a.com', site_id='news', lang='en', day=today + timedelta(days=offset),
+                    defaults={'xmltv_id': 'news.us', 'grabbed_at': grabbed_at}
+                )
+
+        # Days of the tail only missing since they entered the window are not grabbed
+        cache(range(11), now)
+        cache([11], now - timedelta(days=1))
+        self.assertEqual(guide_cache.stale_days([guide], today, 14, now), {})
+        self.assertEqual(guide_cache.missing_days([guide], today, 14), {guide: 2})
+
+        # A day of the tail expired for more than TAIL_MAX_UNCOVERED is, along with the days after it
+        cache([11], now - timedelta(days=7))
+        self.assertEqual(guide_cache.stale_days([guide], today, 14, now), {guide: 14})
+
+    def test_store_grab_in_batches(self):
+        today = timezone.now().date()
+        self.service.today = today
+        path = grab_path('a.com', 'en', 3)
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('<tv><channel id="news.us"><display-name>News</display-name></channel>\n')
+            for offset in range(3):
+                for hour in (8, 20):
+                    start = datetime.datetime.combine(
+                        today + timedelta(days=offset), datetime.time(hour), tzinfo=datetime.timezone.utc
+                    )
+                    file.write(f'<programme start="{xmltv_time(start)}" channel="news.us">'
+                               f'<title>{offset}-{hour}</title></programme>\n')
+            file.write('</tv>')
+
+        # The same guide under two site_ids gets the programmes of both
+        with mock.patch.object(guide_cache, 'CACHE_BATCH_SIZE', 3):
+            count = guide_cache.store_grab(
+                'a.com', 'en', path, [('news', 'news.us'), ('news-hd', 'news.us')], today, 3, timezone.now()
+            )
+
+        self.assertEqual(count, 6)
+        for site_id in ('news', 'news-hd'):
+            entries = GuideDayCache.objects.filter(site='a.com', site_id=site_id).order_by('day')
+            self.assertEqual(
+                [[title.text for title in ET.fromstring(f'<tv>{entry.programmes}</tv>').iter('title')]
+                 for entry in entries],
+                [['0-8', '0-20'], ['1-8', '1-20'], ['2-8', '2-20']]
+            )
+            self.assertTrue(all('display-name' in entry.channel for entry in entries))
@@ -1,15 +1,17 @@
 ﻿from fileinput import filename
 
 from django.db import transaction
-from django.db.models import Max, F, Q
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse, Http404
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from datetime import timedelta
 from math import ceil
-import os
-from django.conf import settings
 
 from .models import Playlist, PlaylistChannel
 from .serializers import (
@@ -19,10 +21,101 @@ from .serializers import (
     PlaylistChannelSerializer,
     PlaylistChannelCreateSerializer,
     PlaylistChannelUpdateSerializer,
+    PlaylistChannelMovesSerializer,
+    PlaylistChannelBulkAddSerializer,
+    PlaylistChannelBulkRemoveSerializer,
+    PlaylistChannelBulkUpdateSerializer,
+    PlaylistGuideMatchSerializer,
+    ProgrammeSerializer,
     ProviderStreamWithDetailsSerializer
 )
-from job_manager.models import JobState, JobType
+from .epg import guide_response, refresh_epg_metadata
+from .grab import start_shared_epg_grab
+from .programmes import now_next
+from .export import playlist_etag, get_cached_m3u, stream_and_cache_m3u
+from .ordering import append_streams, channel_position, move_channel, next_order_key
+from .jobs import (
+    match_playlist_guides, apply_guide_matches, start_playlist_guide_match, guide_fingerprints, enqueue_epg_generation
+)
+from guide_manager.models import Guide
+from guide_manager.serializers import GuideSerializer
+from job_manager.models import JobState
 from provider_manager.models import ProviderStream
+from main.pagination import is_cursor_request, paginate_by_cursor
+
+# Max number of channels of a playlist whose guides are matched and applied within the request
+AUTO_MATCH_SYNC_LIMIT = 500
+
+M3U_CONTENT_TYPE = 'audio/x-mpegurl; charset=utf-8'
+
+# Default and max duration of the programme window queries, in hours
+PROGRAMME_WINDOW_HOURS = 3
+MAX_PROGRAMME_WINDOW_HOURS = 24
+
+
+def available_streams_query(playlist, provider_id=None, group=None, is_active=None, q=None):
+    """
+    Get the provider streams that are not assigned to a channel of a playlist, optionally filtered.
+    """
+    # Exclude streams that are already assigned to this playlist
+    assigned_stream_ids = PlaylistChannel.objects.filter(playlist=playlist).values('provider_stream_id')
+    query = ProviderStream.objects.exclude(id__in=assigned_stream_ids)
+
+    if provider_id:
+        query = query.filter(provider_id=provider_id)
+    if group:
+        query = query.filter(group=group)
+    if is_active is not None:
+        query = query.filter(is_active=is_active)
+    if q:
+        query = query.search(q)
+    return query
+
+
+def _epg_sync_status(job, created):
+    if created:
+        message = "Generation job queued successfully"
+    elif job.state == JobState.COMPLETED:
+        message = "Guide is up to date"
+    else:
+        message = job.status_description
+    return {
+        "job_id": str(job.job_id),
+        "status": "queued" if created else job.state,
+        "message": message
+    }
+
+
+def _parse_date_param(request, name, default):
+    """
+    Parse an ISO 8601 date query parameter, dates without offset are UTC.
+
+    Raises:
+        ValueError: If the parameter is not a valid date.
+    """
+    value = request.query_params.get(name)
+    if not value:
+        return default
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f"Invalid date: {name}")
+    return date if timezone.is_aware(date) else timezone.make_aware(date, timezone.utc)
+
+
+def _parse_channel_ids_param(request):
+    """
+    Parse the comma-separated channel_ids query parameter, None when not set.
+
+    Raises:
+        ValueError: If an ID is not an integer.
+    """
+    value = request.query_params.get('channel_ids')
+    if not value:
+        return None
+    try:
+        return [int(channel_id) for channel_id in value.split(',')]
+    except ValueError:
+        raise ValueError("Invalid channel_ids")
 
 
 class PlaylistsViewSet(viewsets.ViewSet):
@@ -35,7 +128,8 @@ class PlaylistsViewSet(viewsets.ViewSet):
         Get a list of playlists.
         """
         # Get the playlists, ordered by name ascending
-        playlists = Playlist.objects.all().order_by('name')
+        playlists = list(Playlist.objects.with_summary().order_by('name'))
+        refresh_epg_metadata(playlists)
         serializer = PlaylistSerializer(playlists, many=True)
 
         response_data = {
@@ -48,7 +142,8 @@ class PlaylistsViewSet(viewsets.ViewSet):
         """
         Get a specific playlist by ID.
         """
-        playlist = get_object_or_404(Playlist, pk=pk)
+        playlist = get_object_or_404(Playlist.objects.with_summary(), pk=pk)
+        refresh_epg_metadata([playlist])
         serializer = PlaylistSerializer(playlist)
         return Response(serializer.data)
 
@@ -106,6 +201,8 @@ class PlaylistsViewSet(viewsets.ViewSet):
         Query Parameters (GET only):
             page: The page number (default: 1)
             size: The page size (default: 10)
+            cursor: Opaque cursor for keyset pagination (optional, an empty value returns the first page).
+                When set, the page number is ignored and the total is only counted with with_total=true
         """
         # Check if playlist exists
         playlist = get_object_or_404(Playlist, pk=pk)
@@ -127,8 +224,25 @@ class PlaylistsViewSet(viewsets.ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Get total count of channels for this playlist
             query = PlaylistChannel.objects.filter(playlist=playlist)
+            if is_cursor_request(request):
+                def set_positions(channels):
+                    # Channels of a page are contiguous, only the position of the first one has to be counted
+                    if channels:
+                        first = channel_position(channels[0])
+                        for index, channel in enumerate(channels):
+                            channel.position = first + index
+
+                return paginate_by_cursor(
+                    request,
+                    query.select_related('playlist', 'provider_stream', 'provider_stream__provider', 'guide'),
+                    ['order'],
+                    size,
+                    PlaylistChannelSerializer,
+                    prepare_items=set_positions
+                )
+
+            # Get total count of channels for this playlist
             total_items = query.count()
 
             # Calculate pagination values
@@ -136,7 +250,9 @@ class PlaylistsViewSet(viewsets.ViewSet):
             skip = (page - 1) * size
 
             # Get the channels for the current page, ordered by order
-            channels = query.select_related('provider_stream', 'provider_stream__provider', 'guide').order_by('order')[skip:skip+size]
+            channels = list(query.select_related('playlist', 'provider_stream', 'provider_stream__provider', 'guide').order_by('order')[skip:skip+size])
+            for index, channel in enumerate(channels):
+                channel.position = skip + index + 1
 
             # Create response with pagination links
             base_url = request.build_absolute_uri().split('?')[0]
@@ -164,10 +280,6 @@ class PlaylistsViewSet(viewsets.ViewSet):
                 # Get the provider channel
                 provider_stream_id = serializer.validated_data['provider_stream_id']
 
-                # Get the maximum order value and add 1, or use 1 if no records exist
-                max_order = PlaylistChannel.objects.filter(playlist=playlist).aggregate(Max('order'))['order__max']
-                new_order = 1 if max_order is None else max_order + 1
-
                 # Create the playlist channel
                 channel = PlaylistChannel.objects.create(
                     title=serializer.validated_data.get('title'),
@@ -175,7 +287,7 @@ class PlaylistsViewSet(viewsets.ViewSet):
                     logo_url=serializer.validated_data.get('logo_url'),
                     playlist=playlist,
                     provider_stream_id=provider_stream_id,
-                    order=new_order
+                    order=next_order_key(playlist.id)
                 )
 
                 return Response(
@@ -186,6 +298,109 @@ class PlaylistsViewSet(viewsets.ViewSet):
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
 
+    @action(detail=True, methods=['post'])
+    @transaction.atomic
+    def move(self, request, pk=None):
+        """
+        Move several channels of a playlist in one request.
+
+        Request Body:
+            moves: A list of {channel_id, position} objects, applied one after the other. Positions are 1-based
+                and relative to the playlist as left by the previous moves.
+        """
+        playlist = get_object_or_404(Playlist, pk=pk)
+
+        serializer = PlaylistChannelMovesSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        moves = serializer.validated_data['moves']
+
+        channels = playlist.channels.in_bulk([move['channel_id'] for move in moves])
+        missing_ids = [move['channel_id'] for move in moves if move['channel_id'] not in channels]
+        if missing_ids:
+            return Response(
+                {"error": f"Channels not found in the playlist: {', '.join(map(str, missing_ids))}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        for move in moves:
+            if move_channel(channels[move['channel_id']], move['position']):
+                # The keys of the channels still to move changed
+                channels = playlist.channels.in_bulk(list(channels))
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    @transaction.atomic
+    def bulk_add(self, request, pk=None):
+        """
+        Add many streams to the end of a playlist in one statement. Streams already in the playlist are skipped.
+
+        Request Body:
+            provider_stream_ids: The IDs of the streams to add, ordered by group and title, or
+            filter: The filter of the streams to add ({provider_id, group, is_active, q}, as in available_streams),
+                ordered by relevance with q then group and title
+            category: The category of the new channels (optional)
+        """
+        playlist = get_object_or_404(Playlist, pk=pk)
+
+        serializer = PlaylistChannelBulkAddSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        order_by = [F('group').asc(), F('title').asc(), F('id').asc()]
+        if 'filter' in serializer.validated_data:
+            stream_filter = serializer.validated_data['filter']
+            streams = available_streams_query(playlist, **stream_filter)
+            if stream_filter.get('q'):
+                order_by.insert(0, F('search_rank').asc())
+        else:
+            streams = available_streams_query(playlist).filter(id__in=serializer.validated_data['provider_stream_ids'])
+
+        added = append_streams(playlist.id, streams, order_by, serializer.validated_data.get('category'))
+        return Response({'added': added}, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    @transaction.atomic
+    def bulk_remove(self, request, pk=None):
+        """
+        Remove many channels from a playlist in one statement. The remaining channels keep their order keys.
+
+        Request Body:
+            channel_ids: The IDs of the channels to remove, IDs of other playlists are ignored
+        """
+        playlist = get_object_or_404(Playlist, pk=pk)
+
+        serializer = PlaylistChannelBulkRemoveSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        removed, _ = playlist.channels.filter(id__in=serializer.validated_data['channel_ids']).delete()
+        return Response({'removed': removed}, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post'])
+    @transaction.atomic
+    def bulk_update(self, request, pk=None):
+        """
+        Set the category and/or guide of many channels of a playlist in one statement.
+
+        Request Body:
+            channel_ids: The IDs of the channels to update, IDs of other playlists are ignored
+            category: The new category, null to clear it (optional)
+            guide_id: The new guide ID, null to clear it (optional)
+        """
+        playlist = get_object_or_404(Playlist, pk=pk)
+
+        serializer = PlaylistChannelBulkUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        fields = {name: serializer.validated_data[name] for name in ('category', 'guide_id') if name in serializer.validated_data}
+        updated = playlist.channels.filter(id__in=serializer.validated_data['channel_ids']).update(
+            updated_at=timezone.now(), **fields
+        )
+        return Response({'updated': updated}, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=['get'])
     def categories(self, request, pk=None):
         """
@@ -208,9 +423,13 @@ class PlaylistsViewSet(viewsets.ViewSet):
             page: The page number (default: 1)
             size: The page size (default: 10)
             provider_id: Filter by provider ID (optional)
+            group: Filter by group (optional)
             is_active: Filter by active status (optional, true/false)
-            q: Text search in title, group, and tvg_id (optional)
-            sort_by: Field(s) to sort by, comma-separated (optional, default: group,title, options: title,tvg_id,group,is_active)
+            q: Text search in title, group, and tvg_id, matching word prefixes (optional)
+            sort_by: Field(s) to sort by, comma-separated (optional, default: relevance with q then group,title,
+                options: title,tvg_id,group,is_active)
+            cursor: Opaque cursor for keyset pagination (optional, an empty value returns the first page).
+                When set, the page number is ignored and the total is only counted with with_total=true
         """
         # Validate pagination parameters
         page = int(request.query_params.get('page', 1))
@@ -249,32 +468,27 @@ class PlaylistsViewSet(viewsets.ViewSet):
         playlist = get_object_or_404(Playlist, pk=pk)
 
         # Get all provider streams that are not assigned to any channel in this playlist
-        # Start with all streams
-        query = ProviderStream.objects.all()
-
-        # Exclude streams that are already assigned to this playlist
-        assigned_stream_ids = PlaylistChannel.objects.filter(playlist=playlist).values_list('provider_stream_id', flat=True)
-        query = query.exclude(id__in=assigned_stream_ids)
-
-        # Apply filters if provided
-        provider_id = request.query_params.get('provider_id')
-        if provider_id:
-            query = query.filter(provider_id=provider_id)
-
         is_active = request.query_params.get('is_active')
-        if is_active is not None:
-            is_active_bool = is_active.lower() == 'true'
-            query = query.filter(is_active=is_active_bool)
-
         q = request.query_params.get('q')
-        if q:
-            query = query.filter(Q(title__icontains=q) | Q(tvg_id__icontains=q) | Q(group__icontains=q))
+        query = available_streams_query(
+            playlist,
+            provider_id=request.query_params.get('provider_id'),
+            group=request.query_params.get('group'),
+            is_active=is_active.lower() == 'true' if is_active is not None else None,
+            q=q
+        )
 
         # If no sort fields, use default
         if not order_by_fields:
             order_by_fields = ['group', 'title']
 
+        # Most relevant search results first, unless a sort order was requested
+        if q and 'sort_by' not in request.query_params:
+            order_by_fields = ['search_rank'] + order_by_fields
+
         query = query.select_related('provider').order_by(*order_by_fields)
+        if is_cursor_request(request):
+            return paginate_by_cursor(request, query, order_by_fields, size, ProviderStreamWithDetailsSerializer)
 
         # Get total count
         total_items = query.count()
@@ -317,37 +531,180 @@ class PlaylistsViewSet(viewsets.ViewSet):
         return Response(response_data, status=status.HTTP_200_OK)
 
     @action(detail=True, methods=['post'])
-    def epg_sync(self, request, pk=None):
+    def auto_match(self, request, pk=None):
         """
-        Manually trigger a playlist EPG generation job for a specific playlist.
+        Match every channel of a playlist to its best guide in one pass.
+
+        Request Body:
+            threshold: The minimum match score (optional, default: 0.6). A full title match scores 1, an exact
+                tvg_id match adds 2
+            overwrite: Whether to also match the channels that already have a guide (optional, default: false)
+            apply: Whether to assign the matched guides, otherwise only return them (optional, default: false)
 
         Returns:
-            Response: A response containing the job ID and initial status.
+            Response: A response containing the matches when previewing, or the number of updated channels
+                when applying. Applying to playlists with more than AUTO_MATCH_SYNC_LIMIT channels runs as a job,
+                the response then contains the job ID and initial status.
         """
         playlist = get_object_or_404(Playlist, pk=pk)
 
-        # Check if there's already a sync job in progress or queued for this playlist
-        active_jobs = playlist.jobs.filter(state__in=[JobState.QUEUED, JobState.IN_PROGRESS])
+        serializer = PlaylistGuideMatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        threshold = serializer.validated_data['threshold']
+        overwrite = serializer.validated_data['overwrite']
 
-        if active_jobs.exists():
-            job = active_jobs.first()
+        if not serializer.validated_data['apply']:
+            matches = match_playlist_guides(playlist, threshold, overwrite)
+            guides = Guide.objects.select_related('channel').in_bulk([match.guide_id for match in matches])
+            return Response({
+                'items': [
+                    {
+                        'channel_id': match.channel.id,
+                        'score': round(match.score, 3),
+                        'guide': GuideSerializer(guides[match.guide_id]).data
+                    }
+                    for match in matches if match.guide_id in guides
+                ]
+            })
+
+        if playlist.channels.count() > AUTO_MATCH_SYNC_LIMIT:
+            job, created = start_playlist_guide_match(playlist, threshold, overwrite)
             return Response({
                 "job_id": str(job.job_id),
                 "status": job.state,
-                "message": job.status_description
+                "message": "Guide match job queued successfully" if created else job.status_description
+            }, status=status.HTTP_202_ACCEPTED)
+
+        matches = match_playlist_guides(playlist, threshold, overwrite)
+        updated = apply_guide_matches(matches)
+        return Response({
+            'matched': len(matches),
+            'updated': updated
+        })
+
+    @action(detail=True, methods=['post'])
+    def epg_sync(self, request, pk=None):
+        """
+        Manually trigger a playlist EPG generation job for a specific playlist.
+
+        The job is not queued when the last generation used the same guides and is recent enough, as the grab would
+        produce the same guide.
+
+        Query Parameters:
+            force: Queue the job even if the EPG is up to date (optional, true/false)
+
+        Returns:
+            Response: A response containing the job ID and initial status.
+        """
+        playlist = get_object_or_404(Playlist, pk=pk)
+
+        force = request.query_params.get('force', '').lower() == 'true'
+        fingerprint = guide_fingerprints([playlist.id])[playlist.id]
+        job, created = enqueue_epg_generation(playlist, fingerprint, force=force)
+        return Response(_epg_sync_status(job, created))
+
+    @action(detail=False, methods=['post'])
+    def epg_sync_all(self, request):
+        """
+        Queue an EPG generation of all playlists whose guides changed since their last generation, or whose EPG is
+        older than the max age setting.
+
+        Query Parameters:
+            force: Queue the jobs even if the EPG is up to date (optional, true/false)
+            shared: Grab the guides shared by the playlists once, instead of one grab per playlist by the job
+                worker (optional, true/false)
+
+        Returns:
+            Response: A response containing the job of each playlist.
+        """
+        force = request.query_params.get('force', '').lower() == 'true'
+        shared = request.query_params.get('shared', '').lower() == 'true'
+        playlists = list(Playlist.objects.order_by('name'))
+        fingerprints = guide_fingerprints([playlist.id for playlist in playlists])
+
+        items = []
+        queued_job_ids = []
+        for playlist in playlists:
+            job, created = enqueue_epg_generation(playlist, fingerprints[playlist.id], force=force)
+            if created:
+                queued_job_ids.append(job.pk)
+            items.append({"playlist_id": playlist.id, **_epg_sync_status(job, created)})
+
+        if shared and queued_job_ids:
+            start_shared_epg_grab(queued_job_ids)
+        return Response({'items': items})
+
+    @action(detail=True, methods=['get'])
+    def now_next(self, request, pk=None):
+        """
+        Get the current and next programme of the channels of a playlist, from the programmes ingested by its last
+        EPG generation.
+
+        Query Parameters:
+            at: The date of the current programmes (optional, ISO 8601, default: now)
+            channel_ids: Comma-separated IDs of the channels (optional, default: all channels with programmes)
+
+        Returns:
+            Response: The items, in playlist order, with the channel_id and its now and next programmes (or null)
+        """
+        playlist = get_object_or_404(Playlist, pk=pk)
+        try:
+            at = _parse_date_param(request, 'at', timezone.now())
+            channel_ids = _parse_channel_ids_param(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        programmes = now_next(playlist, at, channel_ids)
+        ordered_ids = PlaylistChannel.objects.filter(id__in=programmes.keys()).order_by('order').values_list('id', flat=True)
+
+        items = []
+        for channel_id in ordered_ids:
+            current, following = programmes[channel_id]
+            items.append({
+                'channel_id': channel_id,
+                'now': ProgrammeSerializer(current).data if current else None,
+                'next': ProgrammeSerializer(following).data if following else None,
             })
+        return Response({'at': at, 'items': items})
 
-        # Create the job
-        job = playlist.jobs.create(
-            type=JobType.PLAYLIST_EPG_GEN,
-            state=JobState.QUEUED,
-            max_attempts=1, # when running manual sync, allow one failure only
-        )
+    @action(detail=True, methods=['get'])
+    def programmes(self, request, pk=None):
+        """
+        Get the programmes of the channels of a playlist airing during a time window, from the programmes ingested
+        by its last EPG generation.
+
+        Query Parameters:
+            start: The start of the window (optional, ISO 8601, default: now)
+            end: The end of the window (optional, ISO 8601, default: 3 hours after start, at most 24 hours after it)
+            channel_ids: Comma-separated IDs of the channels (optional, default: all channels)
+
+        Returns:
+            Response: The programmes, by playlist order of their channel then by start date
+        """
+        playlist = get_object_or_404(Playlist, pk=pk)
+        try:
+            start = _parse_date_param(request, 'start', timezone.now())
+            end = _parse_date_param(request, 'end', start + timedelta(hours=PROGRAMME_WINDOW_HOURS))
+            channel_ids = _parse_channel_ids_param(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if end <= start or end - start > timedelta(hours=MAX_PROGRAMME_WINDOW_HOURS):
+            return Response(
+                {"error": f"The window must end after its start, within {MAX_PROGRAMME_WINDOW_HOURS} hours."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        programmes = playlist.programmes.filter(stop__gt=start, start__lt=end)
+        if channel_ids is not None:
+            programmes = programmes.filter(channel_id__in=channel_ids)
+        programmes = programmes.order_by('channel__order', 'start')
 
         return Response({
-            "job_id": str(job.job_id),
-            "status": "queued",
-            "message": "Generation job queued successfully"
+            'start': start,
+            'end': end,
+            'items': ProgrammeSerializer(programmes, many=True).data
         })
 
     @action(detail=True, methods=['get'], url_path='guide.xml')
@@ -355,21 +712,51 @@ class PlaylistsViewSet(viewsets.ViewSet):
         """
         Download the guide.xml file for a specific playlist if it exists.
 
+        Clients refreshing the guide get a 304 response with If-None-Match or If-Modified-Since while the file is
+        unchanged, may resume downloads with Range, and get the gzip or brotli variant when they accept it.
+
         Returns:
-            FileResponse: The guide.xml file if it exists
+            HttpResponse: The guide.xml file if it exists
             Http404: If the file doesn't exist
         """
-        _ = get_object_or_404(Playlist, pk=pk)
-
-        # Construct the file path
-        file_path = os.path.join(settings.CONFIG_DIR, f"playlists/{pk}/guide.xml")
+        playlist = get_object_or_404(Playlist, pk=pk)
 
-        # Check if the file exists
-        if not os.path.exists(file_path):
+        response = guide_response(request, playlist)
+        if response is None:
             raise Http404("Guide.xml file not found")
+        return response
+
+    @action(detail=True, methods=['get'], url_path='playlist.m3u')
+    def m3u(self, request, pk=None):
+        """
+        Download a playlist as an M3U file.
+
+        The playlist is streamed from a single database cursor, then its rendering is cached and identified by an ETag
+        that changes with the playlist channels and their provider streams, so clients polling with If-None-Match get
+        a 304 response for the cost of one aggregate query.
+
+        Returns:
+            StreamingHttpResponse: The M3U file, or an HttpResponse of the cached rendering
+        """
+        playlist = get_object_or_404(Playlist, pk=pk)
 
-        # Return the file as a response
-        return FileResponse(open(file_path, 'rb'), content_type='application/xml', as_attachment=True, filename=f"playlist_{pk}_guide.xml")
+        etag = quote_etag(playlist_etag(playlist))
+        headers = {
+            'ETag': etag,
+            'Cache-Control': 'no-cache',
+            'Content-Disposition': f'inline; filename="playlist_{pk}.m3u"',
+        }
+
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+            return HttpResponseNotModified(headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+        content = get_cached_m3u(playlist.id, etag)
+        if content is None:
+            return StreamingHttpResponse(
+                stream_and_cache_m3u(playlist, etag), content_type=M3U_CONTENT_TYPE, headers=headers
+            )
+        return HttpResponse(content, content_type=M3U_CONTENT_TYPE, headers=headers)
 
 
 class ChannelsViewSet(viewsets.ViewSet):
@@ -407,29 +794,8 @@ class ChannelsViewSet(viewsets.ViewSet):
                         { "error": f"Order must be between 1 and {count}." },
                         status=status.HTTP_400_BAD_REQUEST)
 
-                if new_order > channel.order:
-                    first = channel.order + 1
-                    last = new_order
-                    change = -1
-                else:
-                    first = new_order
-                    last = channel.order - 1
-                    change = 1
-
-                # Set a temporary order that won't conflict with any existing orders
-                # Use a negative number that's guaranteed to be unique
-                channel.order = -channel.pk
-                channel.save(update_fields=['order'])
-
-                # Update other channels' orders
-                query = channel.playlist.channels.filter(order__gte=first, order__lte=last)
-                query = reversed(query) if change > 0 else query
-                for ch in query:
-                    ch.order += change
-                    ch.save()
-
-                # Now set the final order
-                channel.order = new_order
+                # Only the moved channel gets a new (sparse) order key
+                move_channel(channel, new_order)
             if 'guide_id' in serializer.validated_data:
                 channel.guide_id = serializer.validated_data['guide_id']
 
@@ -443,10 +809,8 @@ class ChannelsViewSet(viewsets.ViewSet):
         Delete a playlist channel.
         """
         channel = get_object_or_404(PlaylistChannel, pk=pk)
-        removed_order = channel.order
-        channel.delete()
 
-        # Reorder the remaining channels in the playlist
-        channel.playlist.channels.filter(order__gt=removed_order).update(order=F('order') - 1)
+        # The remaining channels keep their order keys, their positions are computed from them
+        channel.delete()
 
         return Response(status=status.HTTP_204_NO_CONTENT)
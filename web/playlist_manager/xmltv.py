@@ -0,0 +1,222 @@
+"""
+Streaming post-processing of the XMLTV files written by the EPG grabber.
+
+The grabber output uses the guide xmltv_ids as channel ids and covers every grabbed day. The post-processor rewrites
+it for a playlist: channel ids and display names follow the playlist channels, programmes outside of a time window
+are dropped and overlapping programmes of a channel are only kept once.
+
+The input is read with an incremental parser and each top level element is written out and released as soon as it
+is parsed, so memory use does not depend on the size of the file.
+"""
+import datetime
+import logging
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from typing import NamedTuple, Optional
+from xml.sax.saxutils import quoteattr
+
+logger = logging.getLogger(__name__)
+
+# Written on the root element of post-processed files
+GENERATOR_NAME = 'StreamWeaver'
+
+
+class XmltvChannel(NamedTuple):
+    """
+    Playlist channel of a guide, as written in the post-processed file.
+    """
+    id: str
+    name: str
+    logo_url: Optional[str]
+
+
+class XmltvProgramme(NamedTuple):
+    channel: str
+    start: datetime.datetime
+    stop: datetime.datetime
+    title: str
+    sub_title: Optional[str]
+    description: Optional[str]
+    category: Optional[str]
+    icon_url: Optional[str]
+
+
+class XmltvStats(NamedTuple):
+    channels: int
+    programmes: int
+    skipped_programmes: int
+
+
+def parse_xmltv_time(value):
+    """
+    Parse an XMLTV date, e.g. "20240101203000 +0100". Dates without offset are UTC.
+
+    Returns:
+        datetime: The aware date, None when it cannot be parsed.
+    """
+    if not value:
+        return None
+    date, _, offset = value.strip().partition(' ')
+    date = date.ljust(14, '0')[:14]
+    try:
+        parsed = datetime.datetime.strptime(date, '%Y%m%d%H%M%S')
+        if offset:
+            return parsed.replace(tzinfo=datetime.datetime.strptime(offset, '%z').tzinfo)
+        return parsed.replace(tzinfo=datetime.timezone.utc)
+    except ValueError:
+        return None
+
+
+def postprocess_xmltv(source_path, target_path, channels, start=None, end=None):
+    """
+    Post-process an XMLTV file for a playlist, writing the result atomically.
+
+    Args:
+        source_path (str): The XMLTV file written by the grabber.
+        target_path (str): The post-processed file, replaced once it is complete.
+        channels (dict): The XmltvChannel list of each xmltv_id, channels of other xmltv_ids are dropped.
+            A guide used by several playlist channels has its programmes written for each of them.
+        start (datetime, optional): Programmes ending before this date are dropped.
+        end (datetime, optional): Programmes starting after this date are dropped.
+
+    Returns:
+        XmltvStats: The number of written channels and programmes, and of skipped programmes.
+    """
+    channel_count = programme_count = skipped_count = 0
+    # Stop date of the last programme kept for each xmltv_id
+    last_stops = {}
+
+    # Unique name, so that concurrent writers never share a temporary file
+    output = tempfile.NamedTemporaryFile(
+        'w', encoding='utf-8', dir=os.path.dirname(target_path), suffix='.tmp', delete=False
+    )
+    try:
+        with output:
+            depth = 0
+            root = None
+            for event, element in ET.iterparse(source_path, events=('start', 'end')):
+                if event == 'start':
+                    if depth == 0:
+                        root = element
+                        _write_root(output, element)
+                    depth += 1
+                    continue
+
+                depth -= 1
+                if depth != 1:
+                    continue
+
+                if element.tag == 'channel':
+                    for channel in channels.get(element.get('id'), ()):
+                        output.write(_channel_xml(element, channel))
+                        channel_count += 1
+                elif element.tag == 'programme':
+                    xmltv_id = element.get('channel')
+                    if xmltv_id in channels and _keep_programme(element, xmltv_id, last_stops, start, end):
+                        for channel in channels[xmltv_id]:
+                            element.set('channel', channel.id)
+                            element.tail = '\n'
+                            output.write(ET.tostring(element, encoding='unicode'))
+                            programme_count += 1
+                    else:
+                        skipped_count += 1
+
+                # Release the element, the root is the only element kept
+                root.clear()
+
+            output.write('</tv>\n')
+        os.replace(output.name, target_path)
+    finally:
+        if os.path.exists(output.name):
+            os.remove(output.name)
+
+    return XmltvStats(channel_count, programme_count, skipped_count)
+
+
+def iter_elements(path):
+    """
+    Read the top level elements (channels and programmes) of an XMLTV file, one at a time. Each element is released
+    once the next one is read.
+    """
+    depth = 0
+    root = None
+    for event, element in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if depth == 0:
+                root = element
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1:
+            yield element
+            root.clear()
+
+
+def iter_programmes(path):
+    """
+    Read the programmes of an XMLTV file, one at a time.
+
+    Yields:
+        XmltvProgramme: The programmes with a valid start date.
+    """
+    for element in iter_elements(path):
+        if element.tag == 'programme':
+            start = parse_xmltv_time(element.get('start'))
+            if start is not None:
+                icon = element.find('icon')
+                yield XmltvProgramme(
+                    channel=element.get('channel'),
+                    start=start,
+                    stop=parse_xmltv_time(element.get('stop')) or start,
+                    title=element.findtext('title') or '',
+                    sub_title=element.findtext('sub-title'),
+                    description=element.findtext('desc'),
+                    category=element.findtext('category'),
+                    icon_url=icon.get('src') if icon is not None else None
+                )
+
+
+def _write_root(output, element):
+    attributes = {name: value for name, value in element.attrib.items() if not name.startswith('generator-info-')}
+    attributes['generator-info-name'] = GENERATOR_NAME
+    output.write('<?xml version="1.0" encoding="UTF-8"?>\n<tv')
+    for name, value in attributes.items():
+        output.write(f' {name}={quoteattr(value)}')
+    output.write('>\n')
+
+
+def _channel_xml(element, channel: XmltvChannel):
+    rewritten = ET.Element('channel', {'id': channel.id})
+    ET.SubElement(rewritten, 'display-name').text = channel.name
+    for child in element:
+        if child.tag == 'icon' and channel.logo_url:
+            continue
+        if child.tag != 'display-name':
+            rewritten.append(child)
+    if channel.logo_url:
+        ET.SubElement(rewritten, 'icon', {'src': channel.logo_url})
+    rewritten.tail = '\n'
+    return ET.tostring(rewritten, encoding='unicode')
+
+
+def _keep_programme(element, xmltv_id, last_stops, start, end):
+    """
+    Whether a programme is in the window and does not overlap the previous programme kept for its channel.
+
+    The grabber writes the programmes of a channel by start date, so an overlap is a duplicate entry.
+    """
+    programme_start = parse_xmltv_time(element.get('start'))
+    if programme_start is None:
+        return False
+    programme_stop = parse_xmltv_time(element.get('stop')) or programme_start
+
+    if (start and programme_stop <= start) or (end and programme_start >= end):
+        return False
+
+    last_stop = last_stops.get(xmltv_id)
+    if last_stop and programme_start < last_stop:
+        return False
+    last_stops[xmltv_id] = max(programme_stop, programme_start)
+    return True
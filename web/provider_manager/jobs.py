@@ -0,0 +1,27 @@
+from job_manager.models import JobState, JobType
+from main.utils import ConfigStore
+from .models import Provider
+
+
+def enqueue_provider_sync(provider: Provider, max_attempts=None):
+    """
+    Queue a PROVIDER_SYNC job for a provider, unless one is already queued or in progress.
+
+    Returns:
+        tuple: The queued (or already active) job, and whether it was created.
+    """
+    active_job = provider.jobs.filter(
+        type=JobType.PROVIDER_SYNC,
+        state__in=[JobState.QUEUED, JobState.IN_PROGRESS]
+    ).order_by('created_at').first()
+    if active_job:
+        return active_job, False
+
+    settings_data = ConfigStore().get("iptv:settings") or {}
+    job = provider.jobs.create(
+        type=JobType.PROVIDER_SYNC,
+        state=JobState.QUEUED,
+        max_attempts=max_attempts,
+        allow_stream_auto_deletion=settings_data.get("allow_stream_auto_deletion", True)
+    )
+    return job, True
@@ -0,0 +1,110 @@
+"""
+Incremental M3U playlist parser.
+
+Entries are parsed from an iterable of byte chunks (an HTTP response body, a file read in blocks, ...), one
+line at a time, so memory usage stays flat regardless of the size of the playlist.
+"""
+import re
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+CHUNK_SIZE = 64 * 1024
+
+_EXTINF = b'#EXTINF:'
+_EXTGRP = b'#EXTGRP:'
+_ATTR_RE = re.compile(r'([\w-]+)\s*=\s*"([^"]*)"')
+
+
+class M3UEntry(NamedTuple):
+    """
+    A single stream entry of an M3U playlist.
+    """
+    title: str
+    tvg_id: Optional[str]
+    logo_url: Optional[str]
+    group: str
+    media_url: str
+
+
+def iter_file_chunks(file, chunk_size=CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Read a binary file object in fixed-size chunks.
+    """
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_lines(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Split a stream of byte chunks into lines, stripped of surrounding whitespace (including CR/LF).
+    """
+    pending = b''
+    for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.strip()
+    if pending.strip():
+        yield pending.strip()
+
+
+def _decode(value: bytes) -> str:
+    return value.decode('utf-8', errors='replace')
+
+
+def parse_extinf(line: str):
+    """
+    Parse the content of an #EXTINF line (without the "#EXTINF:" prefix).
+
+    Returns:
+        tuple: The title and a dictionary of the attributes (tvg-id, tvg-logo, group-title, ...).
+    """
+    attributes = {}
+    end = 0
+    for match in _ATTR_RE.finditer(line):
+        attributes[match.group(1).lower()] = match.group(2).strip()
+        end = match.end()
+
+    # The title follows the first comma after the duration and attributes
+    comma = line.find(',', end)
+    title = line[comma + 1:].strip() if comma >= 0 else ''
+    return title, attributes
+
+
+def parse(chunks: Iterable[bytes]) -> Iterator[M3UEntry]:
+    """
+    Parse M3U entries incrementally from a stream of byte chunks.
+
+    Entries without a title or media URL are skipped. A missing group is normalized to an empty string, so that
+    it can be used as part of the stream natural key.
+    """
+    extinf = None
+    group = None
+    for raw in iter_lines(chunks):
+        if not raw:
+            continue
+        if raw.startswith(_EXTINF):
+            extinf = parse_extinf(_decode(raw[len(_EXTINF):]))
+            group = None
+        elif raw.startswith(_EXTGRP):
+            group = _decode(raw[len(_EXTGRP):]).strip()
+        elif raw.startswith(b'#'):
+            # #EXTM3U header, #EXTVLCOPT and other directives
+            continue
+        elif extinf is not None:
+            title, attributes = extinf
+            extinf = None
+            media_url = _decode(raw)
+            if not title or not media_url:
+                continue
+            yield M3UEntry(
+                title=title,
+                tvg_id=attributes.get('tvg-id') or None,
+                logo_url=attributes.get('tvg-logo') or None,
+                group=attributes.get('group-title') or group or '',
+                media_url=media_url,
+            )
@@ -0,0 +1,75 @@
+import os
+import resource
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from provider_manager import m3u
+from provider_manager.models import Provider
+from provider_manager.sync import ProviderSynchronizer, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the M3U ingestion engine on a generated playlist. Parses the playlist and, with --sync, '
+            'runs a full provider sync into a throwaway provider that is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=1_000_000, help='Number of lines of the generated playlist')
+        parser.add_argument('--groups', type=int, default=50, help='Number of distinct stream groups')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Number of streams written per batch')
+        parser.add_argument('--sync', action='store_true', help='Also benchmark a full sync into the database')
+
+    def handle(self, *args, **options):
+        with tempfile.NamedTemporaryFile(suffix='.m3u', delete=False) as file:
+            path = file.name
+            self._generate(file, options['lines'], options['groups'])
+
+        try:
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            self.stdout.write(f"Generated {options['lines']:,} lines ({size_mb:.1f} MB)")
+
+            start = time.perf_counter()
+            with open(path, 'rb') as file:
+                count = sum(1 for _ in m3u.parse(m3u.iter_file_chunks(file)))
+            self._report('Parse', count, size_mb, time.perf_counter() - start)
+
+            if options['sync']:
+                self._benchmark_sync(path, size_mb, options['batch_size'])
+        finally:
+            os.remove(path)
+
+    def _benchmark_sync(self, path, size_mb, batch_size):
+        synchronizer = ProviderSynchronizer(batch_size=batch_size)
+        with transaction.atomic():
+            provider = Provider.objects.create(name='benchmark', url='http://localhost/benchmark.m3u')
+
+            start = time.perf_counter()
+            _, description = synchronizer.run(provider, source=path)
+            self._report('Initial sync', provider.streams.count(), size_mb, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            _, description = synchronizer.run(provider, source=path)
+            self._report('Repeated sync', provider.streams.count(), size_mb, time.perf_counter() - start)
+            self.stdout.write(description)
+
+            transaction.set_rollback(True)
+
+    def _report(self, label, count, size_mb, elapsed):
+        max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(
+            f"{label}: {count:,} streams in {elapsed:.2f}s "
+            f"({count / elapsed:,.0f} streams/s; {size_mb / elapsed:.1f} MB/s; max RSS {max_rss_mb:.0f} MB)"
+        )
+
+    @staticmethod
+    def _generate(file, lines, groups):
+        file.write(b'#EXTM3U\n')
+        for i in range((lines - 1) // 2):
+            group = f'Group {i % groups}'
+            file.write(
+                f'#EXTINF:-1 tvg-id="channel{i}.us" tvg-logo="http://logos.example.com/{i}.png" '
+                f'group-title="{group}",Channel {i} HD\n'
+                f'http://streams.example.com/live/{i}.ts\n'.encode()
+            )
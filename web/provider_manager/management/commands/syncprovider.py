@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.utils import ConfigStore
+from provider_manager.models import Provider
+from provider_manager.sync import ProviderSynchronizer, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Synchronize the streams of a provider with its M3U playlist.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('provider_id', type=int, help='ID of the provider to synchronize')
+        parser.add_argument('--file', help='Read the playlist from a local file instead of the provider URL')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Number of streams written per batch')
+        parser.add_argument('--force', action='store_true', help='Sync even if the playlist did not change since the last sync')
+        deletion = parser.add_mutually_exclusive_group()
+        deletion.add_argument('--delete-missing', dest='allow_stream_auto_deletion', action='store_true', default=None,
+                              help='Delete streams missing from the playlist')
+        deletion.add_argument('--deactivate-missing', dest='allow_stream_auto_deletion', action='store_false',
+                              help='Deactivate streams missing from the playlist')
+
+    def handle(self, *args, **options):
+        try:
+            provider = Provider.objects.get(pk=options['provider_id'])
+        except Provider.DoesNotExist:
+            raise CommandError(f"Provider {options['provider_id']} does not exist")
+
+        allow_stream_auto_deletion = options['allow_stream_auto_deletion']
+        if allow_stream_auto_deletion is None:
+            settings_data = ConfigStore().get("iptv:settings") or {}
+            allow_stream_auto_deletion = settings_data.get("allow_stream_auto_deletion", True)
+
+        synchronizer = ProviderSynchronizer(batch_size=options['batch_size'])
+        success, description = synchronizer.run(provider, allow_stream_auto_deletion, source=options['file'], force=options['force'])
+
+        if not success:
+            raise CommandError(description)
+        self.stdout.write(self.style.SUCCESS(description))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from job_manager.models import JobState
+from provider_manager.jobs import enqueue_provider_sync
+from provider_manager.models import Provider
+from provider_manager.sync import MultiProviderSynchronizer, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = ('Synchronize several providers concurrently. Downloads and parsing run in parallel while database writes '
+            'are serialized through a single writer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('provider_ids', nargs='*', type=int, help='IDs of the providers to synchronize (default: all enabled providers)')
+        parser.add_argument('--concurrency', type=int, help='Max number of playlists downloaded and parsed concurrently')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Number of streams written per batch')
+        parser.add_argument('--force', action='store_true', help='Sync even if playlists did not change since the last sync')
+
+    def handle(self, *args, **options):
+        providers = Provider.objects.filter(is_enabled=True)
+        if options['provider_ids']:
+            providers = providers.filter(pk__in=options['provider_ids'])
+
+        job_ids = []
+        for provider in providers:
+            job, _ = enqueue_provider_sync(provider, max_attempts=1)
+            if job.state == JobState.QUEUED:
+                job_ids.append(job.pk)
+            else:
+                self.stdout.write(self.style.WARNING(f"Skipping provider {provider.id}: job {job.job_id} is already {job.state}"))
+
+        synchronizer = MultiProviderSynchronizer(
+            concurrency=options['concurrency'],
+            batch_size=options['batch_size'],
+            force=options['force']
+        )
+        for job in synchronizer.run(job_ids):
+            style = self.style.SUCCESS if job.state == JobState.COMPLETED else self.style.ERROR
+            self.stdout.write(style(f"Provider {job.provider_id}: {job.state} - {job.status_description}"))
@@ -0,0 +1,81 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:24
+
+from django.db import migrations, models
+
+
+# Keep Provider.active_stream_count/inactive_stream_count in step with ProviderStream rows. Triggers are used
+# (rather than Django signals) because streams are also bulk-written by the job worker outside of Django.
+CREATE_TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER provider_stream_count_insert AFTER INSERT ON provider_manager_providerstream
+    BEGIN
+        UPDATE provider_manager_provider
+        SET active_stream_count = active_stream_count + (NEW.is_active != 0),
+            inactive_stream_count = inactive_stream_count + (NEW.is_active = 0)
+        WHERE id = NEW.provider_id;
+    END;
+    """,
+    """
+    CREATE TRIGGER provider_stream_count_delete AFTER DELETE ON provider_manager_providerstream
+    BEGIN
+        UPDATE provider_manager_provider
+        SET active_stream_count = active_stream_count - (OLD.is_active != 0),
+            inactive_stream_count = inactive_stream_count - (OLD.is_active = 0)
+        WHERE id = OLD.provider_id;
+    END;
+    """,
+    """
+    CREATE TRIGGER provider_stream_count_update AFTER UPDATE OF is_active, provider_id ON provider_manager_providerstream
+    WHEN OLD.is_active IS NOT NEW.is_active OR OLD.provider_id IS NOT NEW.provider_id
+    BEGIN
+        UPDATE provider_manager_provider
+        SET active_stream_count = active_stream_count - (OLD.is_active != 0),
+            inactive_stream_count = inactive_stream_count - (OLD.is_active = 0)
+        WHERE id = OLD.provider_id;
+        UPDATE provider_manager_provider
+        SET active_stream_count = active_stream_count + (NEW.is_active != 0),
+            inactive_stream_count = inactive_stream_count + (NEW.is_active = 0)
+        WHERE id = NEW.provider_id;
+    END;
+    """,
+]
+
+DROP_TRIGGERS_SQL = [
+    "DROP TRIGGER IF EXISTS provider_stream_count_insert;",
+    "DROP TRIGGER IF EXISTS provider_stream_count_delete;",
+    "DROP TRIGGER IF EXISTS provider_stream_count_update;",
+]
+
+BACKFILL_SQL = """
+    UPDATE provider_manager_provider
+    SET active_stream_count = (
+            SELECT COUNT(*) FROM provider_manager_providerstream s
+            WHERE s.provider_id = provider_manager_provider.id AND s.is_active
+        ),
+        inactive_stream_count = (
+            SELECT COUNT(*) FROM provider_manager_providerstream s
+            WHERE s.provider_id = provider_manager_provider.id AND NOT s.is_active
+        );
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provider_manager', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='provider',
+            name='active_stream_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='inactive_stream_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, reverse_sql=migrations.RunSQL.noop),
+        migrations.RunSQL(CREATE_TRIGGERS_SQL, reverse_sql=DROP_TRIGGERS_SQL),
+    ]
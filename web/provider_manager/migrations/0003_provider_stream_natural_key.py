@@ -0,0 +1,106 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:26
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+# The stream count triggers of 0002_provider_stream_counts, dropped by the table rebuild of the new constraint
+CREATE_TRIGGERS_SQL = [
+    """
+    CREATE TRIGGER provider_stream_count_insert AFTER INSERT ON provider_manager_providerstream
+    BEGIN
+        UPDATE provider_manager_provider
+        SET active_stream_count = active_stream_count + (NEW.is_active != 0),
+            inactive_stream_count = inactive_stream_count + (NEW.is_active = 0)
+        WHERE id = NEW.provider_id;
+    END;
+    """,
+    """
+    CREATE TRIGGER provider_stream_count_delete AFTER DELETE ON provider_manager_providerstream
+    BEGIN
+        UPDATE provider_manager_provider
+        SET active_stream_count = active_stream_count - (OLD.is_active != 0),
+            inactive_stream_count = inactive_stream_count - (OLD.is_active = 0)
+        WHERE id = OLD.provider_id;
+    END;
+    """,
+    """
+    CREATE TRIGGER provider_stream_count_update AFTER UPDATE OF is_active, provider_id ON provider_manager_providerstream
+    WHEN OLD.is_active IS NOT NEW.is_active OR OLD.provider_id IS NOT NEW.provider_id
+    BEGIN
+        UPDATE provider_manager_provider
+        SET active_stream_count = active_stream_count - (OLD.is_active != 0),
+            inactive_stream_count = inactive_stream_count - (OLD.is_active = 0)
+        WHERE id = OLD.provider_id;
+        UPDATE provider_manager_provider
+        SET active_stream_count = active_stream_count + (NEW.is_active != 0),
+            inactive_stream_count = inactive_stream_count + (NEW.is_active = 0)
+        WHERE id = NEW.provider_id;
+    END;
+    """,
+]
+
+DROP_TRIGGERS_SQL = [
+    "DROP TRIGGER IF EXISTS provider_stream_count_insert;",
+    "DROP TRIGGER IF EXISTS provider_stream_count_delete;",
+    "DROP TRIGGER IF EXISTS provider_stream_count_update;",
+]
+
+
+def deduplicate_streams(apps, schema_editor):
+    """
+    Normalize missing stream groups to an empty string and merge streams sharing the same (provider, title, group)
+    natural key into the oldest one, re-pointing the playlist channels that used the duplicates.
+    """
+    ProviderStream = apps.get_model('provider_manager', 'ProviderStream')
+    PlaylistChannel = apps.get_model('playlist_manager', 'PlaylistChannel')
+
+    ProviderStream.objects.filter(group__isnull=True).update(group='')
+
+    duplicates = (ProviderStream.objects
+                  .values('provider_id', 'title', 'group')
+                  .annotate(count=Count('id'), keep_id=Min('id'))
+                  .filter(count__gt=1))
+
+    affected_playlist_ids = set()
+    for duplicate in duplicates:
+        keep_id = duplicate['keep_id']
+        duplicate_ids = list(ProviderStream.objects
+                             .filter(provider_id=duplicate['provider_id'], title=duplicate['title'], group=duplicate['group'])
+                             .exclude(id=keep_id)
+                             .values_list('id', flat=True))
+
+        for channel in PlaylistChannel.objects.filter(provider_stream_id__in=duplicate_ids):
+            if PlaylistChannel.objects.filter(playlist_id=channel.playlist_id, provider_stream_id=keep_id).exists():
+                affected_playlist_ids.add(channel.playlist_id)
+                channel.delete()
+            else:
+                channel.provider_stream_id = keep_id
+                channel.save(update_fields=['provider_stream'])
+
+        ProviderStream.objects.filter(id__in=duplicate_ids).delete()
+
+    # Close the gaps left in the channel order of the playlists that lost channels
+    for playlist_id in affected_playlist_ids:
+        channels = PlaylistChannel.objects.filter(playlist_id=playlist_id)
+        channels.update(order=-F('order'))
+        for order, channel in enumerate(channels.order_by('-order'), start=1):
+            channel.order = order
+            channel.save(update_fields=['order'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provider_manager', '0002_provider_stream_counts'),
+        ('playlist_manager', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_streams, reverse_code=migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='providerstream',
+            constraint=models.UniqueConstraint(fields=('provider', 'title', 'group'), name='unique_provider_stream_title_group'),
+        ),
+        # Adding the constraint rebuilds the table, which drops its triggers
+        migrations.RunSQL(CREATE_TRIGGERS_SQL, reverse_sql=DROP_TRIGGERS_SQL),
+    ]
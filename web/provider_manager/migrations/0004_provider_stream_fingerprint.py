@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provider_manager', '0003_provider_stream_natural_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='providerstream',
+            name='fingerprint',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
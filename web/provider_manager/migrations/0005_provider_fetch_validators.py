@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provider_manager', '0004_provider_stream_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='provider',
+            name='content_digest',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='etag',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='provider',
+            name='last_modified',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+    ]
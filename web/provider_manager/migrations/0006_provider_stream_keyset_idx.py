@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provider_manager', '0005_provider_fetch_validators'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='providerstream',
+            index=models.Index(fields=['group', 'title'], name='stream_group_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='providerstream',
+            index=models.Index(fields=['provider', 'group', 'title'], name='stream_provider_group_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Full-text index of the streams and the triggers keeping it in step, as of this migration
+CREATE_STREAM_SEARCH_TABLE = [
+    """
+    CREATE VIRTUAL TABLE provider_manager_providerstream_fts USING fts5(
+        title, "group", tvg_id,
+        content='provider_manager_providerstream', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    );
+    """,
+    "INSERT INTO provider_manager_providerstream_fts(provider_manager_providerstream_fts) VALUES ('rebuild');",
+]
+
+DROP_STREAM_SEARCH_TABLE = [
+    "DROP TABLE IF EXISTS provider_manager_providerstream_fts;",
+]
+
+CREATE_STREAM_SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER provider_stream_search_insert AFTER INSERT ON provider_manager_providerstream
+    BEGIN
+        INSERT INTO provider_manager_providerstream_fts(rowid, title, "group", tvg_id)
+        VALUES (NEW.id, NEW.title, NEW."group", NEW.tvg_id);
+    END;
+    """,
+    """
+    CREATE TRIGGER provider_stream_search_delete AFTER DELETE ON provider_manager_providerstream
+    BEGIN
+        INSERT INTO provider_manager_providerstream_fts(provider_manager_providerstream_fts, rowid, title, "group", tvg_id)
+        VALUES ('delete', OLD.id, OLD.title, OLD."group", OLD.tvg_id);
+    END;
+    """,
+    """
+    CREATE TRIGGER provider_stream_search_update AFTER UPDATE OF title, "group", tvg_id ON provider_manager_providerstream
+    WHEN OLD.title IS NOT NEW.title OR OLD."group" IS NOT NEW."group" OR OLD.tvg_id IS NOT NEW.tvg_id
+    BEGIN
+        INSERT INTO provider_manager_providerstream_fts(provider_manager_providerstream_fts, rowid, title, "group", tvg_id)
+        VALUES ('delete', OLD.id, OLD.title, OLD."group", OLD.tvg_id);
+        INSERT INTO provider_manager_providerstream_fts(rowid, title, "group", tvg_id)
+        VALUES (NEW.id, NEW.title, NEW."group", NEW.tvg_id);
+    END;
+    """,
+]
+
+DROP_STREAM_SEARCH_TRIGGERS = [
+    "DROP TRIGGER IF EXISTS provider_stream_search_insert;",
+    "DROP TRIGGER IF EXISTS provider_stream_search_delete;",
+    "DROP TRIGGER IF EXISTS provider_stream_search_update;",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('provider_manager', '0006_provider_stream_keyset_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProviderStreamSearch',
+            fields=[
+                ('stream', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search', serialize=False, to='provider_manager.providerstream')),
+                ('title', models.TextField()),
+                ('group', models.TextField(null=True)),
+                ('tvg_id', models.TextField(null=True)),
+                ('query', models.TextField(db_column='provider_manager_providerstream_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'provider_manager_providerstream_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(CREATE_STREAM_SEARCH_TABLE, reverse_sql=DROP_STREAM_SEARCH_TABLE),
+        migrations.RunSQL(CREATE_STREAM_SEARCH_TRIGGERS, reverse_sql=DROP_STREAM_SEARCH_TRIGGERS),
+    ]
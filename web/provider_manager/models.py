@@ -1,9 +1,33 @@
 from django.db import models
+from django.db.models import OuterRef, Subquery
 from django.core.validators import URLValidator
-from job_manager.models import JobState
+from job_manager.models import Job, JobState, JobType
+from main.search import prefix_query, ranked, search_tokens, substring_search
+from .sql import STREAM_SEARCH_TABLE
+import hashlib
 import uuid
 
 
+class ProviderQuerySet(models.QuerySet):
+    """
+    QuerySet for providers.
+    """
+
+    def with_sync_summary(self):
+        """
+        Annotate each provider with the date of its last successful sync and the ID of its active sync job,
+        so that listing providers costs a single query regardless of how many providers there are.
+        """
+        sync_jobs = Job.objects.filter(provider=OuterRef('pk'), type=JobType.PROVIDER_SYNC)
+        last_synced = sync_jobs.filter(state=JobState.COMPLETED).order_by('-updated_at').values('updated_at')[:1]
+        active_job_id = sync_jobs.filter(state__in=[JobState.QUEUED, JobState.IN_PROGRESS]).order_by('created_at').values('job_id')[:1]
+
+        return self.annotate(
+            last_synced=Subquery(last_synced),
+            active_job_id=Subquery(active_job_id)
+        )
+
+
 class Provider(models.Model):
     """
     Model representing a provider.
@@ -11,13 +35,56 @@ class Provider(models.Model):
     name = models.CharField(max_length=255)
     url = models.TextField(validators=[URLValidator()])
     is_enabled = models.BooleanField(default=False)
+    # Stream counts are maintained by database triggers on ProviderStream (see migration 0002), so they stay
+    # accurate for bulk writes done outside Django as well.
+    active_stream_count = models.IntegerField(default=0, editable=False)
+    inactive_stream_count = models.IntegerField(default=0, editable=False)
+    # Validators and digest of the playlist retrieved by the last successful sync, used to skip unchanged playlists
+    etag = models.CharField(max_length=255, null=True, blank=True, editable=False)
+    last_modified = models.CharField(max_length=64, null=True, blank=True, editable=False)
+    content_digest = models.CharField(max_length=64, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProviderQuerySet.as_manager()
+
+    STREAM_COUNT_FIELDS = ('active_stream_count', 'inactive_stream_count')
+
+    @property
+    def stream_count(self):
+        return self.active_stream_count + self.inactive_stream_count
+
+    def save(self, *args, **kwargs):
+        # Never write back (possibly stale) stream counts when updating, the database triggers own them
+        if self.pk and not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.STREAM_COUNT_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
 
+class ProviderStreamQuerySet(models.QuerySet):
+    """
+    QuerySet for provider streams.
+    """
+
+    def search(self, text):
+        """
+        Filter the streams whose title, group or tvg_id contain words starting with the words of the text,
+        using the full-text index.
+
+        The streams are annotated with `search_rank`, the BM25 relevance of the match (lower is more relevant).
+        """
+        tokens = search_tokens(text)
+        if not tokens:
+            return substring_search(self, text, ['title', 'tvg_id', 'group'])
+        return ranked(self.filter(search__query=prefix_query(tokens)))
+
+
 class ProviderStream(models.Model):
     """
     Model representing a stream within a provider.
@@ -33,15 +100,62 @@ class ProviderStream(models.Model):
     logo_url = models.TextField(validators=[URLValidator()], null=True, blank=True)
     group = models.CharField(max_length=255, null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    # Hash of (tvg_id, media_url, logo_url, group), used by provider syncs to skip unchanged streams
+    fingerprint = models.BigIntegerField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProviderStreamQuerySet.as_manager()
+
     class Meta:
         indexes = [
             models.Index(fields=['provider', 'is_active'], name='stream_provider_active_idx'),
             models.Index(fields=['group', 'title', 'tvg_id'], name='stream_group_title_tvg_id_idx'),
-            models.Index(fields=['is_active'], name='provider_stream_active_idx')
+            models.Index(fields=['is_active'], name='provider_stream_active_idx'),
+            # Keyset pagination of streams, overall and per provider
+            models.Index(fields=['group', 'title'], name='stream_group_title_idx'),
+            models.Index(fields=['provider', 'group', 'title'], name='stream_provider_group_idx')
+        ]
+        constraints = [
+            # Natural key used to match streams during a provider sync
+            models.UniqueConstraint(fields=['provider', 'title', 'group'], name='unique_provider_stream_title_group')
         ]
 
+    @staticmethod
+    def compute_fingerprint(tvg_id, media_url, logo_url, group):
+        """
+        Compute the 64-bit fingerprint of the synchronized content of a stream.
+        """
+        content = '\x1f'.join([tvg_id or '', media_url or '', logo_url or '', group or ''])
+        digest = hashlib.blake2b(content.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big', signed=True)
+
     def __str__(self):
         return self.title
+
+
+class ProviderStreamSearch(models.Model):
+    """
+    Full-text index of provider streams.
+
+    This is a SQLite FTS5 table kept in step with ProviderStream by triggers (see migration 0007), query it through
+    ProviderStream.objects.search().
+    """
+    stream = models.OneToOneField(
+        ProviderStream,
+        on_delete=models.DO_NOTHING,
+        related_name='search',
+        primary_key=True,
+        db_column='rowid',
+        db_constraint=False
+    )
+    title = models.TextField()
+    group = models.TextField(null=True)
+    tvg_id = models.TextField(null=True)
+    # Hidden FTS5 columns: comparing the table column to a query runs a full-text match, rank is its relevance
+    query = models.TextField(db_column=STREAM_SEARCH_TABLE)
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = STREAM_SEARCH_TABLE
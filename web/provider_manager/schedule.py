@@ -0,0 +1,192 @@
+"""
+Scheduled provider syncs.
+
+The sync schedules of the settings (days of the week and a UTC time) are turned into PROVIDER_SYNC jobs by the job
+runner. Upcoming events are kept in a heap ordered by date, so the runner sleeps until the next event rather than
+checking the schedules every minute. When a schedule fires, the enabled providers are queued one after the other,
+STAGGER seconds apart, so that their downloads do not all start at once.
+
+The date of the last run is kept in the config store. Runs missed while no runner was running (e.g. during a
+downtime of several days) are coalesced into a single run at startup.
+"""
+import datetime
+import heapq
+import itertools
+import logging
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from main.utils import ConfigStore
+from .jobs import enqueue_provider_sync
+from .models import Provider
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DEFAULT_SYNC_JOB_MAX_ATTEMPTS = 3
+
+# Date of the last scheduled run
+SCHEDULE_CONFIG_KEY = "provider_manager:schedule"
+
+
+class SyncSchedule(NamedTuple):
+    """
+    A sync schedule of the settings.
+    """
+    # Days of the week, Monday being 0
+    weekdays: frozenset
+    # UTC time
+    time: datetime.time
+
+
+def parse_schedules(settings_data):
+    """
+    Get the sync schedules of the settings.
+
+    Returns:
+        tuple: The SyncSchedule of each valid schedule, none when syncs are not enabled.
+    """
+    if not settings_data.get('sync_enabled'):
+        return ()
+
+    schedules = []
+    for schedule in settings_data.get('sync_schedules') or []:
+        weekdays = frozenset(WEEKDAYS.index(day) for day in schedule.get('daysOfWeek') or [] if day in WEEKDAYS)
+        try:
+            time = datetime.time.fromisoformat(schedule.get('time') or '')
+        except ValueError:
+            logger.warning(f"Ignoring sync schedule with invalid time {schedule.get('time')!r}")
+            continue
+        if weekdays:
+            schedules.append(SyncSchedule(weekdays, time.replace(tzinfo=None)))
+    return tuple(sorted(schedules, key=lambda schedule: (schedule.time, sorted(schedule.weekdays))))
+
+
+def next_fire_time(schedules, after) -> Optional[datetime.datetime]:
+    """
+    Get the first date any of the schedules fires at, after a date.
+
+    Args:
+        schedules (iterable): SyncSchedule list.
+        after (datetime): The aware date.
+
+    Returns:
+        datetime: The UTC date, None when there are no schedules.
+    """
+    after = after.astimezone(datetime.timezone.utc)
+    fire_times = []
+    for schedule in schedules:
+        # The first matching day is at most a week away, and may be the same weekday a week later
+        for offset in range(8):
+            day = after.date() + datetime.timedelta(days=offset)
+            fire_time = datetime.datetime.combine(day, schedule.time, tzinfo=datetime.timezone.utc)
+            if day.weekday() in schedule.weekdays and fire_time > after:
+                fire_times.append(fire_time)
+                break
+    return min(fire_times, default=None)
+
+
+class SyncScheduler:
+    """
+    Queues the PROVIDER_SYNC jobs of the sync schedules, once ticked by the job runner.
+    """
+
+    def __init__(self, stagger=None):
+        """
+        Args:
+            stagger (int, optional): Seconds between the jobs of two providers queued by a run.
+        """
+        self.stagger = datetime.timedelta(
+            seconds=stagger if stagger is not None else settings.PROVIDER_SYNC_STAGGER
+        )
+        self.config_store = ConfigStore()
+        self._schedules = None
+        # The schedule settings the schedules were parsed from
+        self._schedule_settings = None
+        self._max_attempts = DEFAULT_SYNC_JOB_MAX_ATTEMPTS
+        # (date, sequence, provider ID) events: a run of the schedules when the provider ID is None, else the
+        # staggered sync of a provider
+        self._events = []
+        self._sequence = itertools.count()
+
+    def tick(self, now=None):
+        """
+        Reload the schedules if the settings changed, and process the events that are due.
+
+        Returns:
+            float: Seconds until the next event, None when there is none.
+        """
+        now = now or timezone.now()
+        self._load_settings(now)
+
+        while self._events and self._events[0][0] <= now:
+            fire_time, _, provider_id = heapq.heappop(self._events)
+            try:
+                if provider_id is None:
+                    self._run(fire_time, now)
+                else:
+                    self._enqueue(provider_id)
+            except Exception:
+                logger.exception(f"Error processing the sync schedule event of {fire_time}")
+
+        return (self._events[0][0] - now).total_seconds() if self._events else None
+
+    def _load_settings(self, now):
+        settings_data = self.config_store.get("iptv:settings")
+        if settings_data is None and self._schedules is not None:
+            # Unreadable (e.g. being written), kept as is until the next tick
+            return
+        settings_data = settings_data or {}
+        self._max_attempts = settings_data.get('sync_job_max_attempts', DEFAULT_SYNC_JOB_MAX_ATTEMPTS)
+        schedule_settings = (settings_data.get('sync_enabled'), settings_data.get('sync_schedules'))
+        if schedule_settings == self._schedule_settings:
+            return
+        self._schedule_settings = schedule_settings
+        schedules = parse_schedules(settings_data)
+        if schedules == self._schedules:
+            return
+
+        if self._schedules is None:
+            # At startup, runs missed since the last run fire once right away
+            last_run = self.config_store.get(SCHEDULE_CONFIG_KEY, {}).get('last_run')
+            after = datetime.datetime.fromisoformat(last_run) if last_run else now
+        else:
+            # Changed schedules only fire from now on
+            after = now
+            logger.info("Sync schedules changed")
+        self._schedules = schedules
+
+        # Syncs of a run still to be queued are kept, unless the schedules were all removed
+        self._events = [event for event in self._events if event[2] is not None and schedules]
+        heapq.heapify(self._events)
+        self._push_run(after)
+
+    def _push_run(self, after):
+        fire_time = next_fire_time(self._schedules, after)
+        if fire_time is not None:
+            heapq.heappush(self._events, (fire_time, next(self._sequence), None))
+            logger.info(f"Next scheduled provider sync at {fire_time.isoformat()}")
+
+    def _run(self, fire_time, now):
+        if fire_time < now - datetime.timedelta(minutes=1):
+            logger.info(f"Running the provider syncs missed since {fire_time.isoformat()}")
+        self.config_store.set(SCHEDULE_CONFIG_KEY, {'last_run': now.isoformat()})
+
+        provider_ids = Provider.objects.filter(is_enabled=True).order_by('id').values_list('id', flat=True)
+        for index, provider_id in enumerate(provider_ids):
+            heapq.heappush(self._events, (now + index * self.stagger, next(self._sequence), provider_id))
+        # The next run is after now, even when runs were missed
+        self._push_run(now)
+
+    def _enqueue(self, provider_id):
+        provider = Provider.objects.filter(pk=provider_id, is_enabled=True).first()
+        if provider is None:
+            return
+        # Skipped when a sync of the provider is already queued or running
+        job, created = enqueue_provider_sync(provider, max_attempts=self._max_attempts)
+        if created:
+            logger.info(f"Queued scheduled sync of provider {provider_id} (job {job.job_id})")
+        else:
+            logger.info(f"Skipped scheduled sync of provider {provider_id}: job {job.job_id} is already {job.state}")
@@ -6,26 +6,28 @@ from job_manager.models import JobState, JobType
 class ProviderSerializer(serializers.ModelSerializer):
     """
     Serializer for Provider model.
+
+    Providers fetched through `Provider.objects.with_sync_summary()` carry `last_synced` and `active_job_id`
+    annotations, which are used as-is. Otherwise, these values are looked up per provider.
     """
-    stream_count = serializers.SerializerMethodField()
+    stream_count = serializers.IntegerField(read_only=True)
     last_synced = serializers.SerializerMethodField()
     active_job_id = serializers.SerializerMethodField()
 
     class Meta:
         model = Provider
-        fields = ['id', 'name', 'url', 'is_enabled', 'created_at', 'updated_at', 'stream_count', 'last_synced', 'active_job_id']
-        read_only_fields = ['id', 'created_at', 'updated_at', 'stream_count', 'last_synced', 'active_job_id']
-
-    def get_stream_count(self, obj):
-        """
-        Get the number of streams associated with this Provider.
-        """
-        return obj.streams.count()
+        fields = ['id', 'name', 'url', 'is_enabled', 'created_at', 'updated_at', 'stream_count',
+                  'active_stream_count', 'inactive_stream_count', 'last_synced', 'active_job_id']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'stream_count', 'active_stream_count',
+                            'inactive_stream_count', 'last_synced', 'active_job_id']
 
     def get_last_synced(self, obj):
         """
         Get the date of the last successful job.
         """
+        if hasattr(obj, 'last_synced'):
+            return obj.last_synced
+
         last_job = obj.jobs.filter(type=JobType.PROVIDER_SYNC, state=JobState.COMPLETED).order_by('-updated_at').first()
         if last_job:
             return last_job.updated_at
@@ -35,9 +37,12 @@ class ProviderSerializer(serializers.ModelSerializer):
         """
         Get whether an active sync job is in progress.
         """
-        active_jobs = obj.jobs.filter(type=JobType.PROVIDER_SYNC, state__in=[JobState.QUEUED, JobState.IN_PROGRESS])
-        if active_jobs.exists():
-            return active_jobs.first().job_id
+        if hasattr(obj, 'active_job_id'):
+            return obj.active_job_id
+
+        active_job = obj.jobs.filter(type=JobType.PROVIDER_SYNC, state__in=[JobState.QUEUED, JobState.IN_PROGRESS]).order_by('created_at').first()
+        if active_job:
+            return active_job.job_id
         return None
 
 
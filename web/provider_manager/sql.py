@@ -0,0 +1,15 @@
+"""
+Names of the raw SQL objects maintained on the provider tables.
+
+The objects themselves (stream counter triggers, full-text index and its triggers) are created by the migrations
+that own them (0002_provider_stream_counts, 0003_provider_stream_natural_key and 0007_provider_stream_search), which
+keep their own frozen copy of the SQL they run. Changing these objects takes a new migration, this module only holds
+what the live code needs to query them.
+
+SQLite drops the triggers of a table whenever Django has to rebuild it in a migration (e.g. when adding a
+constraint), so migrations doing so must re-create them, as 0003_provider_stream_natural_key does.
+"""
+
+# Full-text index over stream title/group/tvg_id: an external content FTS5 table (the text is read back from
+# provider_manager_providerstream) kept in step by triggers
+STREAM_SEARCH_TABLE = 'provider_manager_providerstream_fts'
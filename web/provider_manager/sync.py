@@ -0,0 +1,497 @@
+import asyncio
+import hashlib
+import logging
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import BinaryIO, NamedTuple, Optional
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from job_manager.lifecycle import claim_job, complete_job, fail_job_attempt
+from . import m3u
+from .models import Provider, ProviderStream
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT = 60
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+DEFAULT_BATCH_SIZE = 1000
+# Parsed batches of a playlist waiting for the writer thread, see BatchQueue
+PARSED_BATCHES_MAX = 4
+
+# Natural key of a provider stream, backed by the unique_provider_stream_title_group constraint
+NATURAL_KEY_FIELDS = ['provider', 'title', 'group']
+UPSERT_FIELDS = ['tvg_id', 'media_url', 'logo_url', 'is_active', 'fingerprint', 'updated_at']
+
+# Per-connection scratch table holding the natural keys seen during a sync
+SEEN_TABLE = 'provider_sync_seen'
+
+
+class FetchedPlaylist(NamedTuple):
+    """
+    Result of a conditional playlist download.
+    """
+    file: Optional[BinaryIO]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    digest: Optional[str]
+
+    @property
+    def not_modified(self):
+        return self.file is None
+
+
+def fetch_playlist(url, etag=None, last_modified=None) -> FetchedPlaylist:
+    """
+    Download a playlist with a conditional request, spooling the body to a temporary file while hashing it.
+
+    Returns:
+        FetchedPlaylist: The downloaded playlist, without a file when the server answered 304 Not Modified.
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    with requests.get(url, headers=headers, stream=True, timeout=REQUEST_TIMEOUT) as response:
+        if response.status_code == 304:
+            return FetchedPlaylist(None, etag, last_modified, None)
+        response.raise_for_status()
+
+        file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        digest = hashlib.sha256()
+        try:
+            for chunk in response.iter_content(chunk_size=m3u.CHUNK_SIZE):
+                digest.update(chunk)
+                file.write(chunk)
+        except BaseException:
+            file.close()
+            raise
+        file.seek(0)
+
+        return FetchedPlaylist(
+            file,
+            response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+            digest.hexdigest()
+        )
+
+
+@contextmanager
+def open_source(source):
+    """
+    Open an M3U source as an iterable of byte chunks.
+
+    Args:
+        source: An http(s) URL, a local file path or a binary file object.
+    """
+    if hasattr(source, 'read'):
+        yield m3u.iter_file_chunks(source)
+    elif source.startswith(('http://', 'https://')):
+        with requests.get(source, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            yield response.iter_content(chunk_size=m3u.CHUNK_SIZE)
+    else:
+        with open(source, 'rb') as file:
+            yield m3u.iter_file_chunks(file)
+
+
+def iter_batches(entries, batch_size):
+    """
+    Group parsed M3U entries into batches by natural key. Only the first entry of a natural key is kept within a
+    batch, later batches are checked against the keys already written by the sync.
+
+    Yields:
+        dict: The entries of a batch, by (title, group).
+    """
+    batch = {}
+    for entry in entries:
+        # Only the first stream of a natural key is kept (as by the C# worker)
+        batch.setdefault((entry.title, entry.group), entry)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = {}
+    if batch:
+        yield batch
+
+
+class BatchQueue:
+    """
+    Bounded queue handing over the batches of a playlist parsed on a worker thread to the writer thread.
+
+    The parsing thread blocks once PARSED_BATCHES_MAX batches are waiting, so memory use does not depend on the size
+    of the playlist, and stops as soon as the queue is cancelled (e.g. when writing failed).
+    """
+    _DONE = object()
+
+    def __init__(self, maxsize=PARSED_BATCHES_MAX):
+        self._queue = queue.Queue(maxsize)
+        self._cancelled = threading.Event()
+        # Time spent parsing, without the time spent waiting for the writer
+        self.parse_elapsed = 0.0
+
+    def produce(self, batches):
+        """
+        Parse the batches and put them in the queue, ending with the end marker or the parsing error. Run on the
+        parsing thread.
+        """
+        batches = iter(batches)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(batches, self._DONE)
+            except Exception as e:
+                batch = e
+            self.parse_elapsed += time.perf_counter() - start
+            if not self._put(batch) or batch is self._DONE or isinstance(batch, Exception):
+                return
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _put(self, item):
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        """
+        Get the batches, raising the parsing error if any. Run on the writer thread.
+        """
+        while True:
+            try:
+                item = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._cancelled.is_set():
+                    raise RuntimeError("Parsing of the playlist was cancelled")
+                continue
+            if item is self._DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class SyncStats:
+    """
+    Counts of the stream changes applied by a provider sync.
+    """
+
+    def __init__(self):
+        self.added = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.removed = 0
+
+    def __str__(self):
+        return f"added: {self.added}; changed: {self.changed}; unchanged: {self.unchanged}; removed: {self.removed}"
+
+
+class ProviderSynchronizer:
+    """
+    Synchronizes the streams of a provider with its M3U playlist.
+
+    The playlist is parsed incrementally and upserted in fixed-size batches on the (provider, title, group)
+    natural key, so memory usage does not grow with the size of the playlist. Streams whose fingerprint did not
+    change are not written at all.
+    """
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+
+    def parse(self, chunks):
+        """
+        Parse a playlist into batches of entries by natural key. Does not access the database.
+        """
+        return iter_batches(m3u.parse(chunks), self.batch_size)
+
+    def run(self, provider: Provider, allow_stream_auto_deletion=True, source=None, force=False):
+        """
+        Synchronize the streams of a provider.
+
+        When syncing from the provider URL, the playlist is requested conditionally and the sync finishes early
+        when the server answers 304 Not Modified, or when the content digest matches the last successful sync.
+
+        Args:
+            provider: The provider to synchronize.
+            allow_stream_auto_deletion: Whether streams missing from the playlist are deleted (True) or
+                deactivated (False).
+            source: Optional. Overrides the provider URL (URL, file path or binary file object).
+            force: Optional. Whether to sync even if the playlist did not change since the last sync.
+
+        Returns:
+            tuple: Whether the sync succeeded, and a status description.
+        """
+        if not provider.is_enabled and source is None:
+            logger.warning(f"Provider with ID {provider.id} is not enabled")
+            return False, "Service provider is not enabled"
+
+        if source is not None:
+            with open_source(source) as chunks:
+                stats = self._sync(provider, self.parse(chunks), allow_stream_auto_deletion)
+            logger.info(f"Streams synced for provider {provider.id} ({stats})")
+            return True, f"Synced streams ({stats})"
+
+        fetched = self.fetch(provider, force)
+        return self.apply(provider, fetched, allow_stream_auto_deletion, force)
+
+    def fetch(self, provider: Provider, force=False) -> FetchedPlaylist:
+        """
+        Download the playlist of a provider, conditionally unless forced. Does not access the database.
+        """
+        return fetch_playlist(
+            provider.url,
+            etag=None if force else provider.etag,
+            last_modified=None if force else provider.last_modified
+        )
+
+    def apply(self, provider: Provider, fetched: FetchedPlaylist, allow_stream_auto_deletion=True, force=False,
+              batches=None):
+        """
+        Parse a downloaded playlist and write its streams, unless it did not change since the last sync.
+
+        Args:
+            batches: Optional. The batches of the playlist parsed by the caller, see parse.
+
+        Returns:
+            tuple: Whether the sync succeeded, and a status description.
+        """
+        if fetched.not_modified:
+            logger.info(f"Playlist of provider {provider.id} not modified since last sync")
+            return True, "Playlist unchanged since last sync (not modified)"
+
+        with fetched.file:
+            if not force and fetched.digest == provider.content_digest:
+                self._save_fetch_state(provider, fetched)
+                logger.info(f"Playlist of provider {provider.id} has the same content as the last sync")
+                return True, "Playlist unchanged since last sync (same content)"
+
+            if batches is None:
+                batches = self.parse(m3u.iter_file_chunks(fetched.file))
+            stats = self._sync(provider, batches, allow_stream_auto_deletion)
+
+        self._save_fetch_state(provider, fetched)
+        logger.info(f"Streams synced for provider {provider.id} ({stats})")
+
+        return True, f"Synced streams ({stats})"
+
+    @staticmethod
+    def _save_fetch_state(provider, fetched):
+        provider.etag = fetched.etag
+        provider.last_modified = fetched.last_modified
+        provider.content_digest = fetched.digest
+        Provider.objects.filter(pk=provider.pk).update(
+            etag=fetched.etag,
+            last_modified=fetched.last_modified,
+            content_digest=fetched.digest
+        )
+
+    def is_unchanged(self, provider: Provider, fetched: FetchedPlaylist, force=False):
+        """
+        Whether a downloaded playlist did not change since the last sync, and does not need to be parsed.
+        """
+        return fetched.not_modified or (not force and fetched.digest == provider.content_digest)
+
+    @transaction.atomic
+    def _sync(self, provider, batches, allow_stream_auto_deletion):
+        self._reset_seen_keys()
+
+        stats = SyncStats()
+        for batch in batches:
+            self._write_batch(provider, batch, stats)
+
+        stats.removed = self._remove_unseen(provider, allow_stream_auto_deletion)
+        return stats
+
+    def _write_batch(self, provider, batch, stats):
+        # Keys of previous batches, the first stream of a natural key is kept
+        for key in self._seen(batch.keys()):
+            del batch[key]
+
+        # Fetch the fingerprints of the streams of this batch that already exist
+        existing = {
+            (title, group): (fingerprint, is_active)
+            for title, group, fingerprint, is_active in ProviderStream.objects
+            .filter(provider=provider, title__in={title for title, _ in batch})
+            .values_list('title', 'group', 'fingerprint', 'is_active')
+        }
+
+        now = timezone.now()
+        streams = []
+        for key, entry in batch.items():
+            fingerprint = ProviderStream.compute_fingerprint(entry.tvg_id, entry.media_url, entry.logo_url, entry.group)
+            current = existing.get(key)
+            if current is None:
+                stats.added += 1
+            elif current == (fingerprint, True):
+                stats.unchanged += 1
+                continue
+            else:
+                stats.changed += 1
+
+            streams.append(ProviderStream(
+                provider=provider,
+                title=entry.title,
+                tvg_id=entry.tvg_id,
+                media_url=entry.media_url,
+                logo_url=entry.logo_url,
+                group=entry.group,
+                is_active=True,
+                fingerprint=fingerprint,
+                created_at=now,
+                updated_at=now,
+            ))
+
+        if streams:
+            ProviderStream.objects.bulk_create(
+                streams,
+                batch_size=self.batch_size,
+                update_conflicts=True,
+                unique_fields=NATURAL_KEY_FIELDS,
+                update_fields=UPSERT_FIELDS,
+            )
+        self._mark_seen(batch.keys())
+
+    def _reset_seen_keys(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE IF NOT EXISTS {SEEN_TABLE} '
+                f'(title TEXT NOT NULL, "group" TEXT NOT NULL, PRIMARY KEY (title, "group")) WITHOUT ROWID'
+            )
+            cursor.execute(f'DELETE FROM {SEEN_TABLE}')
+
+    def _seen(self, keys):
+        """
+        Get the keys already written by previous batches of the sync.
+        """
+        keys = list(keys)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT title, "group" FROM {SEEN_TABLE} WHERE title IN ({", ".join(["%s"] * len(keys))})',
+                [title for title, _ in keys]
+            )
+            return set(cursor.fetchall()) & set(keys)
+
+    def _mark_seen(self, keys):
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT OR IGNORE INTO {SEEN_TABLE} (title, "group") VALUES (%s, %s)', list(keys))
+
+    def _remove_unseen(self, provider, allow_stream_auto_deletion):
+        table = ProviderStream._meta.db_table
+        unseen = ProviderStream.objects.filter(provider=provider).alias(seen=RawSQL(
+            f'EXISTS (SELECT 1 FROM {SEEN_TABLE} k '
+            f'WHERE k.title = {table}.title AND k."group" = COALESCE({table}."group", \'\'))',
+            [],
+            output_field=BooleanField()
+        )).filter(seen=False)
+
+        if allow_stream_auto_deletion:
+            removed = unseen.count()
+            unseen.delete()
+            return removed
+
+        return unseen.filter(is_active=True).update(is_active=False, updated_at=timezone.now())
+
+
+def close_connection():
+    connection.close()
+
+
+class MultiProviderSynchronizer:
+    """
+    Synchronizes the providers of several PROVIDER_SYNC jobs at once.
+
+    Playlists are downloaded and parsed concurrently on worker threads, bounded by `concurrency`. Parsed batches of
+    streams are handed over to a single writer thread through a bounded queue per provider, and all database access
+    (job state included) goes through that thread, so SQLite never sees concurrent writers.
+    """
+
+    def __init__(self, concurrency=None, batch_size=DEFAULT_BATCH_SIZE, force=False):
+        self.concurrency = concurrency or settings.PROVIDER_SYNC_CONCURRENCY
+        self.synchronizer = ProviderSynchronizer(batch_size=batch_size)
+        self.force = force
+
+    def run(self, job_ids):
+        """
+        Claim and process the given queued jobs. Jobs that are not queued anymore are skipped.
+
+        Returns:
+            list: The processed jobs.
+        """
+        return asyncio.run(self._run(job_ids))
+
+    async def _run(self, job_ids):
+        writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='provider-sync-writer')
+        semaphore = asyncio.Semaphore(self.concurrency)
+        try:
+            jobs = await asyncio.gather(*(self._run_job(job_id, semaphore, writer) for job_id in job_ids))
+        finally:
+            # Database connections are per thread, release the one of the writer thread
+            await asyncio.get_running_loop().run_in_executor(writer, close_connection)
+            writer.shutdown()
+        return [job for job in jobs if job is not None]
+
+    async def _run_job(self, job_id, semaphore, writer):
+        loop = asyncio.get_running_loop()
+
+        job = await loop.run_in_executor(writer, claim_job, job_id)
+        if job is None:
+            return None
+
+        provider = job.provider
+        start = time.perf_counter()
+        try:
+            if not provider.is_enabled:
+                await loop.run_in_executor(writer, complete_job, job, False, "Service provider is not enabled")
+                return job
+
+            allow_stream_auto_deletion = job.allow_stream_auto_deletion is not False
+            async with semaphore:
+                fetched = await asyncio.to_thread(self.synchronizer.fetch, provider, self.force)
+                fetch_elapsed = time.perf_counter() - start
+
+                batches = BatchQueue()
+                try:
+                    write = loop.run_in_executor(
+                        writer,
+                        self.synchronizer.apply,
+                        provider,
+                        fetched,
+                        allow_stream_auto_deletion,
+                        self.force,
+                        batches
+                    )
+                    if self.synchronizer.is_unchanged(provider, fetched, self.force):
+                        success, description = await write
+                    else:
+                        chunks = m3u.iter_file_chunks(fetched.file)
+                        parse = asyncio.to_thread(batches.produce, self.synchronizer.parse(chunks))
+                        _, (success, description) = await asyncio.gather(parse, write)
+                finally:
+                    # Stops the parsing thread when writing failed
+                    batches.cancel()
+            elapsed = time.perf_counter() - start
+
+            # Parsing and writing overlap, the write time runs from the download to the last written batch
+            description = (f"{description} in {elapsed:.1f}s (fetch: {fetch_elapsed:.1f}s; "
+                           f"parse: {batches.parse_elapsed:.1f}s; write: {elapsed - fetch_elapsed:.1f}s)")
+            await loop.run_in_executor(writer, complete_job, job, success, description)
+        except Exception as e:
+            logger.exception(f"Error processing job {job.job_id}")
+            await loop.run_in_executor(writer, fail_job_attempt, job, e)
+
+        return job
@@ -1,3 +1,388 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, TransactionTestCase
+
+from job_manager.models import Job, JobState, JobType
+from . import m3u
+from .m3u import parse as parse_m3u
+from .models import Provider, ProviderStream
+from .schedule import SCHEDULE_CONFIG_KEY, SyncScheduler
+from .sync import FetchedPlaylist, MultiProviderSynchronizer, ProviderSynchronizer
+
+
+def playlist(*entries):
+    """
+    Build an M3U playlist from (title, group, media_url) entries.
+    """
+    lines = ['#EXTM3U']
+    for title, group, media_url in entries:
+        lines.append(f'#EXTINF:-1 tvg-id="{title}.id" group-title="{group}",{title}')
+        lines.append(media_url)
+    return io.BytesIO('\n'.join(lines).encode())
+
+
+class M3UParserTests(TestCase):
+
+    def test_entries_split_across_chunks(self):
+        data = playlist(('One', 'News', 'http://a/1'), ('Two', '', 'http://a/2')).getvalue()
+        chunks = [data[index:index + 7] for index in range(0, len(data), 7)]
+
+        entries = list(m3u.parse(chunks))
+
+        self.assertEqual([(entry.title, entry.group, entry.media_url) for entry in entries],
+                         [('One', 'News', 'http://a/1'), ('Two', '', 'http://a/2')])
+        self.assertEqual(entries[0].tvg_id, 'One.id')
+
+
+class ProviderSynchronizerTests(TestCase):
+
+    def setUp(self):
+        self.provider = Provider.objects.create(name='Provider', url='http://provider/playlist.m3u', is_enabled=True)
+        self.synchronizer = ProviderSynchronizer(batch_size=2)
+
+    def sync(self, source, allow_stream_auto_deletion=True):
+        return self.synchronizer.run(self.provider, allow_stream_auto_deletion, source=source)
+
+    def test_diff_stats(self):
+        success, description = self.sync(playlist(
+            ('One', 'News', 'http://a/1'), ('Two', 'News', 'http://a/2'), ('Three', 'Sport', 'http://a/3')
+        ))
+        self.assertTrue(success)
+        self.assertIn("added: 3; changed: 0; unchanged: 0; removed: 0", description)
+
+        _, description = self.sync(playlist(
+            ('One', 'News', 'http://a/1'), ('Two', 'News', 'http://b/2'), ('Four', 'Sport', 'http://a/4')
+        ))
+        self.assertIn("added: 1; changed: 1; unchanged: 1; removed: 1", description)
+        self.assertEqual(
+            set(ProviderStream.objects.filter(provider=self.provider).values_list('title', 'media_url')),
+            {('One', 'http://a/1'), ('Two', 'http://b/2'), ('Four', 'http://a/4')}
+        )
+
+    def test_first_duplicate_of_a_natural_key_is_kept(self):
+        # Duplicates within a batch, and across batches (of 2 streams)
+        entries = [
+            ('One', 'News', 'http://a/1'), ('One', 'News', 'http://b/1'), ('One', 'Sport', 'http://a/1'),
+            ('Two', 'News', 'http://a/2'), ('One', 'News', 'http://c/1'), ('Two', 'News', 'http://b/2'),
+        ]
+        _, description = self.sync(playlist(*entries))
+
+        self.assertIn("added: 3; changed: 0; unchanged: 0; removed: 0", description)
+        self.assertEqual(
+            set(ProviderStream.objects.filter(provider=self.provider).values_list('title', 'group', 'media_url')),
+            {('One', 'News', 'http://a/1'), ('One', 'Sport', 'http://a/1'), ('Two', 'News', 'http://a/2')}
+        )
+
+        _, description = self.sync(playlist(*entries))
+        self.assertIn("added: 0; changed: 0; unchanged: 3; removed: 0", description)
+
+    def test_missing_streams_are_deactivated(self):
+        self.sync(playlist(('One', 'News', 'http://a/1'), ('Two', 'News', 'http://a/2')))
+
+        _, description = self.sync(playlist(('One', 'News', 'http://a/1')), allow_stream_auto_deletion=False)
+
+        self.assertIn("removed: 1", description)
+        self.assertFalse(ProviderStream.objects.get(title='Two').is_active)
+        self.provider.refresh_from_db()
+        self.assertEqual((self.provider.active_stream_count, self.provider.inactive_stream_count), (1, 1))
+
+        # Reactivated when back in the playlist
+        _, description = self.sync(playlist(('One', 'News', 'http://a/1'), ('Two', 'News', 'http://a/2')))
+        self.assertIn("changed: 1; unchanged: 1", description)
+        self.provider.refresh_from_db()
+        self.assertEqual((self.provider.active_stream_count, self.provider.inactive_stream_count), (2, 0))
+
+
+class PlaylistServer(ThreadingHTTPServer):
+    """
+    Local HTTP server of a provider playlist, answering conditional requests when it sends an ETag.
+    """
+
+    def __init__(self, body, etag=None):
+        super().__init__(('127.0.0.1', 0), PlaylistRequestHandler)
+        self.body = body
+        self.etag = etag
+        self.requests = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/playlist.m3u"
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class PlaylistRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        if self.server.etag and self.headers.get('If-None-Match') == self.server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.server.etag:
+            self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Length', str(len(self.server.body)))
+        self.end_headers()
+        self.wfile.write(self.server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ConditionalFetchTests(TestCase):
+
+    def serve(self, body, etag=None):
+        server = PlaylistServer(body, etag)
+        self.addCleanup(server.close)
+        provider = Provider.objects.create(name='Provider', url=server.url, is_enabled=True)
+        return server, provider
+
+    def test_not_modified(self):
+        server, provider = self.serve(playlist(('One', 'News', 'http://a/1')).getvalue(), etag='"v1"')
+        synchronizer = ProviderSynchronizer()
+
+        _, description = synchronizer.run(provider)
+        self.assertIn("added: 1", description)
+        provider.refresh_from_db()
+        self.assertEqual(provider.etag, '"v1"')
+
+        _, description = synchronizer.run(provider)
+        self.assertEqual(description, "Playlist unchanged since last sync (not modified)")
+        self.assertEqual(server.requests[-1].get('If-None-Match'), '"v1"')
+
+        # Forced syncs do not send the validators
+        _, description = synchronizer.run(provider, force=True)
+        self.assertIn("unchanged: 1", description)
+        self.assertNotIn('If-None-Match', server.requests[-1])
+
+    def test_same_content(self):
+        server, provider = self.serve(playlist(('One', 'News', 'http://a/1')).getvalue())
+        synchronizer = ProviderSynchronizer()
+        synchronizer.run(provider)
+        ProviderStream.objects.update(media_url='http://edited/1')
+
+        _, description = synchronizer.run(provider)
+
+        self.assertEqual(description, "Playlist unchanged since last sync (same content)")
+        self.assertEqual(ProviderStream.objects.get().media_url, 'http://edited/1')
+
+        server.body = playlist(('One', 'News', 'http://b/1')).getvalue()
+        _, description = synchronizer.run(provider)
+        self.assertIn("changed: 1", description)
+
+
+class MultiProviderSynchronizerTests(TransactionTestCase):
+
+    def setUp(self):
+        self.providers = [
+            Provider.objects.create(name=f'Provider {index}', url=f'http://provider/{index}.m3u', is_enabled=True)
+            for index in range(5)
+        ]
+        self.lock = threading.Lock()
+        self.fetching = self.max_fetching = 0
+        self.parsing_threads = set()
+
+    def fetch(self, provider, force=False):
+        with self.lock:
+            self.fetching += 1
+            self.max_fetching = max(self.max_fetching, self.fetching)
+        time.sleep(0.05)
+        with self.lock:
+            self.fetching -= 1
+        body = playlist(*((f'Stream {index}', 'News', f'http://{provider.id}/{index}') for index in range(5)))
+        body = body.getvalue()
+        return FetchedPlaylist(io.BytesIO(body), None, None, hashlib.sha256(body).hexdigest())
+
+    def parse(self, chunks):
+        self.parsing_threads.add(threading.current_thread().name)
+        yield from parse_m3u(chunks)
+
+    def run_jobs(self, concurrency):
+        job_ids = [
+            Job.objects.create(type=JobType.PROVIDER_SYNC, state=JobState.QUEUED, provider=provider).pk
+            for provider in self.providers
+        ]
+        with mock.patch.object(ProviderSynchronizer, 'fetch', side_effect=self.fetch), \
+                mock.patch.object(m3u, 'parse', side_effect=self.parse):
+            MultiProviderSynchronizer(concurrency=concurrency, batch_size=2).run(job_ids)
+        return Job.objects.filter(pk__in=job_ids)
+
+    def test_concurrency_limit(self):
+        jobs = self.run_jobs(concurrency=2)
+
+        self.assertEqual(set(jobs.values_list('state', flat=True)), {JobState.COMPLETED})
+        self.assertEqual(self.max_fetching, 2)
+        for provider in self.providers:
+            self.assertEqual(ProviderStream.objects.filter(provider=provider).count(), 5)
+
+    def test_playlists_are_parsed_off_the_writer_thread(self):
+        self.run_jobs(concurrency=3)
+
+        self.assertTrue(self.parsing_threads)
+        self.assertFalse(any(name.startswith('provider-sync-writer') for name in self.parsing_threads))
+
+    def test_timings_in_job_descriptions(self):
+        jobs = self.run_jobs(concurrency=2)
+
+        for description in jobs.values_list('status_description', flat=True):
+            self.assertRegex(
+                description,
+                r'^Synced streams \(added: 5; .*\) in \d+\.\ds '
+                r'\(fetch: \d+\.\ds; parse: \d+\.\ds; write: \d+\.\ds\)$'
+            )
+
+
+
+class StreamsEndpointTests(TestCase):
+
+    def setUp(self):
+        self.provider = Provider.objects.create(name='Provider', url='http://provider/playlist.m3u')
+        for title, group in [('CNN International', 'News'), ('CNN US', 'News'), ('BBC News', 'News'),
+                             ('Sky Sports', 'Sport'), ('Eurosport', 'Sport'), ('Cartoon Network', 'Kids'),
+                             ('Nickelodeon', 'Kids')]:
+            ProviderStream.objects.create(provider=self.provider, title=title, group=group, media_url='http://a/1')
+        other = Provider.objects.create(name='Other', url='http://other/playlist.m3u')
+        ProviderStream.objects.create(provider=other, title='CNN Other', group='News', media_url='http://b/1')
+
+    def get(self, **params):
+        response = self.client.get(f'/api/providers/{self.provider.id}/streams/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def follow(self, **params):
+        """
+        Get the titles of every page, following the next cursors.
+        """
+        titles = []
+        data = self.get(cursor='', **params)
+        while True:
+            titles.append([item['title'] for item in data['items']])
+            if 'next' not in data['cursors']:
+                return titles
+            self.assertIn(f"cursor={data['cursors']['next']}", data['links']['next'])
+            data = self.get(cursor=data['cursors']['next'], **params)
+
+    def test_cursor_pages(self):
+        self.assertEqual(self.follow(size=3), [
+            ['Cartoon Network', 'Nickelodeon', 'BBC News'], ['CNN International', 'CNN US', 'Eurosport'],
+            ['Sky Sports']
+        ])
+
+        second = self.get(cursor=self.get(cursor='', size=3)['cursors']['next'], size=3, with_total='true')
+        self.assertEqual(second['total'], 7)
+        previous = self.get(cursor=second['cursors']['previous'], size=3)
+        self.assertEqual([item['title'] for item in previous['items']], ['Cartoon Network', 'Nickelodeon', 'BBC News'])
+        self.assertNotIn('previous', previous['cursors'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f'/api/providers/{self.provider.id}/streams/', {'cursor': 'invalid'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_matches_word_prefixes(self):
+        for q, titles in [('cn', {'CNN International', 'CNN US'}), ('cnn u', {'CNN US'}),
+                          ('sport', {'Sky Sports', 'Eurosport'}), ('NEWS', {'CNN International', 'CNN US', 'BBC News'}),
+                          ('net', {'Cartoon Network'}), ('rt', set())]:
+            with self.subTest(q=q):
+                self.assertEqual({item['title'] for item in self.get(q=q, size=10)['items']}, titles)
+
+    def test_search_pages(self):
+        pages = self.follow(q='news', size=2)
+
+        self.assertEqual([len(page) for page in pages], [2, 1])
+        self.assertEqual({title for page in pages for title in page}, {'CNN International', 'CNN US', 'BBC News'})
+        # The most relevant match comes first
+        self.assertEqual(pages[0][0], 'BBC News')
+
+        data = self.get(q='news', page=1, size=2)
+        self.assertEqual(data['total'], 3)
+        self.assertIn('?q=news&page=2&size=2', data['links']['next'])
+
+
+class FakeConfigStore(dict):
+
+    def set(self, key, value):
+        self[key] = value
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc)
+
+
+class SyncSchedulerTests(TestCase):
+    # Monday
+    START = utc(2026, 10, 12, 1, 0)
+
+    def setUp(self):
+        self.providers = [Provider.objects.create(name=f'Provider {index}', url=f'http://provider/{index}.m3u',
+                                                  is_enabled=True) for index in range(3)]
+        Provider.objects.create(name='Disabled', url='http://provider/disabled.m3u', is_enabled=False)
+        self.scheduler = SyncScheduler(stagger=30)
+        self.scheduler.config_store = FakeConfigStore()
+        self.set_schedules([{'daysOfWeek': ['Monday'], 'time': '02:00:00'}])
+
+    def set_schedules(self, schedules, enabled=True):
+        self.scheduler.config_store.set("iptv:settings", {'sync_enabled': enabled, 'sync_schedules': schedules})
+
+    def tick(self, **delta):
+        return self.scheduler.tick(now=self.START + datetime.timedelta(**delta))
+
+    def queued(self):
+        return sorted(Job.objects.filter(type=JobType.PROVIDER_SYNC).values_list('provider_id', flat=True))
+
+    def test_providers_are_queued_staggered(self):
+        self.assertEqual(self.tick(), 3600)
+        self.assertEqual(self.queued(), [])
+
+        self.assertEqual(self.tick(hours=1), 30)
+        self.assertEqual(self.queued(), [self.providers[0].id])
+        self.assertEqual(self.tick(hours=1, seconds=29), 1)
+        self.assertEqual(self.tick(hours=1, seconds=30), 30)
+        self.assertEqual(self.tick(hours=1, seconds=60), 7 * 24 * 3600 - 60)
+        self.assertEqual(self.queued(), [provider.id for provider in self.providers])
+        self.assertEqual(self.scheduler.config_store[SCHEDULE_CONFIG_KEY],
+                         {'last_run': utc(2026, 10, 12, 2).isoformat()})
+
+    def test_missed_runs_are_coalesced(self):
+        self.scheduler.config_store.set(SCHEDULE_CONFIG_KEY, {'last_run': utc(2026, 9, 1).isoformat()})
+
+        # Six runs were missed, run once at startup
+        self.assertEqual(self.tick(), 30)
+        self.assertEqual(self.tick(minutes=1), 3540)
+        self.assertEqual(self.queued(), [provider.id for provider in self.providers])
+        self.assertEqual(self.scheduler.config_store[SCHEDULE_CONFIG_KEY], {'last_run': self.START.isoformat()})
+
+        # The run of the day is not affected, the providers still queued are skipped
+        self.tick(hours=1, minutes=1)
+        self.assertEqual(len(self.queued()), 3)
+
+    def test_changed_schedules_are_rescheduled(self):
+        self.assertEqual(self.tick(), 3600)
+
+        self.set_schedules([{'daysOfWeek': ['Monday'], 'time': '01:30:00'}])
+        self.assertEqual(self.tick(minutes=10), 1200)
+
+        # A time already past today fires next week
+        self.set_schedules([{'daysOfWeek': ['Monday'], 'time': '00:30:00'}])
+        self.assertEqual(self.tick(minutes=20), 7 * 24 * 3600 - 50 * 60)
+        self.assertEqual(self.queued(), [])
+
+    def test_disabled_syncs_clear_the_schedule(self):
+        self.tick()
+        self.tick(hours=1)
+        self.assertEqual(self.queued(), [self.providers[0].id])
+
+        self.set_schedules([{'daysOfWeek': ['Monday'], 'time': '02:00:00'}], enabled=False)
+        self.assertIsNone(self.tick(hours=1, seconds=10))
+        self.assertIsNone(self.tick(hours=2))
+        self.assertEqual(self.queued(), [self.providers[0].id])
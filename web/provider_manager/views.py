@@ -1,16 +1,20 @@
-from django.db.models import F, Q, OuterRef, Subquery, Value, TextField, IntegerField
+from django.db.models import Q, OuterRef, Subquery, IntegerField
 from django.db.models.functions import Lower
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from math import ceil
+from urllib.parse import quote
 
 from .models import Provider, ProviderStream
+from .jobs import enqueue_provider_sync
 from job_manager.models import Job, JobState, JobType
 from job_manager.serializers import JobSerializer
 from guide_manager.models import Guide, Channel
+from guide_manager.matching import guide_matcher
 from guide_manager.serializers import GuideSerializer
+from main.pagination import is_cursor_request, paginate_by_cursor
 from .serializers import (
     ProviderSerializer,
     ProviderCreateSerializer,
@@ -71,6 +75,30 @@ class ProvidersViewSet(viewsets.ViewSet):
             "message": "Sync job queued successfully"
         })
 
+    @action(detail=False, methods=['post'])
+    def sync_all(self, request):
+        """
+        Queue a synchronization of all enabled providers.
+
+        Providers that already have an active sync job are not queued again. The jobs are only queued here and
+        processed later by the job worker. Only the job runner (manage.py runjobs) and the syncproviders command
+        sync several providers at once; the C# worker processes the jobs one at a time.
+
+        Returns:
+            Response: A response containing the job of each enabled provider.
+        """
+        items = []
+        for provider in Provider.objects.filter(is_enabled=True).order_by(Lower('name')):
+            job, created = enqueue_provider_sync(provider, max_attempts=1)  # when running manual sync, allow one failure only
+            items.append({
+                "provider_id": provider.id,
+                "job_id": str(job.job_id),
+                "status": "queued" if created else job.state,
+                "message": "Sync job queued successfully" if created else job.status_description
+            })
+
+        return Response({'items': items})
+
     @action(detail=True, methods=['get'])
     def sync_status(self, request, pk=None):
         """
@@ -147,7 +175,7 @@ class ProvidersViewSet(viewsets.ViewSet):
         """
         Get all providers.
         """
-        providers = Provider.objects.all().order_by('-is_enabled', Lower('name'))
+        providers = Provider.objects.with_sync_summary().order_by('-is_enabled', Lower('name'))
         serializer = ProviderSerializer(providers, many=True)
 
         response_data = {
@@ -160,7 +188,7 @@ class ProvidersViewSet(viewsets.ViewSet):
         """
         Get a specific provider by ID.
         """
-        provider = get_object_or_404(Provider.objects.prefetch_related('jobs'), pk=pk)
+        provider = get_object_or_404(Provider.objects.with_sync_summary(), pk=pk)
         serializer = ProviderSerializer(provider)
         return Response(serializer.data)
 
@@ -184,6 +212,9 @@ class ProvidersViewSet(viewsets.ViewSet):
         provider = get_object_or_404(Provider, pk=pk)
         serializer = ProviderUpdateSerializer(provider, data=request.data, partial=True)
         if serializer.is_valid():
+            if serializer.validated_data.get('url', provider.url) != provider.url:
+                # Validators of the previous playlist do not apply to the new URL
+                provider.etag = provider.last_modified = provider.content_digest = None
             serializer.save()
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -207,6 +238,8 @@ class ProvidersViewSet(viewsets.ViewSet):
         Query Parameters:
             page: The page number (default: 1)
             size: The page size (default: 10)
+            cursor: Opaque cursor for keyset pagination (optional, an empty value returns the first page).
+                When set, the page number is ignored and the total is only counted with with_total=true
 
         Returns:
             Response: A response containing:
@@ -247,6 +280,9 @@ class ProvidersViewSet(viewsets.ViewSet):
             state__in=[JobState.COMPLETED, JobState.FAILED]
         )
 
+        if is_cursor_request(request):
+            return paginate_by_cursor(request, non_active_jobs, ['-updated_at'], size, JobSerializer)
+
         # Get total count of non-active jobs
         total_items = non_active_jobs.count()
 
@@ -282,6 +318,13 @@ class ProvidersViewSet(viewsets.ViewSet):
     def streams(self, request, pk=None):
         """
         Get streams for a specific provider with pagination.
+
+        Query Parameters:
+            page: The page number (default: 1)
+            size: The page size (default: 10)
+            q: Text search in title, group, and tvg_id, matching word prefixes (optional, sorts by relevance)
+            cursor: Opaque cursor for keyset pagination (optional, an empty value returns the first page).
+                When set, the page number is ignored and the total is only counted with with_total=true
         """
         # Validate pagination parameters
         page = int(request.query_params.get('page', 1))
@@ -302,8 +345,18 @@ class ProvidersViewSet(viewsets.ViewSet):
         # Check if provider exists
         provider = get_object_or_404(Provider, pk=pk)
 
-        # Get total count of streams for this provider
         query = ProviderStream.objects.filter(provider=provider)
+        order_by_fields = ['group', 'title']
+
+        q = request.query_params.get('q')
+        if q:
+            query = query.search(q)
+            order_by_fields = ['search_rank'] + order_by_fields
+
+        if is_cursor_request(request):
+            return paginate_by_cursor(request, query, order_by_fields, size, ProviderStreamSerializer)
+
+        # Get total count of streams for this provider
         total_items = query.count()
 
         # Calculate pagination values
@@ -311,10 +364,11 @@ class ProvidersViewSet(viewsets.ViewSet):
         skip = (page - 1) * size
 
         # Get the streams for the current page
-        streams = query.order_by('group', 'title')[skip:skip+size]
+        streams = query.order_by(*order_by_fields)[skip:skip+size]
 
-        # Create response with pagination links
+        # Create response with pagination links, keeping the search query
         base_url = request.build_absolute_uri().split('?')[0]
+        query_prefix = f"?q={quote(q)}&" if q else '?'
 
         response_data = {
             'page': page,
@@ -325,12 +379,12 @@ class ProvidersViewSet(viewsets.ViewSet):
 
         # Add pagination links
         if page > 1:
-            response_data['links']['first'] = f"{base_url}?page=1&size={size}"
-            response_data['links']['previous'] = f"{base_url}?page={page - 1}&size={size}"
+            response_data['links']['first'] = f"{base_url}{query_prefix}page=1&size={size}"
+            response_data['links']['previous'] = f"{base_url}{query_prefix}page={page - 1}&size={size}"
 
         if page < total_pages:
-            response_data['links']['next'] = f"{base_url}?page={page + 1}&size={size}"
-            response_data['links']['last'] = f"{base_url}?page={total_pages}&size={size}"
+            response_data['links']['next'] = f"{base_url}{query_prefix}page={page + 1}&size={size}"
+            response_data['links']['last'] = f"{base_url}{query_prefix}page={total_pages}&size={size}"
 
         return Response(response_data)
 
@@ -347,6 +401,7 @@ class ProviderStreamsViewSet(viewsets.ViewSet):
 
         Query Parameters:
             title: Optional. When provided, replaces the use of Stream.title in the matching rules.
+            lang: Optional. Only suggest guides in this language.
             max_results: Optional. Max number of results returned. Defaults to 5. Must be between 1 and 20.
 
         Returns:
@@ -378,31 +433,10 @@ class ProviderStreamsViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Apply matching rules
-        query = Guide.objects.all().select_related('channel')
-
-        if lang:
-            query = query.filter(lang=lang)
-
-        # Rule 1: Stream.tvg_id matches exactly Guide.xmltv_id
-        xmltv_matches = query.alias(
-            title_val=Value(title, output_field=TextField())
-        ).filter(channel__xmltv_id__iexact=stream.tvg_id) if stream.tvg_id else query.none()
-
-        # Rule 2: Channel.name contains title
-        title_matches = query.alias(
-            title_val=Value(title, output_field=TextField())
-        ).filter(channel__name__icontains=title)
-
-        # Rule 3: title contains Channel.name
-        channel_name_matches = query.alias(
-            title_val=Value(title, output_field=TextField())
-        ).filter(title_val__icontains=F('channel__name'))
-
-        suggestions = xmltv_matches.union(title_matches).union(channel_name_matches)
-
-        # Limit results
-        suggestions = suggestions[:max_results]
+        # Rank the guides through the in-memory matching index
+        matches = guide_matcher.match(title, tvg_id=stream.tvg_id, lang=lang, limit=max_results)
+        guides = Guide.objects.select_related('channel').in_bulk([guide_id for guide_id, _ in matches])
+        suggestions = [guides[guide_id] for guide_id, _ in matches if guide_id in guides]
 
         # Serialize and return
         serializer = GuideSerializer(suggestions, many=True)